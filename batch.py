@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Draws the environment diagram of every program in a set of files,
+directories and glob patterns, saving one image per program.
+
+Each program is run headless (see examine.run) in a process of its own, so
+one can't disturb another through examine's globals, a crash or a program
+that never finishes.  Up to --jobs of them run at once, and any still
+running after --timeout seconds is killed.  A program is run from its own
+directory (which is also put on sys.path, for its imports) with nothing on
+stdin, so input() gets an EOFError instead of waiting, and whatever it prints
+is thrown away.
+
+Diagrams are written under --output, at the same path relative to it as the
+program was relative to the directory all the programs are in, with .svg (or
+.ps) instead of .py.  Once everything's done a summary of the programs which
+failed is printed, and the exit status is 1 if any did.
+
+Usage: python3 batch.py [--output DIR] [--jobs N] [--timeout SECONDS]
+                        [--format {svg,ps}] FILE_DIR_OR_GLOB ...
+"""
+
+import argparse
+import glob
+import io
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from contextlib import redirect_stderr, redirect_stdout
+from multiprocessing.connection import wait
+
+import examine
+from run_tests import find_tests
+
+DEFAULT_TIMEOUT = 30
+
+
+def find_programs(patterns):
+    """Every .py file in the given files, directories and glob patterns, each
+    once, in order.
+    """
+    found = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            found.extend(find_tests(sorted(glob.glob(pattern,
+                                                     recursive=True))))
+        else:
+            found.extend(find_tests([pattern]))
+    return list(dict.fromkeys(os.path.abspath(path) for path in found))
+
+
+def output_paths(programs, output, ext):
+    """Where to save each program's diagram."""
+    if not programs:
+        return []
+    base = os.path.commonpath([os.path.dirname(p) for p in programs])
+    return [os.path.join(output, os.path.splitext(os.path.relpath(p, base))[0]
+                         + ext) for p in programs]
+
+
+def draw(program, image_file, options, conn):
+    """Run in a worker process: draw one program's diagram, sending back
+    None if it worked or the error if it didn't.
+    """
+    try:
+        image_file = os.path.abspath(image_file)
+        directory = os.path.dirname(program)
+        os.chdir(directory)
+        sys.path.insert(0, directory)
+        sys.stdin = open(os.devnull)
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            examine.run(program, wait=False, headless=True,
+                        image_file=image_file, **options)
+        conn.send(None)
+    except BaseException:
+        conn.send(traceback.format_exc())
+    finally:
+        conn.close()
+
+
+def draw_all(programs, images, options=None, jobs=None,
+             timeout=DEFAULT_TIMEOUT):
+    """Draw the diagram of each program into the image file at the same
+    index, at most jobs at a time.  Yields (program, image, error, seconds)
+    for each as it finishes, with error None if it worked.
+    """
+    options = options or {}
+    jobs = jobs or os.cpu_count() or 1
+    pending = deque(zip(programs, images))
+    running = {} # Process sentinel -> (program, image, process, conn, start)
+    while pending or running:
+        while pending and len(running) < jobs:
+            program, image = pending.popleft()
+            os.makedirs(os.path.dirname(image), exist_ok=True)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                    target=draw, args=(program, image, options, sender),
+                    daemon=True)
+            process.start()
+            sender.close()
+            running[process.sentinel] = (program, image, process, receiver,
+                                         time.monotonic())
+        now = time.monotonic()
+        first_deadline = min(start for _, _, _, _, start in
+                             running.values()) + timeout
+        finished = wait(list(running), max(0, first_deadline - now))
+        now = time.monotonic()
+        for sentinel in list(running):
+            program, image, process, receiver, start = running[sentinel]
+            if sentinel in finished:
+                try:
+                    error = receiver.recv()
+                except EOFError: # It exited without saying how it went.
+                    process.join()
+                    error = "died with exit code {0}".format(
+                        process.exitcode)
+                process.join()
+            elif now - start >= timeout:
+                process.kill()
+                process.join()
+                error = "timed out after {0:g}s".format(timeout)
+            else:
+                continue
+            receiver.close()
+            del running[sentinel]
+            yield program, image, error, now - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Draw the environment diagram of every program in "
+            "some files, directories or glob patterns.")
+    parser.add_argument("programs", nargs="+", metavar="FILE_DIR_OR_GLOB")
+    parser.add_argument("--output", default="diagrams", metavar="DIR",
+                        help="directory to save the diagrams in (default: "
+                        "diagrams)")
+    parser.add_argument("--format", choices=("svg", "ps"), default="svg")
+    parser.add_argument("--jobs", type=int, metavar="N",
+                        help="programs to run at once (default: one per CPU)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        metavar="SECONDS", help="kill a program still "
+                        "running after this long (default: {0})".format(
+                            DEFAULT_TIMEOUT))
+    parser.add_argument("--backend", default="ast",
+                        choices=("ast", "monitoring", "settrace"))
+    parser.add_argument("--recursion-budget", type=int, default=8,
+                        metavar="N", help="collapse recursive calls deeper "
+                        "than N frames (0 to never collapse)")
+    parser.add_argument("--prune", action="store_true",
+                        help="leave out returned frames nothing can reach")
+    args = parser.parse_args()
+
+    programs = find_programs(args.programs)
+    images = output_paths(programs, args.output, "." + args.format)
+    options = {"backend": args.backend, "prune": args.prune,
+               "recursion_budget": args.recursion_budget or None}
+    failures = []
+    started = time.monotonic()
+    for program, image, error, seconds in draw_all(
+            programs, images, options, args.jobs, args.timeout):
+        print("{0}: {1} ({2:.1f}s)".format(
+            os.path.relpath(program), "FAILED" if error else image, seconds))
+        if error:
+            failures.append((program, error))
+    print("{0}/{1} diagrams drawn in {2:.1f}s.".format(
+        len(programs) - len(failures), len(programs),
+        time.monotonic() - started))
+    if failures:
+        print("\nFailed:")
+        for program, error in failures:
+            # The last line of a traceback says what went wrong.
+            print("  {0}: {1}".format(os.path.relpath(program),
+                                      error.rstrip("\n").splitlines()[-1]))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""Benchmarks for envdraw.
+
+Each module can be run as a script (or with python3 -m benchmarks.NAME from
+the top of the repository):
+
+    overhead -- How much slower programs run under examine.run, saved as
+    JSON so versions can be compared.
+    backend_overhead -- The ast backend against the tracing backends.
+    instrument_overhead -- Instrumenting large generated modules.
+    import_time -- How long each entry point takes to start, against a
+    budget.
+    lookup_overhead -- Finding the called function as the heap grows.
+    bindings_overhead -- Frame bindings with thousands of globals (needs a
+    display).
+"""
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Compares the cost of the "ast" backend (funccall/funcreturn hooks rewritten
+into every function) against the interpreter tracing backends from tracer.py
+on recursive workloads.
+
+Drawing is left out: the Tracker used here only counts events, so the numbers
+are the cost of detecting calls and returns.
+
+Usage: python3 benchmarks/backend_overhead.py
+"""
+
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from envdraw import envdraw_decorate
+from examine import FunctionRegistry, funccall, funcdef, funcreturn, \
+        funcyield
+from tracer import get_tracer
+
+REPEAT = 5
+
+WORKLOADS = {
+    "factorial(500)": """
+def factorial(n):
+    if n == 0:
+        return 1
+    return n * factorial(n - 1)
+
+factorial(500)
+""",
+    "fib(18)": """
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+fib(18)
+""",
+    "make_adder closures": """
+def make_adder(n):
+    def adder(k):
+        return k + n
+    return adder
+
+total = 0
+for i in range(2000):
+    total = make_adder(i)(total)
+""",
+}
+
+
+class CountingTracker(object):
+    """Stands in for examine.Tracker, counting events instead of drawing."""
+
+    def __init__(self):
+        self.registry = FunctionRegistry()
+        self.sampler = None
+        self.recorded = []
+        self.paused = False
+        self.depth = 0
+        self.events = 0
+
+    def defined_function(self, fn, py_fr, bind=True):
+        self.events += 1
+
+    def enter_function(self, fn, py_fr):
+        self.depth += 1
+        self.events += 1
+
+    def exit_function(self, py_fr):
+        self.depth -= 1
+        self.events += 1
+
+
+def time_backend(source, backend):
+    best, events = None, 0
+    for _ in range(REPEAT):
+        tracker = CountingTracker()
+        funcdef.tracker = funccall.tracker = funcreturn.tracker = \
+                funcyield.tracker = tracker
+        tracer = get_tracer(backend, tracker)
+        tree = envdraw_decorate(ast.parse(source),
+                                trace_calls=tracer is None)
+        code = compile(tree, "<benchmark>", "exec")
+        env = {"funcdef": funcdef, "funccall": funccall,
+               "funcreturn": funcreturn, "funcyield": funcyield}
+        start = time.perf_counter()
+        if tracer is None:
+            exec(code, env)
+        else:
+            with tracer:
+                exec(code, env)
+        elapsed = time.perf_counter() - start
+        assert tracker.depth == 0, backend
+        best = elapsed if best is None else min(best, elapsed)
+        events = tracker.events
+    return best, events
+
+
+def time_plain(source):
+    code = compile(source, "<benchmark>", "exec")
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        exec(code, {})
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    backends = ["ast", "settrace"]
+    if hasattr(sys, "monitoring"):
+        backends.append("monitoring")
+    print("{0:<22} {1:>10} {2:>8} {3:>12} {4:>10}".format(
+        "workload", "backend", "events", "time (ms)", "slowdown"))
+    for name, source in WORKLOADS.items():
+        plain = time_plain(source)
+        print("{0:<22} {1:>10} {2:>8} {3:>12.2f} {4:>10}".format(
+            name, "none", "-", plain * 1e3, "1.0x"))
+        for backend in backends:
+            elapsed, events = time_backend(source, backend)
+            print("{0:<22} {1:>10} {2:>8} {3:>12.2f} {4:>9.1f}x".format(
+                name, backend, events, elapsed * 1e3, elapsed / plain))
+
+
+if __name__ == '__main__':
+    main()
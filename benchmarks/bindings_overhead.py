@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Measures the cost of adding, updating and looking up bindings in a global
+components.Frame holding thousands of variables.  Each operation should cost
+about the same however many globals there are.
+
+Needs a display, since the Frames are drawn on a real Tk canvas.
+
+Usage: python3 benchmarks/bindings_overhead.py
+"""
+
+import os
+import sys
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from components import Frame, Value
+
+SIZES = (500, 1000, 2000, 4000)
+SAMPLES = 200
+NESTING = 10
+
+
+def per_op(fn, names):
+    start = time.perf_counter()
+    for name in names:
+        fn(name)
+    return (time.perf_counter() - start) / len(names)
+
+
+def main():
+    canvas = tk.Canvas(tk.Tk(), width=800, height=600)
+    print("{0:>8} {1:>10} {2:>12} {3:>12} {4:>14}".format(
+        "globals", "add (us)", "update (us)", "lookup (us)",
+        "nested (us)"))
+    for size in SIZES:
+        canvas.delete(tk.ALL)
+        globe = Frame(canvas, 50, 50, globe=True)
+        frame = globe
+        for _ in range(NESTING):
+            frame = Frame(canvas, 300, 50, extended_frame=frame)
+        names = ["var{0}".format(i) for i in range(size)]
+        for name in names[:-SAMPLES]:
+            globe.add_binding(name, Value(canvas, globe, 0))
+        sample = names[-SAMPLES:]
+        add = per_op(lambda name: globe.add_binding(
+            name, Value(canvas, globe, 0)), sample)
+        update = per_op(lambda name: globe.update_binding(
+            name, Value(canvas, globe, 1)), sample)
+        lookup = per_op(globe.lookup, sample)
+        nested = per_op(frame.lookup, sample)
+        print("{0:>8} {1:>10.1f} {2:>12.1f} {3:>12.2f} {4:>14.2f}".format(
+            size, add * 1e6, update * 1e6, lookup * 1e6, nested * 1e6))
+
+
+if __name__ == '__main__':
+    main()
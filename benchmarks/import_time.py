@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Checks how long it takes to start envdraw against a budget.
+
+Each entry point is started in a fresh interpreter (so nothing is already
+imported) and timed against running an empty program, along with the list of
+modules it ended up importing.  Importing examine mustn't pull in tkinter or
+any of the drawing or instrumenting code, which only a GUI run (or running a
+program that isn't cached) needs, and each entry point should stay within its
+budget.  Exits with status 1 if anything is over.
+
+Usage: python3 benchmarks/import_time.py [--repeat N] [--slack FACTOR]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+FACT3 = os.path.join(ROOT, "tests", "fact3.py")
+
+# Name -> (statement, budget in milliseconds over a bare interpreter).
+ENTRY_POINTS = {
+    "import examine": ("import examine", 40),
+    "import interactive": ("import interactive", 100),
+    "headless run": ("import sys; sys.argv = ['examine.py', '--headless', "
+                     "{0!r}]; import examine; examine.main()".format(FACT3),
+                     200),
+}
+# None of these should be imported by just importing examine.  (dis is,
+# since a generator can need it once the interpreter's shutting down and
+# can't import anything.)
+HEAVY = ("tkinter", "renderer", "components", "drawable", "routing",
+         "envdraw", "ast", "inspect", "pprint", "hashlib")
+
+
+def start(statement):
+    """Wall time of running statement in a new interpreter, and the modules
+    it imported.
+    """
+    command = [sys.executable, "-c",
+               statement + "\nimport sys; print(' '.join(sys.modules))"]
+    begin = time.perf_counter()
+    output = subprocess.run(command, cwd=ROOT, check=True,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    elapsed = time.perf_counter() - begin
+    return elapsed, set(output.split("\n")[-2].split())
+
+
+def best_start(statement, repeat):
+    best, modules = None, None
+    for _ in range(repeat):
+        elapsed, modules = start(statement)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Check envdraw's start up time against a budget.")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="take the best of this many starts")
+    parser.add_argument("--slack", type=float, default=1,
+                        help="multiply every budget (for slow machines)")
+    args = parser.parse_args()
+
+    bare, _ = best_start("pass", args.repeat)
+    print("bare interpreter: {0:.1f} ms".format(bare * 1e3))
+    print("{0:<20} {1:>10} {2:>12} {3:>8}".format(
+        "entry point", "ms", "budget (ms)", "modules"))
+    failed = False
+    for name, (statement, budget) in ENTRY_POINTS.items():
+        elapsed, modules = best_start(statement, args.repeat)
+        over = (elapsed - bare) * 1e3
+        ok = over <= budget * args.slack
+        failed = failed or not ok
+        print("{0:<20} {1:>10.1f} {2:>12.0f} {3:>8} {4}".format(
+            name, over, budget * args.slack, len(modules),
+            "" if ok else "OVER BUDGET"))
+
+    _, modules = start("import examine")
+    heavy = sorted(m for m in HEAVY if m in modules)
+    if heavy:
+        failed = True
+        print("import examine imported", ", ".join(heavy))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Measures how long envdraw_decorate takes to instrument large generated
+modules, next to how long parsing and compiling them takes anyway.
+
+Each generated function has a couple of returns and a lambda in it, so every
+kind of hook gets added.  Instrumenting should stay linear in the size of the
+module and cost about as much as compiling it.
+
+Usage: python3 benchmarks/instrument_overhead.py
+"""
+
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from envdraw import envdraw_decorate
+
+REPEAT = 3
+SIZES = (100, 500, 2000)
+
+FUNCTION = """
+def f{0}(a, b=1):
+    c = a + b
+    if c > 10:
+        return c
+    g = lambda x: x + c
+    return g(c)
+"""
+
+
+def generate(functions):
+    return "".join(FUNCTION.format(i) for i in range(functions))
+
+
+def best_time(fn):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print("{0:>10} {1:>8} {2:>12} {3:>16} {4:>14} {5:>14}".format(
+        "functions", "lines", "parse (ms)", "instrument (ms)",
+        "compile (ms)", "per def (us)"))
+    for size in SIZES:
+        source = generate(size)
+        parse = best_time(lambda: ast.parse(source))
+        trees = [ast.parse(source) for _ in range(REPEAT)]
+        instrument = best_time(lambda: envdraw_decorate(trees.pop()))
+        tree = envdraw_decorate(ast.parse(source))
+        compiled = best_time(lambda: compile(tree, "<generated>", "exec"))
+        print("{0:>10} {1:>8} {2:>12.1f} {3:>16.1f} {4:>14.1f} {5:>14.1f}"
+              .format(size, source.count("\n"), parse * 1e3,
+                      instrument * 1e3, compiled * 1e3,
+                      instrument / (2 * size) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Measures how long it takes the hooks to find the function being called as
+the number of live objects on the heap grows.
+
+Compares the old gc.get_referrers scan against examine.FunctionRegistry.  The
+registry's cost should stay flat while the heap scan grows linearly.
+
+Usage: python3 benchmarks/lookup_overhead.py
+"""
+
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from examine import FunctionRegistry, FUNCTION_TYPE
+
+CALLS = 200
+HEAP_SIZES = (0, 10000, 100000, 1000000)
+
+
+def referrers_lookup(py_fr):
+    """The lookup examine used to do, kept here for comparison."""
+    for possible in gc.get_referrers(py_fr.f_code):
+        if type(possible) == FUNCTION_TYPE:
+            return possible
+
+
+def make_adders(registry, n):
+    """Make n closures from one def, registered as funcdef would."""
+    def make_adder(k):
+        def adder(x, lookup):
+            return lookup(sys._getframe()), x + k
+        registry.register(adder)
+        return adder
+    return [make_adder(k) for k in range(n)]
+
+
+def time_lookup(fn, lookup):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        fn(0, lookup)
+    return (time.perf_counter() - start) / CALLS
+
+
+def main():
+    registry = FunctionRegistry()
+    adders = make_adders(registry, 10)
+    print("{0:>10} {1:>16} {2:>16}".format("heap objs", "referrers (us)",
+                                            "registry (us)"))
+    for size in HEAP_SIZES:
+        ballast = [[] for _ in range(size)]
+        target = adders[3]
+        assert target(0, registry.lookup)[0] is target
+        referrers = time_lookup(target, referrers_lookup)
+        registered = time_lookup(target, registry.lookup)
+        print("{0:>10} {1:>16.2f} {2:>16.2f}".format(size, referrers * 1e6,
+                                                     registered * 1e6))
+        del ballast
+
+
+if __name__ == '__main__':
+    main()
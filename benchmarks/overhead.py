@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Measures how much slower programs run under examine.run than on their own.
+
+The workloads are the programs in tests/ plus scaled up variants of the same
+sorts of things (deep recursion, lots of small calls, closures, lots of
+globals, lambdas made in a loop).  A scaled workload is run at two sizes: a
+realistic one for plain and headless runs, and a much smaller one for the
+drawn runs, since a diagram of a hundred thousand frames is no use to anyone
+and would take all day.  For each workload this reports:
+
+    plain -- wall time of running it uninstrumented
+    headless -- wall time under examine.run with no drawing, the slowdown
+    against plain and the peak memory allocated (from tracemalloc)
+    svg -- wall time when drawing the diagram of the drawn size (on a
+    VectorCanvas, so no display is needed), the slowdown against running
+    that size plain, and the number of canvas items drawn
+    events -- how many times funcdef, funccall and funcreturn were called and
+    what each call cost on average (from cProfile, so these run a bit slower
+    than they would otherwise, but comparably between versions)
+
+Everything is saved as JSON.  Pass an earlier result with --compare to see
+which workloads got slower.
+
+Usage: python3 benchmarks/overhead.py [--output FILE] [--scale N]
+                                      [--compare FILE]
+"""
+
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import examine
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, "tests")
+REPEAT = 3
+HOOKS = ("funcdef", "funccall", "funcreturn")
+
+# Each of these is (headless size, drawn size, source), and the source is
+# formatted with a size (times --scale).
+SCALED = {
+    "deep_recursion": (800, 400, """
+def factorial(n):
+    if n == 0:
+        return 1
+    return n * factorial(n - 1)
+
+result = factorial({0})
+"""),
+    "many_small_calls": (20000, 100, """
+def add(a, b):
+    return a + b
+
+total = 0
+for i in range({0}):
+    total = add(total, i)
+"""),
+    "closures": (5000, 20, """
+def make_adder(n):
+    def adder(k):
+        return k + n
+    return adder
+
+def compose(f, g):
+    return lambda x: f(g(x))
+
+total = 0
+for i in range({0}):
+    total = compose(make_adder(i), make_adder(1))(total)
+"""),
+    "large_globals": (5000, 500, """
+for i in range({0}):
+    globals()["g" + str(i)] = i
+
+counter = 0
+def bump():
+    global counter
+    counter = counter + 1
+
+for i in range({0} // 10):
+    bump()
+"""),
+    "lambdas_in_loop": (20000, 100, """
+total = 0
+for i in range({0}):
+    square = lambda x: x * x
+    total = total + square(i)
+"""),
+}
+
+
+def workloads(tmpdir, scale=1):
+    """Write every workload to a file (examine.run wants one) and return a
+    dict of name -> (path, path of the size to draw).
+    """
+    found = {}
+    for filename in sorted(os.listdir(TESTS_DIR)):
+        if filename.endswith(".py"):
+            path = os.path.join(TESTS_DIR, filename)
+            found["tests/" + filename[:-3]] = path, path
+    for name, (size, drawn_size, source) in SCALED.items():
+        paths = []
+        for suffix, n in (("", size), ("_drawn", drawn_size)):
+            path = os.path.join(tmpdir, name + suffix + ".py")
+            with open(path, "w") as f:
+                f.write(source.format(int(n * scale)))
+            paths.append(path)
+        found[name] = tuple(paths)
+    return found
+
+
+def best_time(fn):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_plain(path):
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+    exec(code, {"__name__": "__main__"})
+
+
+def run_examine(path, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return examine.run(path, wait=False, headless=True, **kwargs)
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def hook_costs(path):
+    """Calls and mean cost in microseconds of each hook, from cProfile."""
+    profile = cProfile.Profile()
+    profile.runcall(run_examine, path)
+    stats = pstats.Stats(profile).stats
+    costs = {hook: {"calls": 0, "per_call_us": 0.0} for hook in HOOKS}
+    for (filename, _, name), (_, calls, _, cumtime, _) in stats.items():
+        if name in HOOKS and os.path.basename(filename) == "examine.py":
+            costs[name] = {"calls": calls,
+                           "per_call_us": cumtime / calls * 1e6}
+    return costs
+
+
+def measure(path, drawn_path, svg_path):
+    plain = best_time(lambda: run_plain(path))
+    headless = best_time(lambda: run_examine(path))
+    drawn_plain = best_time(lambda: run_plain(drawn_path))
+    svg = best_time(lambda: run_examine(drawn_path, image_file=svg_path))
+    tracker = run_examine(drawn_path, image_file=svg_path)
+    items = len(tracker.renderers[0].canvas.items)
+    return {
+        "plain": {"wall_s": plain,
+                  "peak_bytes": peak_memory(lambda: run_plain(path))},
+        "headless": {"wall_s": headless,
+                     "slowdown": headless / plain if plain else None,
+                     "peak_bytes": peak_memory(lambda: run_examine(path))},
+        "svg": {"wall_s": svg,
+                "slowdown": svg / drawn_plain if drawn_plain else None,
+                "canvas_items": items},
+        "events": hook_costs(path),
+    }
+
+
+def compare(results, old):
+    print()
+    print("{0:<32} {1:>12} {2:>12} {3:>8}".format(
+        "compared with " + old.get("label", "?"), "old (ms)", "new (ms)",
+        "change"))
+    for name, result in results["workloads"].items():
+        if name not in old["workloads"]:
+            continue
+        for mode in ("headless", "svg"):
+            before = old["workloads"][name][mode]["wall_s"]
+            after = result[mode]["wall_s"]
+            print("{0:<32} {1:>12.2f} {2:>12.2f} {3:>+7.0f}%".format(
+                name + " " + mode, before * 1e3, after * 1e3,
+                (after / before - 1) * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Measure the overhead of running under envdraw.")
+    parser.add_argument("--output", default="overhead.json",
+                        help="where to save the results as JSON")
+    parser.add_argument("--label", default=None,
+                        help="name for this run (say, a version or commit)")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiply the size of the scaled workloads")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="earlier results to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "label": args.label or time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": REPEAT,
+        "scale": args.scale,
+        "workloads": {},
+    }
+    print("{0:<28} {1:>10} {2:>10} {3:>9} {4:>10} {5:>9} {6:>8} "
+          "{7:>12}".format("workload", "plain (ms)", "envdraw", "slowdown",
+                           "svg (ms)", "slowdown", "items", "peak (KiB)"))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        svg_path = os.path.join(tmpdir, "diagram.svg")
+        for name, (path, drawn_path) in workloads(tmpdir,
+                                                  args.scale).items():
+            result = measure(path, drawn_path, svg_path)
+            results["workloads"][name] = result
+            print("{0:<28} {1:>10.2f} {2:>10.2f} {3:>8.1f}x {4:>10.2f} "
+                  "{5:>8.1f}x {6:>8} {7:>12.0f}".format(
+                      name, result["plain"]["wall_s"] * 1e3,
+                      result["headless"]["wall_s"] * 1e3,
+                      result["headless"]["slowdown"] or 0,
+                      result["svg"]["wall_s"] * 1e3,
+                      result["svg"]["slowdown"] or 0,
+                      result["svg"]["canvas_items"],
+                      result["headless"]["peak_bytes"] / 1024))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print()
+    print("{0:<28} {1:>10} {2:>14}".format("hook", "calls", "per call (us)"))
+    for hook in HOOKS:
+        calls = sum(r["events"][hook]["calls"]
+                    for r in results["workloads"].values())
+        total = sum(r["events"][hook]["calls"] *
+                    r["events"][hook]["per_call_us"]
+                    for r in results["workloads"].values())
+        print("{0:<28} {1:>10} {2:>14.2f}".format(
+            hook, calls, total / calls if calls else 0))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print()
+    print("Saved to", args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
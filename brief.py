@@ -0,0 +1,179 @@
+"""brief.py
+
+Short versions of values to draw, so binding something huge (a list of ten
+million numbers, the contents of a file) doesn't mean building its whole repr
+and a canvas text item wider than the screen.
+
+A brief of a value is like its str, but with at most maxchars characters:
+containers only show their first few elements (more of them the bigger the
+budget), nesting is cut off a few levels down, and long strings and numbers
+are shortened in the middle, as reprlib does.  Briefs are made when a value
+is first drawn and kept, keyed by the object's identity and its version (for a
+mutable object, model.Value's snapshot of it), so drawing the same unchanged
+object again doesn't make another one.
+"""
+
+import reprlib
+from collections import OrderedDict, deque
+from itertools import islice
+
+# Characters shown for a value normally, and when it's been expanded by
+# clicking on it.
+MAX_CHARS = 40
+EXPANDED_CHARS = 2000
+# Expanded briefs are broken into lines this long.
+EXPANDED_WIDTH = 80
+# Elements looked at to fingerprint a container, however deeply nested.
+SMALL = 1000
+FILL = "..."
+
+
+class BriefRepr(reprlib.Repr):
+    """A reprlib.Repr which fits about maxchars characters.  Unlike
+    reprlib.Repr it never sorts sets or dicts, which would mean looking at
+    every element of a big one.
+    """
+
+    def __init__(self, maxchars):
+        reprlib.Repr.__init__(self)
+        self.maxlevel = 3
+        self.maxstring = self.maxlong = self.maxother = maxchars
+        elements = max(6, maxchars // 6)
+        self.maxtuple = self.maxlist = self.maxarray = elements
+        self.maxset = self.maxfrozenset = self.maxdeque = elements
+        self.maxdict = max(4, maxchars // 12)
+
+    def repr_set(self, x, level):
+        if not x:
+            return 'set()'
+        return self._repr_iterable(x, level, '{', '}', self.maxset)
+
+    def repr_frozenset(self, x, level):
+        if not x:
+            return 'frozenset()'
+        return self._repr_iterable(x, level, 'frozenset({', '})',
+                                   self.maxfrozenset)
+
+    def repr_dict(self, x, level):
+        if not x:
+            return '{}'
+        if level <= 0:
+            return '{' + self.fillvalue + '}'
+        pieces = ['{0}: {1}'.format(self.repr1(key, level - 1),
+                                    self.repr1(value, level - 1))
+                  for key, value in islice(x.items(), self.maxdict)]
+        if len(x) > self.maxdict:
+            pieces.append(self.fillvalue)
+        return '{' + ', '.join(pieces) + '}'
+
+
+_reprs = {}
+
+
+def brief(obj, maxchars=MAX_CHARS, quote=False):
+    """A string of at most maxchars characters showing obj.  Strings are
+    shown as they are (like str does), just cut short if need be, unless
+    quote is True.
+    """
+    if isinstance(obj, str):
+        text = obj[:maxchars + 1]
+        if quote:
+            text = repr(text)
+    else:
+        if maxchars not in _reprs:
+            _reprs[maxchars] = BriefRepr(maxchars)
+        try:
+            text = _reprs[maxchars].repr(obj)
+        except Exception:
+            # A broken __repr__ shouldn't stop the program being drawn.
+            text = '<{0} object>'.format(type(obj).__name__)
+    if len(text) > maxchars:
+        text = text[:maxchars - len(FILL)] + FILL
+    return text
+
+
+def wrap(text, width=EXPANDED_WIDTH):
+    """Break text into lines of at most width characters (keeping the line
+    breaks it already has).
+    """
+    return '\n'.join(line[i:i + width]
+                     for line in text.split('\n')
+                     for i in range(0, max(len(line), 1), width))
+
+
+def fingerprint(obj):
+    """Something that changes when obj does, to tell whether a mutable object
+    has changed since it was bound.  Containers are walked, hashing the
+    elements themselves, but only the first SMALL of them all told (however
+    deeply nested they are): changes past those are missed, but nothing has
+    to look at ten million elements every time a function returns.  Anything
+    else is hashed by its expanded brief.  If even that fails, it's the
+    object's identity, so it's never seen to change.
+    """
+    pieces = []
+    try:
+        _walk(obj, pieces, [SMALL])
+        return hash(tuple(pieces))
+    except Exception:
+        return id(obj)
+
+
+_ATOMS = frozenset([type(None), bool, int, float, complex, str, bytes])
+_SEQUENCES = frozenset([list, tuple, set, frozenset, deque])
+
+
+def _walk(obj, pieces, budget):
+    """Add what fingerprint hashes of obj to pieces, looking at no more than
+    budget[0] elements (and using those up).
+    """
+    kind = type(obj)
+    if kind in _ATOMS:
+        pieces.append(obj)
+    elif kind in _SEQUENCES or kind is dict:
+        pieces.append((kind, len(obj)))
+        items = obj.items() if kind is dict else obj
+        head = list(islice(items, budget[0]))
+        if kind is dict:
+            head = [part for item in head for part in item]
+        if _ATOMS.issuperset(map(type, head)):
+            # Only numbers and strings, the usual case: no need to look at
+            # them one by one.
+            pieces.extend(head)
+            budget[0] -= len(head)
+            return
+        for item in head:
+            budget[0] -= 1
+            _walk(item, pieces, budget)
+            if budget[0] <= 0:
+                break
+    else:
+        pieces.append(brief(obj, EXPANDED_CHARS))
+
+
+class BriefCache(object):
+    """Remembers the briefs of the last maxsize objects.  Each is looked up by
+    the object's id, and only used if it's still the same object (ids get
+    reused once an object's gone) at the same version.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict() # (id, maxchars) -> (obj, version, text)
+
+    def get(self, obj, version=None, maxchars=MAX_CHARS):
+        key = (id(obj), maxchars)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is obj and entry[1] == version:
+            self._entries.move_to_end(key)
+            return entry[2]
+        text = brief(obj, maxchars)
+        self._entries[key] = (obj, version, text)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return text
+
+    def clear(self):
+        self._entries.clear()
+
+
+CACHE = BriefCache()
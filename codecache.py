@@ -0,0 +1,114 @@
+"""codecache.py
+
+A cache of instrumented code, so running the same program again doesn't mean
+parsing it, running it through envdraw_decorate and compiling it again.
+
+Entries are keyed by a hash of the source along with everything else that
+goes into the code object (its filename, the compile mode, which functions
+and whether their calls are instrumented, whether its top level statements
+sync the globals, the instrumenter's version and the interpreter's bytecode
+version), so a changed program or a new version of envdraw.py never gets
+stale code.  The marshalled code objects are kept in memory, dropping the
+least recently used once there are more than maxsize of them, and can also
+be written to a directory (like __pycache__) to be shared between runs.
+"""
+
+import marshal
+import os
+import sys
+from collections import OrderedDict
+
+# Marshalled code only loads on the interpreter which wrote it.  (This is
+# used instead of importlib.util.MAGIC_NUMBER, which takes longer to import
+# than everything else here.)
+MAGIC = "ENVDRAWC {0} {1}\n".format(sys.implementation.cache_tag,
+                                     sys.version).encode("utf-8")
+
+
+class CodeCache(object):
+
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits, self.misses = 0, 0
+        self._entries = OrderedDict() # Key -> marshalled code
+
+    def compile(self, source, filename, mode="exec", trace_calls=True,
+                include=None, exclude=None, sync_globals=False):
+        """Return the code object for source, instrumented by
+        envdraw_decorate (with the given trace_calls, include, exclude and
+        sync_globals) and compiled with the given filename and mode.
+        """
+        key = self.key(source, filename, mode, trace_calls, include, exclude,
+                       sync_globals)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return marshal.loads(data)
+        data = self._load(key)
+        if data is None:
+            import ast
+            import envdraw
+            self.misses += 1
+            tree = envdraw.envdraw_decorate(ast.parse(source, filename, mode),
+                                            trace_calls, include, exclude,
+                                            source, sync_globals)
+            data = marshal.dumps(compile(tree, filename, mode))
+            self._save(key, data)
+        else:
+            self.hits += 1
+        self._entries[key] = data
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return marshal.loads(data)
+
+    def key(self, source, filename, mode, trace_calls, include=None,
+            exclude=None, sync_globals=False):
+        import envdraw
+        import hashlib
+        digest = hashlib.sha256()
+        for part in (str(envdraw.INSTRUMENTER_VERSION), MAGIC.hex(), filename,
+                     mode, str(bool(trace_calls)), repr(include),
+                     repr(exclude), str(bool(sync_globals)), source):
+            digest.update(part.encode("utf-8", "surrogatepass"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def clear(self):
+        """Forget everything kept in memory (but not on disk)."""
+        self._entries.clear()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".envdraw")
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        return data[len(MAGIC):]
+
+    def _save(self, key, data):
+        """Write an entry to disk.  Like __pycache__ this is best effort, so
+        a read only or missing directory just means nothing is saved.
+        """
+        if self.directory is None:
+            return
+        path = self._path(key)
+        tmp = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(MAGIC + data)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
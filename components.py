@@ -1,5 +1,5 @@
-import tkinter as tk
-from drawable import Drawable, Connectable, Draggable, Connector, Arrowhead
+import brief
+from drawable import Connectable, Draggable, Connector
 
 class Frame(Draggable):
     """Represents a Frame in the environment diagram.  A Frame is a Draggable
@@ -9,13 +9,22 @@ class Frame(Draggable):
         - A list of bindings mapping from Variables to Values
         - A StaticLink to the enclosing environment Frame (None if it's
         global)
+
+    A sampled Frame (see sampling.py) is labelled as one, since the calls
+    around it might not have been drawn.
     """
 
     prefix = "frame"
 
-    def __init__(self, canvas, x, y, globe=False, extended_frame=None):
+    def __init__(self, canvas, x, y, globe=False, extended_frame=None,
+                 sampled=False):
         Draggable.__init__(self, canvas)
         self.bindings = [] # List of bindings from variables to values
+        self._index = {} # Variable name -> its Binding in self.bindings
+        self._lookup_cache = {} # Variable name -> Binding in enclosing frames
+        # Frames which have cached lookups through this one, which are only
+        # good until its bindings change.
+        self._dependents = set()
         self.rect = canvas.create_rectangle(x, y, x + self.width, y +
                                             self.height, tag=self.tag,
                                             fill="white")
@@ -26,10 +35,14 @@ class Frame(Draggable):
         else:
             canvas.create_oval(x+145, y-5, x+155, y+5, tag=self.tag,
                                     fill="black")
+        if sampled:
+            canvas.create_text(x+5, y+3, anchor="nw", text="sampled",
+                               fill="gray", tag=self.tag)
         if extended_frame is not None:
             self.extend(extended_frame)
         else:
             self.static_link = None
+        self.update_obstacle()
 
     def extend(self, frame):
         """Extend the given Frame."""
@@ -54,12 +67,13 @@ class Frame(Draggable):
         variable...
         """
         # If there's already a binding, update it rather than add a new one.
-        for binding in self.bindings:
-            if binding.variable.name == variable:
-                return self.update_binding(variable, value)
+        if variable in self._index:
+            return self.update_binding(variable, value)
         variable = Variable(self.canvas, self, variable)
         binding = Binding(self.canvas, variable, value)
         self.bindings.append(binding)
+        self._index[variable.name] = binding
+        self._bindings_changed()
         x, y = self.pos
         variable.set_pos(x + 10, y + len(self.bindings) * 20)
         if value.moves_with_binding:
@@ -68,18 +82,41 @@ class Frame(Draggable):
 
     def update_binding(self, variable, value):
         """Updates a pre-existing Binding in this or some enclosing Frame."""
-        old_value = self.lookup(variable).value
-        if old_value is None:
+        binding = self.lookup(variable)
+        if binding is None:
             raise BaseException(
                 "Tried to update a variable that's not in scope!")
-        var_x, var_y = self.lookup(variable).variable.pos
-        self.lookup(variable).value = value
-        if old_value.moves_with_binding:
-            old_value.set_pos(0, 0) # Or better yet, somehow remove it
+        old_value = binding.value
+        var_x, var_y = binding.variable.pos
+        binding.value = value
+        if old_value.moves_with_binding and old_value is not value:
+            old_value.delete() # Nothing else can be pointing at it
         if value.moves_with_binding:
             value.set_pos(var_x + 130, var_y)
         self.update()
 
+    def remove_binding(self, variable):
+        """Take the Binding for a variable out of this Frame (the last one
+        added, say when stepping backwards through a program).
+        """
+        binding = self._index.pop(variable)
+        self.bindings.remove(binding)
+        self._bindings_changed()
+        binding.delete()
+        self.update()
+
+    def delete(self):
+        """Take this Frame off the canvas, along with its bindings and static
+        link.  Anything else pointing at it should be deleted first.
+        """
+        for binding in self.bindings:
+            binding.delete()
+        if self.static_link is not None:
+            self.enclosing_frame.remove_dependent(self)
+            self.static_link.delete()
+        self.canvas.delete(self.tag)
+        self.remove_obstacle()
+
     def move(self, dx, dy):
         Draggable.move(self, dx, dy)
         for binding in self.bindings:
@@ -88,15 +125,34 @@ class Frame(Draggable):
     def update(self):
         x, y = self.pos
         self.canvas.coords(self.rect, x, y, x + self.width, y + self.height)
+        self.update_obstacle()
 
     def lookup(self, variable):
         """Get the binding associated with this variable."""
-        for binding in self.bindings:
-            if binding.variable.name == variable:
-                return binding
-        if self.static_link is not None:
-            return self.enclosing_frame.lookup(variable)
-        return None
+        binding = self._index.get(variable)
+        if binding is not None or self.static_link is None:
+            return binding
+        if variable not in self._lookup_cache:
+            self._lookup_cache[variable] = \
+                    self.enclosing_frame.lookup(variable)
+            self.enclosing_frame.add_dependent(self)
+        return self._lookup_cache[variable]
+
+    def add_dependent(self, frame):
+        """frame has cached a lookup through this Frame."""
+        self._dependents.add(frame)
+
+    def remove_dependent(self, frame):
+        self._dependents.discard(frame)
+
+    def _bindings_changed(self):
+        """Forget the lookups cached through this Frame, and through those
+        frames in turn.
+        """
+        dependents, self._dependents = self._dependents, set()
+        for frame in dependents:
+            frame._lookup_cache = {}
+            frame._bindings_changed()
 
     @property
     def inhandle(self):
@@ -123,6 +179,92 @@ class Frame(Draggable):
         return 40 + 20 * len(self.bindings)
 
 
+class CollapsedFrames(Draggable):
+    """Stands in for a run of recursive Frames of one function which went
+    deeper than we're willing to draw.  Double clicking it calls on_expand
+    with this CollapsedFrames so the Frames can be drawn in full.
+    """
+
+    prefix = "collapsed"
+
+    def __init__(self, canvas, x, y, name, extended_frame, on_expand=None):
+        Draggable.__init__(self, canvas)
+        self.name = name
+        self.frames = [] # The model frames this stands in for
+        self.on_expand = on_expand
+        self.rect = canvas.create_rectangle(x, y, x + self.width, y +
+                                            self.height, tag=self.tag,
+                                            fill="white", dash=(4, 4))
+        self.text = canvas.create_text(x + 10, y + 10, anchor="nw",
+                                       tag=self.tag, text=self.label)
+        self.static_link = StaticLink(canvas, self, extended_frame)
+        canvas.tag_bind(self.tag, '<Double-Button-1>', self.expand)
+        self.update_obstacle()
+
+    @property
+    def label(self):
+        if not self.frames:
+            return self.name + ": expanded"
+        return "{0} \u00d7{1} frame{2}".format(
+            self.name, len(self.frames), "s" if len(self.frames) > 1 else "")
+
+    def lookup(self, variable):
+        """Bindings in collapsed frames aren't drawn, so look further out."""
+        return self.static_link.frame.lookup(variable)
+
+    def add_dependent(self, frame):
+        """A lookup through us is really through the frame we extend."""
+        self.static_link.frame.add_dependent(frame)
+
+    def remove_dependent(self, frame):
+        self.static_link.frame.remove_dependent(frame)
+
+    def add(self, frame):
+        """Collapse another model frame into this one."""
+        self.frames.append(frame)
+        self.canvas.itemconfig(self.text, text=self.label)
+
+    def expand(self, event=None):
+        if self.on_expand is not None and self.frames:
+            self.on_expand(self)
+            self.frames = []
+            self.canvas.itemconfig(self.text, text=self.label)
+
+    def remove(self, frame):
+        """Stop standing in for a model frame."""
+        self.frames.remove(frame)
+        self.canvas.itemconfig(self.text, text=self.label)
+
+    def delete(self):
+        self.static_link.delete()
+        self.canvas.delete(self.tag)
+        self.remove_obstacle()
+
+    @property
+    def pos(self):
+        return tuple(self.canvas.coords(self.rect)[0:2])
+
+    @property
+    def inhandle(self):
+        x, y = self.pos
+        return ((x, y + 20), (x + self.width, y + 20), (x + 40, y),
+                (x + 110, y), (x + 40, y + self.height),
+                (x + 110, y + self.height))
+
+    @property
+    def outhandle(self):
+        x, y = self.pos
+        return x + self.width, y
+
+    @property
+    def width(self):
+        return 150
+
+    @property
+    def height(self):
+        return 40
+
+
 class StaticLink(Connector):
     """Represents a StaticLink pointing to some Frame."""
 
@@ -148,8 +290,8 @@ class Variable(Connectable):
     def __init__(self, canvas, frame, name):
         Connectable.__init__(self, canvas)
         x, y = 0, 0 # This should be set when it's bound in a Frame
-        self.text = canvas.create_text(x, y, anchor=tk.NW, text=name+":",
-                tag=self.tag)
+        self.text = self.create_item('text', x, y, anchor="nw",
+                                     text=name+":", tag=self.tag)
         self.name = name
 
     def move(self, dx, dy):
@@ -179,17 +321,44 @@ class Variable(Connectable):
         x, y = self.pos
         return round(x + self.width, -1), round(y + self.height // 2, -1)
 
+    def delete(self):
+        self.release_item(self.text)
+
 
 class Value(Connectable):
+    """Any value other than a function.  Only a brief version of it is shown
+    (see brief.py), which clicking on it expands, and clicking again shrinks
+    back.  version is what brief.CACHE keeps the brief under for mutable
+    objects (model.Value's snapshot).
+    """
 
     prefix = "value"
     moves_with_binding = True
 
-    def __init__(self, canvas, frame, name):
+    def __init__(self, canvas, frame, obj, version=None):
         Connectable.__init__(self, canvas)
+        self.obj = obj
+        self.version = version
+        self.expanded = False
         x, y = 0, 0 # Should be updated using set_pos
-        self.text = canvas.create_text(x, y, anchor=tk.NE, text=name,
-                                       tag=self.tag)
+        self.text = self.create_item('text', x, y, anchor="ne",
+                                     text=brief.CACHE.get(obj, version),
+                                     tag=self.tag)
+        canvas.tag_bind(self.tag, '<Button-1>', self.toggle)
+
+    def toggle(self, event=None):
+        """Switch between the brief and the expanded version."""
+        self.expanded = not self.expanded
+        if self.expanded:
+            text = brief.wrap(brief.CACHE.get(self.obj, self.version,
+                                              brief.EXPANDED_CHARS))
+        else:
+            text = brief.CACHE.get(self.obj, self.version)
+        self.canvas.itemconfig(self.text, text=text)
+        self.update_connectors()
+
+    def delete(self):
+        self.release_item(self.text)
 
     def move(self, dx, dy):
         self.canvas.move(self.tag, dx, dy)
@@ -248,8 +417,10 @@ class Binding(Connector):
         """The value is at the tail of the Binding Connector."""
         # TODO: This is a hack, we should have the head/tail be properties with
         # appropriate setter methods in Connector.
-        self.head = new_val
-        self.head.add_connector(self)
+        if new_val is not self.head:
+            self.head.remove_connector(self)
+            self.head = new_val
+            self.head.add_connector(self)
         self.update()
 
     def move(self, dx, dy):
@@ -262,6 +433,15 @@ class Binding(Connector):
             self.value.move(dx, dy)
         self.update()
 
+    def delete(self):
+        """Take the Binding off the canvas, with its Variable and (if it's
+        the only thing pointing at it) its Value.
+        """
+        Connector.delete(self)
+        self.variable.delete()
+        if self.value.moves_with_binding:
+            self.value.delete()
+
 
 class Function(Value, Draggable):
     """Represents a Function Value.  A Function is a Value which does not
@@ -289,10 +469,11 @@ class Function(Value, Draggable):
                 tag=self.tag)
         canvas.create_oval(x+125, y-15, x+155, y+15, tag=self.tag, fill="white")
         canvas.create_oval(x+135, y-5, x+145, y+5, tag=self.tag, fill="black")
-        self.name = canvas.create_text(x, y+5, tag=self.tag, anchor=tk.NW,
+        self.name = canvas.create_text(x, y+5, tag=self.tag, anchor="nw",
                                        text=name+"("+", ".join(arguments)+"):")
-        self.body = canvas.create_text(x+15, y+35, tag=self.tag, anchor=tk.NW,
+        self.body = canvas.create_text(x+15, y+35, tag=self.tag, anchor="nw",
                                        text=body)
+        self.update_obstacle()
 
     @property
     def pos(self):
@@ -303,7 +484,157 @@ class Function(Value, Draggable):
         x, y = self.pos
         return (x, y+10), (x+150, y+50)
 
+    def delete(self):
+        self.static_link.delete()
+        self.canvas.delete(self.tag)
+        self.remove_obstacle()
+
     @property
     def outhandle(self):
         x, y = self.pos
         return x+140, y
+
+
+class HeapObject(Value, Draggable):
+    """A list, tuple or dict drawn as a box and pointer diagram: a row of
+    cells (or rows of key and value cells, for a dict), each holding either a
+    brief of an element or a dot with a Pointer to the element's own drawing
+    (its HeapObject, or its Function).  Like a Function, a HeapObject doesn't
+    move with its Bindings since any number of them (and other HeapObjects)
+    can point at it.
+
+    The cells are given with set_contents, as a list of rows of strings,
+    HeapObjects and Functions, and can be set again when the object
+    changes.
+    """
+
+    prefix = "heap"
+    moves_with_binding = False
+    cell_width = 50
+    cell_height = 24
+    label_height = 16
+
+    def __init__(self, canvas, x, y, kind):
+        Draggable.__init__(self, canvas)
+        self.contents = {} # (row, column) -> what's in that cell
+        self.cells = {} # (row, column) -> Cell, for cells with a Pointer
+        self.cell_items = {} # (row, column) -> the canvas items drawing it
+        self.rows, self.columns = 1, 1
+        self.label = canvas.create_text(x, y, anchor="nw", text=kind,
+                                        tag=self.tag)
+
+    def set_contents(self, rows):
+        """Draw the cells, with rows a list of lists of strings, HeapObjects
+        and Functions.  Only cells whose contents have changed since last time
+        are redrawn.
+        """
+        rows = rows or [[""]]
+        contents = {(r, c): content for r, row in enumerate(rows)
+                    for c, content in enumerate(row)}
+        for position, content in self.contents.items():
+            if contents.get(position) != content:
+                self.clear_cell(*position)
+        x, y = self.pos
+        for position, content in contents.items():
+            if self.contents.get(position) != content:
+                self.draw_cell(x, y, position, content)
+        self.contents = contents
+        self.rows, self.columns = len(rows), max(len(row) for row in rows)
+        self.update_obstacle()
+        self.update_connectors()
+
+    def draw_cell(self, x, y, position, content):
+        row, column = position
+        w, h = self.cell_width, self.cell_height
+        left, top = x + column * w, y + self.label_height + row * h
+        items = [self.create_item('rectangle', left, top, left + w, top + h,
+                                  tag=self.tag, fill="white")]
+        if not isinstance(content, str):
+            cell = Cell(self.canvas, self, left - x + w // 2,
+                        top - y + h // 2)
+            items.append(self.create_item('oval', left + w // 2 - 4,
+                                          top + h // 2 - 4, left + w // 2 + 4,
+                                          top + h // 2 + 4, tag=self.tag,
+                                          fill="black"))
+            self.cells[position] = cell
+            Pointer(self.canvas, cell, content)
+        else:
+            items.append(self.create_item('text', left + w // 2,
+                                          top + h // 2, text=content,
+                                          tag=self.tag))
+        self.cell_items[position] = items
+
+    def clear_cell(self, row, column):
+        """Take a cell (and its Pointer, if it has one) off the canvas."""
+        cell = self.cells.pop((row, column), None)
+        if cell is not None:
+            for pointer in list(cell.connectors):
+                pointer.delete()
+        for item in self.cell_items.pop((row, column), ()):
+            self.release_item(item)
+
+    def delete(self):
+        for row, column in list(self.contents):
+            self.clear_cell(row, column)
+        self.contents = {}
+        self.canvas.delete(self.tag)
+        self.remove_obstacle()
+
+    def move(self, dx, dy):
+        Draggable.move(self, dx, dy)
+        for cell in self.cells.values():
+            cell.update_connectors()
+
+    @property
+    def pos(self):
+        return tuple(self.canvas.coords(self.label)[0:2])
+
+    @property
+    def width(self):
+        return self.columns * self.cell_width
+
+    @property
+    def height(self):
+        return self.label_height + self.rows * self.cell_height
+
+    @property
+    def inhandle(self):
+        x, y = self.pos
+        middle = y + self.label_height + self.cell_height // 2
+        return (x, middle), (x + self.width // 2, y), \
+                (x + self.width, middle)
+
+    @property
+    def outhandle(self):
+        return self.pos
+
+
+class Cell(Connectable):
+    """A cell of a HeapObject holding a pointer, at (dx, dy) from the
+    HeapObject's corner.
+    """
+
+    prefix = "cell"
+
+    def __init__(self, canvas, heap_object, dx, dy):
+        Connectable.__init__(self, canvas)
+        self.heap_object = heap_object
+        self.offset = dx, dy
+
+    @property
+    def pos(self):
+        x, y = self.heap_object.pos
+        return x + self.offset[0], y + self.offset[1]
+
+    @property
+    def outhandle(self):
+        return self.pos
+
+
+class Pointer(Connector):
+    """The arrow from a Cell to the HeapObject or Function it points at."""
+
+    prefix = "pointer"
+
+    def __init__(self, canvas, cell, heap_object):
+        Connector.__init__(self, canvas, heap_object, cell)
@@ -0,0 +1,169 @@
+"""counters.py
+
+Counts and times the calls to the parts of envdraw a traced program's time
+goes on: the hooks and tracer callbacks, the Tracker's methods, the
+renderers, layout and routing, and the constructors of the GUI components.
+
+Nothing is counted normally.  A Counters object wraps the functions in
+TARGETS when it's installed (see examine.run's counters argument, or
+examine.py --counters) and puts the originals back when it's uninstalled,
+so the rest of the time they don't cost anything at all.  Only modules which
+have already been imported are wrapped, so counting doesn't import Tk.
+
+Each function gets its number of calls, the total time spent in it
+(perf_counter_ns, including anything it calls) and its own time (leaving out
+the time spent in other counted functions it calls).  A recursive function's
+total counts the inner calls again, its own time doesn't.
+"""
+
+import functools
+import json
+import sys
+from time import perf_counter_ns
+
+# (module, attribute) of everything counted.  Methods are given as
+# Class.method, and a class's constructor as Class.__init__.  Nothing which
+# looks at its caller's frame (funccall, funcreturn, funcyield and
+# MonitoringTracer's callbacks) can be wrapped, so what they call is counted
+# instead.
+TARGETS = (
+    ("examine", "funcdef"),
+    ("examine", "globalstep"),
+    ("examine", "FunctionRegistry.register"),
+    ("examine", "FunctionRegistry.lookup"),
+    ("examine", "Tracker.defined_function"),
+    ("examine", "Tracker.enter_function"),
+    ("examine", "Tracker.exit_function"),
+    ("examine", "Tracker.suspend_function"),
+    ("examine", "Tracker.catch_up"),
+    ("examine", "Tracker._pop"),
+    ("examine", "Tracker.bind"),
+    ("examine", "Tracker._sync"),
+    ("examine", "Tracker._model_value"),
+    ("examine", "Tracker.insert_global_bindings"),
+    ("tracer", "SetTraceTracer._trace_call"),
+    ("brief", "fingerprint"),
+    ("renderer", "TkRenderer.frame_created"),
+    ("renderer", "TkRenderer.function_created"),
+    ("renderer", "TkRenderer.binding_added"),
+    ("renderer", "TkRenderer.binding_updated"),
+    ("renderer", "TkRenderer.frame_exited"),
+    ("renderer", "TkRenderer.draw_object"),
+    ("renderer", "TkRenderer.collect"),
+    ("history", "History._commit"),
+    ("tracefile", "TraceWriter._step"),
+    ("layout", "Layout.place_frame"),
+    ("layout", "Layout.place_function"),
+    ("layout", "Layout.place_object"),
+    ("layout", "Layout.resize"),
+    ("routing", "Router.route"),
+    ("routing", "Router.update_obstacle"),
+    ("scheduler", "RedrawScheduler.flush"),
+    ("drawable", "Connector.__init__"),
+    ("drawable", "Connector.redraw"),
+    ("components", "Frame.__init__"),
+    ("components", "CollapsedFrames.__init__"),
+    ("components", "Variable.__init__"),
+    ("components", "Value.__init__"),
+    ("components", "Function.__init__"),
+    ("components", "HeapObject.__init__"),
+    ("components", "HeapObject.set_contents"),
+)
+
+
+class Counters(object):
+    """Calls and times for each counted function, by name (module.attribute),
+    once install() has been called.
+    """
+
+    def __init__(self, targets=TARGETS):
+        self.targets = targets
+        self.calls = {}
+        self.total = {} # Name -> nanoseconds
+        self.own = {} # Name -> nanoseconds
+        self._stack = [] # Time spent in counted callees, per active call
+        self._originals = [] # (owner, attribute, original), to restore
+
+    def install(self, modules=None):
+        """Wrap every target in an already imported module.  modules maps
+        module names to modules, for any not to be found in sys.modules
+        under their own name (examine, when it's being run as a script).
+        """
+        for module_name, attribute in self.targets:
+            module = (modules or {}).get(module_name) or \
+                    sys.modules.get(module_name)
+            if module is None:
+                continue
+            owner = module
+            *path, name = attribute.split(".")
+            for part in path:
+                owner = getattr(owner, part, None)
+            if owner is None or name not in vars(owner):
+                continue
+            original = vars(owner)[name]
+            setattr(owner, name, self._wrap(original,
+                                            module_name + "." + attribute))
+            self._originals.append((owner, name, original))
+
+    def uninstall(self):
+        """Put back everything install() wrapped."""
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = []
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def _wrap(self, fn, name):
+        self.calls.setdefault(name, 0)
+        self.total.setdefault(name, 0)
+        self.own.setdefault(name, 0)
+        calls, total, own, stack = self.calls, self.total, self.own, \
+                self._stack
+
+        @functools.wraps(fn)
+        def counted(*args, **kwargs):
+            stack.append(0)
+            start = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                inner = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                calls[name] += 1
+                total[name] += elapsed
+                own[name] += elapsed - inner
+        return counted
+
+    def results(self):
+        """{name: {"calls": n, "total_ns": t, "own_ns": t}} for everything
+        that was called, most own time first.
+        """
+        names = sorted((name for name in self.calls if self.calls[name]),
+                       key=lambda name: -self.own[name])
+        return {name: {"calls": self.calls[name],
+                       "total_ns": self.total[name],
+                       "own_ns": self.own[name]} for name in names}
+
+    def report(self, out=None):
+        """Print a table of the results, most own time first."""
+        out = out if out is not None else sys.stderr
+        print("{0:<42} {1:>9} {2:>11} {3:>11} {4:>13}".format(
+            "function", "calls", "total (ms)", "own (ms)", "own/call (us)"),
+            file=out)
+        for name, result in self.results().items():
+            print("{0:<42} {1:>9} {2:>11.1f} {3:>11.1f} {4:>13.2f}".format(
+                name, result["calls"], result["total_ns"] / 1e6,
+                result["own_ns"] / 1e6,
+                result["own_ns"] / 1e3 / result["calls"]), file=out)
+
+    def dump(self, path):
+        """Save the results as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.results(), f, indent=2)
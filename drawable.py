@@ -1,4 +1,3 @@
-import tkinter as tk
 import math
 
 class Drawable(object):
@@ -15,14 +14,43 @@ class Drawable(object):
         """Returns the tag used to group components of this Drawable."""
         return self.prefix + str(self.id)
 
-    def heuristic(self, point, goal):
+    def create_item(self, kind, *coords, **options):
+        """Create a canvas item (kind is "text", "line" and so on), reusing a
+        released one if the canvas has an ItemPool (see pool.py).
+        """
+        pool = getattr(self.canvas, 'pool', None)
+        if pool is None:
+            return getattr(self.canvas, 'create_' + kind)(*coords, **options)
+        return pool.create(kind, *coords, **options)
+
+    def release_item(self, item):
+        """Take an item made with create_item off the canvas."""
+        pool = getattr(self.canvas, 'pool', None)
+        if pool is None:
+            self.canvas.delete(item)
+        else:
+            pool.release(item)
+
+    def heuristic(self, point, goal, ignore=()):
         distance = abs(point[0] - goal[0]) + abs(point[1] - goal[1])
-        x, y = point
-        covering = self.canvas.find_overlapping(x - 5, y - 5, x + 5, y + 5)
-        proximity = self.canvas.find_overlapping(x - 15, y - 15, x + 15, y +
-                15)
-        cost = len(covering) * 200 + len(proximity) * 150
-        return distance + cost
+        return distance + self.overlap_cost(point, ignore)
+
+    def overlap_cost(self, point, ignore=()):
+        """Score how crowded the canvas is around point (see
+        routing.crowding_cost).  If the canvas has a Router (see routing.py)
+        we use its cached occupancy grid, leaving out the Draggables in
+        ignore, otherwise we ask Tk.
+        """
+        router = getattr(self.canvas, 'router', None)
+        if router is None:
+            from routing import CELL_SIZE, PROXIMITY, crowding_cost
+            x, y, r = point[0], point[1], CELL_SIZE / 2
+            covering = self.canvas.find_overlapping(x - r, y - r, x + r,
+                                                    y + r)
+            near = self.canvas.find_overlapping(x - PROXIMITY, y - PROXIMITY,
+                                                x + PROXIMITY, y + PROXIMITY)
+            return crowding_cost(len(covering), len(near))
+        return router.overlap_cost(point, ignore)
 
 
 # Connectables
@@ -39,6 +67,10 @@ class Connectable(Drawable):
     def add_connector(self, connector):
         self.connectors.append(connector)
 
+    def remove_connector(self, connector):
+        if connector in self.connectors:
+            self.connectors.remove(connector)
+
     def update_connectors(self):
         for connector in self.connectors:
             connector.update()
@@ -56,8 +88,21 @@ class Draggable(Connectable):
 
     def move(self, dx, dy):
         self.canvas.move(self.tag, dx, dy)
+        self.update_obstacle()
         self.update_connectors()
 
+    def update_obstacle(self):
+        """Let the canvas's Router (if any) know where we are now."""
+        router = getattr(self.canvas, 'router', None)
+        if router is not None:
+            router.update_obstacle(self)
+
+    def remove_obstacle(self):
+        """Let the canvas's Router (if any) know we've been deleted."""
+        router = getattr(self.canvas, 'router', None)
+        if router is not None:
+            router.remove_obstacle(self)
+
     def mouse_start(self, event):
         self._drag_x, self._drag_y = event.x, event.y
 
@@ -85,27 +130,57 @@ class Connector(Drawable):
         self.head.add_connector(self)
         self.tail = tail
         self.tail.add_connector(self)
-        self.line = self.gen_coords(update=True)
-        canvas.create_line(*self.line, tag=self.tag)
+        # Routing waits for the scheduler (if there is one) like any other
+        # redraw, so until then we're a plain elbow.
+        scheduler = getattr(canvas, 'scheduler', None)
+        self.line = self.gen_coords(update=True, route=scheduler is None)
+        self.item = self.create_item('line', *self.line, tag=self.tag)
         self.arrow = Arrowhead(canvas, self)
+        if scheduler is not None and self.routed:
+            scheduler.mark(self)
 
     def update(self):
         """Redraws this Connector based on the new position of its head and
-        tail.
+        tail.  If the canvas has a RedrawScheduler (see scheduler.py) this
+        only marks it dirty, and it's redrawn once Tk is idle however many
+        times it was updated before then.
+        """
+        scheduler = getattr(self.canvas, 'scheduler', None)
+        if scheduler is not None:
+            scheduler.mark(self)
+        else:
+            self.redraw()
+
+    def delete(self):
+        """Take this Connector off the canvas, and out of its ends'
+        connectors.
         """
-        self.canvas.coords(self.tag, *self.gen_coords(update=True))
-        self.arrow.update()
+        self.head.remove_connector(self)
+        self.tail.remove_connector(self)
+        self.release_item(self.item)
+        self.release_item(self.arrow.head)
+        router = getattr(self.canvas, 'router', None)
+        if router is not None:
+            router.remove(self)
+        scheduler = getattr(self.canvas, 'scheduler', None)
+        if scheduler is not None:
+            scheduler.discard(self)
+
+    def redraw(self):
+        self.line = self.gen_coords(update=True)
+        self.canvas.coords(self.item, *self.line)
+        self.arrow.update(self.line)
 
     def closest_inhandle(self, update=False):
         if update:
-            inhandle_to_number = {}
-            for handle in self.head.inhandle:
-                inhandle_to_number[handle] = 0
+            handles = self.head.inhandle
+            outhandle = self.tail.outhandle
+            inhandle_to_number = dict.fromkeys(handles, 0)
             for connector in self.head.connectors:
                 if connector.inhandle in inhandle_to_number and connector.inhandle != self.inhandle:
                     inhandle_to_number[connector.inhandle] += 1
-            self.inhandle = min(self.head.inhandle, key=lambda pt:
-                    self.distance(self.tail.outhandle, pt) + 50 *
+            self.inhandle = min(handles, key=lambda pt:
+                    self.distance(outhandle, pt) + 50 *
                     inhandle_to_number[pt])
         return self.inhandle
 
@@ -113,8 +188,27 @@ class Connector(Drawable):
         (x1, y1), (x2, y2) = point1, point2
         return abs(x1 - x2) + abs(y1 - y2)
 
-    def gen_coords(self, update=False):
-        """Generates a sequence of coordinates for drawing an arrow"""
+    @property
+    def routed(self):
+        """Should this be routed around obstacles?  Only worth it between
+        Draggables, anything else stays inside the Frame it's in.
+        """
+        return getattr(self.canvas, 'router', None) is not None and \
+                (isinstance(self.head, Draggable) or
+                 isinstance(self.tail, Draggable))
+
+    def gen_coords(self, update=False, route=True):
+        """Generates a sequence of coordinates for drawing an arrow.  If
+        route is False a plain elbow is drawn even if we're routed.
+        """
+        if self.routed and route:
+            router = self.canvas.router
+            if update or self not in router.paths:
+                path = router.route(self, self.closest_inhandle(update=update),
+                                    self.tail.outhandle)
+            else:
+                path = router.paths[self]
+            return tuple(coord for point in path for coord in point)
         (x1, y1), (x2, y2) = self.closest_inhandle(update=update), self.tail.outhandle
         return x1, y1, x2, y1, x2, y2
 
@@ -126,25 +220,22 @@ class Arrowhead(Drawable):
     def __init__(self, canvas, conn):
         Drawable.__init__(self, canvas)
         self.conn = conn
-        x, y = self.pos
-        angle = self.angle
-        self.head = self.canvas.create_polygon(*self.gen_coords(x, y, angle))
-
-    def update(self):
-        x, y = self.pos
-        angle = self.angle
-        self.canvas.coords(self.head, *self.gen_coords(x, y, angle))
+        self.head = self.create_item('polygon', *self.place(conn.line))
 
-    @property
-    def pos(self):
-        x, y = self.conn.gen_coords()[0:2]
-        return x, y
+    def update(self, line=None):
+        """Move to the start of the connector's line, which can be passed in
+        if it's already known.
+        """
+        if line is None:
+            line = self.conn.line
+        self.canvas.coords(self.head, *self.place(line))
 
-    @property
-    def angle(self):
-        x1, y1, x2, y2 = self.conn.gen_coords()[0:4]
-        result = math.atan2(y1 - y2, x1 - x2)
-        return result
+    def place(self, line):
+        """The coordinates of an arrowhead at the start of line, pointing
+        along its first segment.
+        """
+        x1, y1, x2, y2 = line[0:4]
+        return self.gen_coords(x1, y1, math.atan2(y1 - y2, x1 - x2))
 
     def gen_coords(self, x, y, angle):
         pts = []
@@ -162,6 +253,7 @@ class Arrowhead(Drawable):
 
 
 if __name__ == '__main__':
+    import tkinter as tk
     master = tk.Tk()
     canvas = tk.Canvas(master, width=600, height=600)
     canvas.pack(fill=tk.BOTH, expand=1)
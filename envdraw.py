@@ -1,128 +1,269 @@
 import ast
-import inspect
-import gc
+import io
+import re
 import sys
-from pprint import pprint
-from examine import *
-
-FUNCTION_TYPE = type(lambda x: 0)
-
-def _get_called_function():
-    frame = inspect.currentframe().f_back.f_back
-    code = frame.f_code
-    global_obs = frame.f_globals
-    for possible in gc.get_referrers(code):
-        if type(possible) == FUNCTION_TYPE:
-            return possible
-
-class AddFuncDef(ast.NodeTransformer):
-    """NodeTransformer for asts which takes each function defintion (either by
-    a def statement or by a lambda expression) and uses the funcdef decorator
-    with the function (as defined in examine.py).
-    """
+from fnmatch import fnmatchcase
 
-    def visit_FunctionDef(self, node):
-        """Perform transformation on def statements.  Simply add the decorator
-        to the function.
-        """
-        self.generic_visit(node)
-        node.decorator_list.insert(0, ast.Name(id='funcdef', ctx=ast.Load()))
-        return node
+# Bump this whenever the instrumentation changes, so code instrumented by an
+# older version isn't picked up from a CodeCache (see codecache.py).
+INSTRUMENTER_VERSION = 9
+# A comment on (or just above) a definition which keeps it from being traced.
+SKIP_MARKER = re.compile(r"#\s*envdraw:\s*skip\b")
 
-    def visit_Lambda(self, node):
-        """Perform transformation on lambda expressions.  Set the value of the
-        lambda to be the result of calling funcdef on the original function.
-        """
-        self.generic_visit(node)
-        new = ast.Call(func=ast.Name(id='funcdef', ctx=ast.Load()), args=[node], keywords=[])
-        return new
+class Instrumenter(ast.NodeTransformer):
+    """NodeTransformer which adds all of the hooks from examine.py in a single
+    pass over the tree.  Every function definition (def statement or lambda)
+    is changed so that:
+
+        def foo(x):
+            return x * x
+    becomes
+        @funcdef()
+        def foo(x):
+            funccall()
+            try:
+                return x * x
+            finally:
+                funcreturn()
+    and
+        lambda y: y * y
+    becomes
+        funcdef()(lambda y: funcreturn((funccall(), y * y)[1]))
+
+    funcdef registers the function, and funccall finds it again from the
+    frame calling it (see examine.FunctionRegistry), as tracers do, so the
+    function's signature is left as it is.  Calling funcreturn from a finally
+    means it runs exactly once however the call ends, by returning or by an
+    exception going by (like a tracer's unwind event), so the Tracker's stack
+    stays in step with Python's.  A lambda can't have a finally, so one that
+    raises is exited once the Tracker notices it's gone (see
+    Tracker.catch_up).  Every yield and yield from is handed its value
+    through funcyield, which tells the Tracker the generator's leaving its
+    frame for now.  If trace_calls is False only funcdef is added, and calls,
+    returns and yields are left to a tracer (see tracer.py).
+
+    Definitions can be left untraced, so they run at full speed:
+        - If include is given, only functions matching one of its patterns
+          are traced
+        - Functions matching one of the patterns in exclude aren't traced
+        - Nor are definitions with a "# envdraw: skip" comment on their line
+          or the line above (skip_lines are the lines with one)
+    Patterns are fnmatch style, matched against the function's name (lambdas
+    are called <lambda>), or against its decorators' names if they start
+    with @ (like "@functools.lru_cache").  Untraced functions get
+    funcdef(False), so they still show up as Function values when they're
+    bound, but nothing inside them is instrumented at all.
 
-    
-class AddFuncReturn(ast.NodeTransformer):
-    """NodeTransformer for asts which takes each return statement and replaces
-    'return expr' with 'return funcreturn(expr)'.
+    funcdef is the innermost decorator, so it's always handed the function
+    the def made rather than whatever its decorators turn it into.  A
+    decorated def gets funcdef(decorated=True), which leaves binding its
+    name to the Tracker's usual syncing of the frame.
     """
-    
-    def visit_Return(self, node):
-        """Take Return node and change the code in the ast from 'return expr'
-        to 'return funcreturn(expr)'
+
+    # Nodes which can't have a function definition anywhere under them, so
+    # there's no need to look.
+    LEAVES = (ast.Name, ast.Constant, ast.expr_context, ast.operator,
+              ast.boolop, ast.unaryop, ast.cmpop, ast.alias, ast.Pass,
+              ast.Break, ast.Continue, ast.Import, ast.ImportFrom,
+              ast.Global, ast.Nonlocal)
+
+    def __init__(self, trace_calls=True, include=None, exclude=None,
+                 skip_lines=()):
+        self.trace_calls = trace_calls
+        self.include = include
+        self.exclude = exclude or ()
+        self.skip_lines = skip_lines
+        self._visitors = {} # Node type -> its visitor, None for leaves
+
+    def visit(self, node):
+        kind = type(node)
+        try:
+            visitor = self._visitors[kind]
+        except KeyError:
+            visitor = None if issubclass(kind, self.LEAVES) else \
+                    getattr(self, 'visit_' + kind.__name__, self.generic_visit)
+            self._visitors[kind] = visitor
+        if visitor is None:
+            return node
+        return visitor(node)
+
+    def generic_visit(self, node):
+        """Like NodeTransformer.generic_visit, but our visitors never remove
+        or add nodes, so children can be replaced where they are.
         """
-        self.generic_visit(node)
-        new = ast.Call(func=ast.Name(id='funcreturn', ctx=ast.Load()), args=[node.value], keywords=[])
-        node.value = new
+        visit = self.visit
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if type(value) is list:
+                for i, item in enumerate(value):
+                    if isinstance(item, ast.AST):
+                        value[i] = visit(item)
+            elif isinstance(value, ast.AST):
+                setattr(node, field, visit(value))
         return node
 
     def visit_FunctionDef(self, node):
-        """Take FunctionDef node and add an additional call to funcreturn at
-        the end, just in case there's no return statement.
-        """
+        first_line = min([node.lineno] +
+                         [d.lineno for d in node.decorator_list])
+        if not self._traced(node.name, node.decorator_list, first_line,
+                            node.lineno):
+            # Decorators and defaults are still run in the enclosing scope.
+            self._visit_fields(node, ('decorator_list', 'args', 'returns'))
+            node.decorator_list.append(self._funcdef(node, False))
+            return node
         self.generic_visit(node)
-        new = ast.Return(value=ast.Call(func=ast.Name(id='funcreturn',
-                                                      ctx=ast.Load()),
-                                        args=[ast.Name(id='None',
-                                                       ctx=ast.Load())],
-                                        keywords=[]))
-        node.body.append(new)
+        node.decorator_list.append(self._funcdef(node))
+        if self.trace_calls:
+            first = node.body[0]
+            exited = _located(ast.Expr(value=_hook(node, 'funcreturn')), node)
+            node.body = [
+                _located(ast.Expr(value=_hook(first, 'funccall')), first),
+                _located(ast.Try(body=node.body, handlers=[], orelse=[],
+                                 finalbody=[exited]), node)]
         return node
 
     def visit_Lambda(self, node):
-        """Perform the equivalent transformation on the result of the lambda
-        statement's evaluation.
-        """
+        if not self._traced('<lambda>', (), node.lineno, node.lineno):
+            self._visit_fields(node, ('args',))
+            return _located(ast.Call(func=_hook(node, 'funcdef',
+                                                _located(ast.Constant(False),
+                                                         node)),
+                                     args=[node], keywords=[]), node)
         self.generic_visit(node)
-        new_body = ast.Call(func=ast.Name(id='funcreturn', ctx=ast.Load()),
-                            args=[node.body], keywords=[])
-        node.body = new_body
-        return node
+        if self.trace_calls:
+            body = node.body
+            started = _located(ast.Subscript(
+                value=_located(ast.Tuple(
+                    elts=[_hook(body, 'funccall'), body],
+                    ctx=ast.Load()), body),
+                slice=_located(ast.Constant(1), body), ctx=ast.Load()), body)
+            node.body = _hook(body, 'funcreturn', started)
+        return _located(ast.Call(func=_hook(node, 'funcdef'), args=[node],
+                                 keywords=[]), node)
 
-class AddFuncCall(ast.NodeTransformer):
-    """Modify function calls to start with a call to funccall."""
-
-    def visit_FunctionDef(self, node):
-        """Insert into the body of the function an initial call to funccall."""
+    def visit_Yield(self, node):
+        """yield expr becomes yield funcyield(expr)."""
         self.generic_visit(node)
-        new = ast.Expr(value=ast.Call(func=ast.Name(id='funccall', ctx=ast.Load()), args=[], keywords=[]))
-        node.body.insert(0, new)
+        if self.trace_calls:
+            value = node.value or _located(ast.Constant(None), node)
+            node.value = _hook(value, 'funcyield', value)
         return node
 
-    def visit_Lambda(self, node):
-        """replace a lambda expression of the form:
-            lambda args: expr
-        with
-            lambda args: (funccall(), expr)[1]
-        To simulate the same effect as calling it at the beginning of the
-        equivalent function definition and reference.
+    visit_YieldFrom = visit_Yield
+
+    def _traced(self, name, decorators, first_line, last_line):
+        """Should the function with the given name and decorators, defined
+        from first_line to last_line, be traced?
         """
-        self.generic_visit(node)
-        call_to_funccall = ast.Call(func=ast.Name(id='funccall',
-                                                  ctx=ast.Load()), args=[],
-                                    keywords=[])
-        tuple_result = ast.Tuple(elts=[call_to_funccall, node.body],
-                                 ctx=ast.Load())
-        replacement = ast.Subscript(value=tuple_result,
-                                    slice=ast.Index(value=ast.Num(n=1)),
-                                    ctx=ast.Load())
-        node.body = replacement
-        return node
+        for line in range(first_line - 1, last_line + 1):
+            if line in self.skip_lines:
+                return False
+        names = [name] + ['@' + _dotted_name(d) for d in decorators]
+        def matches(patterns):
+            return any(fnmatchcase(n, p) for p in patterns for n in names)
+        if self.include is not None and not matches(self.include):
+            return False
+        return not matches(self.exclude)
+
+    def _visit_fields(self, node, fields):
+        for field in fields:
+            value = getattr(node, field, None)
+            if type(value) is list:
+                for i, item in enumerate(value):
+                    value[i] = self.visit(item)
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+
+    def _funcdef(self, node, traced=True):
+        """The funcdef() hook for a def statement, to go last in its
+        decorator list.
+        """
+        args = []
+        if not traced:
+            args.append(_located(ast.Constant(False), node))
+        keywords = []
+        if node.decorator_list:
+            keywords.append(_located(ast.keyword(
+                arg='decorated', value=_located(ast.Constant(True), node)),
+                node))
+        return _located(ast.Call(func=_name(node, 'funcdef'), args=args,
+                                 keywords=keywords), node)
+
+
+def _dotted_name(node):
+    """The name of a decorator, like functools.lru_cache for both
+    @functools.lru_cache and @functools.lru_cache(maxsize=None).
+    """
+    if isinstance(node, ast.Call):
+        return _dotted_name(node.func)
+    if isinstance(node, ast.Attribute):
+        return _dotted_name(node.value) + '.' + node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return ''
 
 
-def envdraw_decorate(orig_ast):
-    orig_ast = AddFuncDef().visit(orig_ast)
-    orig_ast = AddFuncReturn().visit(orig_ast)
-    orig_ast = AddFuncCall().visit(orig_ast)
-    call_to_update = \
-            ast.Expr(value=ast.Call(func=ast.Attribute(value=ast.Name(id='TRACKER',
-                                                                      ctx=ast.Load()),
-                                                       attr='insert_global_bindings',
-                                                       ctx=ast.Load()),
-                                    args=[ast.Call(func=ast.Name(id='locals',
-                                                                 ctx=ast.Load()),
-                                                   args=[], keywords=[])],
-                                    keywords=[]))
-    #orig_ast.body.append(call_to_update)
-    return ast.fix_missing_locations(orig_ast)
+def skip_lines(source):
+    """The lines of source with a "# envdraw: skip" comment."""
+    if 'envdraw:' not in source:
+        return frozenset()
+    import tokenize
+    lines = set()
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type == tokenize.COMMENT and SKIP_MARKER.match(token.string):
+            lines.add(token.start[0])
+    return frozenset(lines)
+
+
+def _located(new, like):
+    """Give a new node the same position as the node it's standing in for.
+    Doing this as nodes are made saves walking the whole tree again with
+    ast.fix_missing_locations.
+    """
+    new.lineno, new.col_offset = like.lineno, like.col_offset
+    new.end_lineno, new.end_col_offset = like.end_lineno, like.end_col_offset
+    return new
+
+
+def _name(like, name):
+    return _located(ast.Name(id=name, ctx=ast.Load()), like)
+
+
+def _hook(like, name, *args):
+    """A call to the hook with the given name."""
+    return _located(ast.Call(func=_name(like, name), args=list(args),
+                             keywords=[]), like)
+
+
+def envdraw_decorate(orig_ast, trace_calls=True, include=None, exclude=None,
+                     source=None, sync_globals=False):
+    """Instrument the given ast for EnvDraw.  If trace_calls is False, only
+    function definitions are hooked and calls and returns are left to a
+    tracer (see tracer.py).  Functions are picked for tracing with include
+    and exclude (see Instrumenter), and "# envdraw: skip" comments are only
+    looked for if the source is given.  If sync_globals is True, every top
+    level statement is followed by a call to globalstep(globals()), which
+    brings the global frame up to date.
+    """
+    skipped = skip_lines(source) if source is not None else ()
+    orig_ast = Instrumenter(trace_calls, include, exclude,
+                            skipped).visit(orig_ast)
+    if sync_globals:
+        body = []
+        for statement in orig_ast.body:
+            body.append(statement)
+            # Nothing but more of them can come before a __future__ import.
+            if not isinstance(statement, ast.ImportFrom) or \
+                    statement.module != '__future__':
+                body.append(_located(ast.Expr(value=_hook(
+                    statement, 'globalstep', _located(ast.Call(
+                        func=_name(statement, 'globals'), args=[],
+                        keywords=[]), statement))), statement))
+        orig_ast.body = body
+    return orig_ast
 
 if __name__ == '__main__':
+    from pprint import pprint
     tree = ast.parse(open(sys.argv[1]).read())
     new_tree = envdraw_decorate(tree)
     pprint(ast.dump(new_tree))
@@ -1,96 +1,300 @@
 #! /usr/bin/env python3
 
-import inspect, gc
-from envdraw import *
-from components import *
-from util import *
-from pprint import pprint
-import tkinter as tk
-import random
+import dis
 import sys
 
+import model
+from brief import fingerprint
+from codecache import CodeCache
+from tracer import GENERATOR_FLAGS, get_tracer
+
+# Anything only needed to instrument code (ast, envdraw) or to draw (tkinter,
+# renderer) is imported when it's first used, so that importing this module
+# and starting a headless run stays quick.  See benchmarks/import_time.py.
+# dis isn't: a generator can be exited by the garbage collector as the
+# interpreter shuts down, when importing it would fail.
 
 FUNCTION_TYPE = type(lambda x: 0)
+MODULE_TYPE = type(sys)
+# Values of these types can't change without being rebound, so there's no
+# need to fingerprint them to notice them changing.
+IMMUTABLE_TYPES = frozenset((int, float, complex, bool, str, bytes,
+                             type(None), range))
+# Opcodes which rebind a free or global variable.
+REBINDING_OPS = frozenset(('STORE_DEREF', 'DELETE_DEREF', 'STORE_GLOBAL',
+                           'DELETE_GLOBAL'))
+_rebound_cache = {}
+_names_cache = {}
+# Instrumented code of the programs we've run, see codecache.py.
+CODE_CACHE = CodeCache()
+
+
+def _rebound_names(code):
+    """The free variables and the global variables (those declared nonlocal
+    or global) that the given code object assigns to, as a pair of tuples.
+    Anything else it only reads, so its binding can't have changed by the
+    time it returns.
+    """
+    names = _rebound_cache.get(code)
+    if names is None:
+        freevars, globalvars = [], []
+        for instr in dis.get_instructions(code):
+            if instr.opname not in REBINDING_OPS:
+                continue
+            if instr.opname.endswith('_GLOBAL'):
+                found = globalvars
+            elif instr.argval in code.co_freevars:
+                found = freevars
+            else:
+                continue # A cell variable, which is local
+            if instr.argval not in found:
+                found.append(instr.argval)
+        names = _rebound_cache[code] = tuple(freevars), tuple(globalvars)
+    return names
+
+
+def _global_names(code):
+    """Every name the given code object (or any code nested in it, such as a
+    comprehension's) could look up as a global, as a frozenset.  It's a
+    superset: attribute names are in there too.
+    """
+    names = _names_cache.get(code)
+    if names is None:
+        names = set(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, type(code)):
+                names |= _global_names(const)
+        names = _names_cache[code] = frozenset(names)
+    return names
+
+
+def _unwrap(fn):
+    """The function fn wraps if it's been decorated with something like
+    functools.lru_cache (which doesn't have a __code__ of its own), otherwise
+    fn itself.  Like inspect.unwrap, without needing inspect.
+    """
+    while not hasattr(fn, '__code__') and hasattr(fn, '__wrapped__'):
+        fn = fn.__wrapped__
+    return fn
+
+
+class FunctionRegistry(object):
+    """Maps code objects to the function objects that were created from them.
+
+    Every function in the instrumented program passes through funcdef when it
+    is created, so we can record it there and later find the function being
+    called from its frame without scanning the heap (which is what
+    gc.get_referrers did, making every call O(live objects)).
+
+    Several closures can share a single code object (think of a def nested in
+    another function that's called more than once), and nothing in their
+    frames tells them apart: comparing free variables can't, since two
+    closures can hold equal ones (or none at all).  So register gives every
+    function made from a code object after the first a copy of the code of
+    its own, and each code object maps to just the one function.  The copies
+    compare equal to the original, so code objects are looked up by their
+    id; the function keeps its code alive, so the id can't be reused while
+    it's registered.
+    """
 
+    def __init__(self):
+        self._by_code = {} # id(code) -> the function made from it
 
-def _get_called_function():
-    frame = inspect.currentframe().f_back.f_back
-    code = frame.f_code
-    global_obs = frame.f_globals
-    for possible in gc.get_referrers(code):
-        if type(possible) == FUNCTION_TYPE:
-            return possible
+    def register(self, fn):
+        """Remember that fn was created from its code object, giving it a
+        copy of the code if another function already was.  funcdef hands
+        over the function a def made before any decorators get to it, so its
+        code is always the definition's.
+        """
+        code = fn.__code__
+        if id(code) in self._by_code:
+            fn.__code__ = code = code.replace()
+        self._by_code[id(code)] = fn
+
+    def lookup(self, py_fr):
+        """Find the function whose body is being run by the given Python
+        frame, or None if we never saw it defined.
+        """
+        fn = self._by_code.get(id(py_fr.f_code))
+        if fn is None or fn.__code__ is not py_fr.f_code:
+            # Its __code__ has been replaced since.
+            return None
+        return fn
 
 
-def funcdef(func):
+def funcdef(traced=True, decorated=False):
     """This is called on a function when it is first created (lambda or def
-    statement).  This leads to transformations of for def statements where
+    statement).  Functions which aren't traced (see envdraw.Instrumenter) are
+    still drawn, but left out of the registry so tracers ignore their calls.
+    A decorated def's name is bound to whatever the decorators make of the
+    function, so it's picked up when the frame is next synced rather than
+    bound here.
+    This leads to transformations of for def statements where
         def foo(x):
             return x * x
     becomes
-        @funcdef
+        @funcdef()
         def foo(x):
             return x * x
     and, for lambdas,
         x = lambda y: y * y
     becomes
-        x = funcdef(lambda y: y * y)
+        x = funcdef()(lambda y: y * y)
 
     Arguments:
-        func -- The function we're decorating in the inputted code.
+        traced -- Whether calls to the function are traced.
+        decorated -- Whether the def has decorators (applied after this).
     """
-    funcdef.tracker.defined_function(func)
-    debug_print('def:', func)
-    return func
+    def define(func):
+        tracker = funcdef.tracker
+        if tracker.paused:
+            return func
+        if traced:
+            tracker.registry.register(func)
+        if tracker.recorded and not tracker.recorded[-1]:
+            # Defined in a call sampling left out, which the function needs
+            # as its parent.
+            tracker.record_late(sys._getframe(1))
+        tracker.defined_function(func, sys._getframe(1), bind=not decorated)
+        return func
+    return define
 
 
 def funccall():
-    """This is inserted as a call before the body of a function."""
-    fn = _get_called_function()
-    debug_print("making a new frame for function call to ", fn)
-    funccall.tracker.enter_function(fn)
+    """This is inserted as a call before the body of a function.  The
+    function being called is found from the frame calling this (see
+    FunctionRegistry).
+    """
+    tracker = funccall.tracker
+    if tracker.paused:
+        return
+    py_fr = sys._getframe(1)
+    fn = tracker.registry.lookup(py_fr)
+    if fn is None:
+        # Defined while the Tracker was paused, so never registered.
+        return
+    if tracker.sampler is not None and not tracker.sample_call():
+        return
+    tracker.enter_function(fn, py_fr)
+
+
+def funcreturn(val=None):
+    """Called whenever the program exits a function, however it does, from a
+    finally wrapped around the function's body (see envdraw.Instrumenter):
 
+        try:
+            <body>
+        finally:
+            funcreturn()
 
-def funcreturn(val):
-    """Used as a replacement for any locations in a function where the program
-    exits the function (either at a return or at the end of the suite).
-    Essentially we do transformations like:
+    A lambda's body can't have a finally, so there it wraps the body instead,
+    and is handed the value it returns.  A lambda which raises is exited by
+    the next hook to notice it's gone (see Tracker.catch_up).
 
-        return expr --> return funcreturn(expr)
-    
     Arguments:
         val -- the value you'd normally return.
     """
-    py_fr = inspect.currentframe().f_back
-    fn = _get_called_function()
-    try:
-        fn = fn.orig
-    except:
-        pass
-    debug_print(fn.__closure__)
-    debug_print('returning from', fn)
-    funcreturn.tracker.exit_function(fn, py_fr)
-    debug_print('return:', val)
+    tracker = funcreturn.tracker
+    if tracker.paused:
+        return val
+    if tracker.sampler is None or tracker.sample_return():
+        tracker.exit_function(sys._getframe(1))
     return val
 
 
-class Tracker(object):
+def funcyield(val=None):
+    """Called just before a generator yields, as in
 
-    def __init__(self):
-        # Set up canvas
-        self.canvas = tk.Canvas(tk.Tk(), width=800, height=600)
-        self.canvas.pack(fill=tk.BOTH, expand=1)
+        yield expr --> yield funcyield(expr)
 
-        # Set up call_stack with global frame
-        x, y = self.place()
-        self.call_stack = [Frame(self.canvas, x, y, globe=True)]
+    (and likewise for yield from).  Its frame stops being the current one
+    until it carries on, which the Tracker notices from the next hook called
+    in it.
+
+    Arguments:
+        val -- the value you'd normally yield.
+    """
+    tracker = funcyield.tracker
+    if not tracker.paused:
+        tracker.suspend_function(sys._getframe(1))
+    return val
+
+
+def globalstep(f_globals):
+    """Called after every statement at the top level of the program (see
+    envdraw.envdraw_decorate), with its globals.  A function returning only
+    syncs the globals it assigns to, so this brings the whole global frame
+    up to date: with what the statement bound itself, and with anything the
+    calls it made changed some other way.
+    """
+    tracker = globalstep.tracker
+    if not tracker.paused:
+        # Nothing's running between top level statements: any frame still
+        # on the stack raised (or yielded) without the Tracker noticing.
+        tracker.catch_up(None)
+        tracker.insert_global_bindings(f_globals)
+
+
+class Tracker(object):
+    """Records the environment model of the program as it runs.
+
+    The Tracker only builds the model (see model.py).  Any renderers it's
+    given (like renderer.TkRenderer or tracefile.TraceWriter) are told about
+    each change to the model so they can draw or record it.  Without one, the
+    Tracker runs headless and never touches Tk.
+
+    Each renderer gets the following calls:
+        frame_created(frame)
+        function_created(function)
+        binding_added(frame, name, value)
+        binding_updated(frame, name, value)
+        frame_exited(frame)
+
+    Given a sampler (see sampling.py), only the calls it picks are recorded.
+    The hooks and tracers ask sample_call before a call and sample_return
+    when it returns, and leave the Tracker out of any call it wasn't to
+    record.
+
+    If names_used is set to a set, the names every function entered could
+    look up as globals are added to it, so whoever set it (see
+    interactive.py) knows which globals a call could have changed.
+
+    Binding a value can run the program's own code: its __repr__ (to
+    fingerprint it, see brief.py), __eq__, __hash__ or __getattr__.  While
+    it does, paused is True, and the hooks and tracers ignore whatever that
+    code calls, rather than recording (and binding the values of) calls made
+    on the Tracker's behalf, which would go on to bind the same values again.
+    run() pauses the Tracker for good once the program's finished, since
+    drawing (or printing) a value afterwards can run its __repr__ too.
+    """
+
+    def __init__(self, *renderers, sampler=None):
+        self.renderers = list(renderers)
+        self.sampler = sampler
+        # Whether each call on the Python call stack (of traced functions) is
+        # being recorded, only kept while sampling.
+        self.recorded = []
+
+        # Set up call_stack with global frame, and remember every frame ever
+        # made so the whole model can be inspected after the run.
+        self.call_stack = [model.Frame()]
+        # The Python frame running each frame on the call stack (None for the
+        # global frame).
+        self.py_frames = [None]
+        # Frames of generators which have yielded, by their Python frame.
+        self.suspended = {}
+        self.frames = [self.global_frame]
+        self._notify('frame_created', self.global_frame)
 
         # Keep a directory of Function objects in case we need to re-use.
         # There's an assumption here that the function will be defined by the
         # time we need to bind something to it, which when you think about it,
         # HAS to be true :P
         self.functions = {}
-        self.static_links = {}
+        self.registry = FunctionRegistry()
+        # Globals the functions entered use, only collected when it's a set.
+        self.names_used = None
+        self.paused = False
 
     @property
     def current_frame(self):
@@ -100,60 +304,214 @@ class Tracker(object):
     def global_frame(self):
         return self.call_stack[0]
 
-    def defined_function(self, fn):
-        """We've defined the given function, now draw it in the current
+    def defined_function(self, fn, py_fr, bind=True):
+        """We've defined the given function, now add it to the current
         frame.
 
         Arguments:
             fn -- The function value that was just created in the current
             frame.
+            py_fr -- The Python frame it was created in.
+            bind -- Whether to bind it to its name there.
 
         TODO: Needs to handle lambdas correctly (currently it adds an incorrect
         variable binding since it doesn't differentiate between creation of the
         function object and binding it to a variable).
         """
-        x, y = self.place()
-        fn_tk = Function(self.canvas, x, y, fn.__name__,
-                         inspect.getargspec(fn).args, self.current_frame)
-        if fn.__name__ != "<lambda>": # TODO: Kind of a hack
-            self.current_frame.add_binding(fn.__name__, fn_tk)
-        self.functions[fn] = fn_tk
-        self.static_links[fn] = self.current_frame
-
-    def enter_function(self, fn):
-        x, y = self.place()
-        self.call_stack.append(Frame(self.canvas, x, y,
-                                     extended_frame=self.static_links[fn]))
-
-    def exit_function(self, fn, py_fr):
-        frame = self.current_frame
-        local_vars = { var : py_fr.f_locals[var] for var in \
-                      py_fr.f_code.co_varnames }
-        nonlocal_varnames = [ var for var in py_fr.f_locals.keys() if var not \
-                             in local_vars.keys() ]
-        nonlocal_vars = { var : py_fr.f_locals[var] for var in \
-                         nonlocal_varnames }
-        for var, val in py_fr.f_globals.items():
-            if var not in nonlocal_vars:
-                nonlocal_vars[var] = val
-        # For current local variables
-        for var, val in local_vars.items():
-            if not self._should_clean(var, val):
-                if type(val) != FUNCTION_TYPE:
-                    diag_val = Value(self.canvas, self.current_frame, val)
-                else:
-                    diag_val = self.functions[val]
-                frame.add_binding(var, diag_val)
-        # For nonlocal variables
-        for var, val in nonlocal_vars.items():
-            if not self._should_clean(var, val):
-                if type(val) != FUNCTION_TYPE:
-                    diag_val = Value(self.canvas, self.current_frame, val)
-                else:
-                    diag_val = self.functions[val]
-                frame.update_binding(var, diag_val)
-        debug_print("CALL STACK POP", fn)
+        self.catch_up(py_fr)
+        code = fn.__code__
+        function = model.Function(fn.__name__,
+                                  list(code.co_varnames[:code.co_argcount]),
+                                  self.current_frame, fn)
+        self.functions[fn] = function
+        self._notify('function_created', function)
+        if bind and fn.__name__ != "<lambda>": # TODO: Kind of a hack
+            self.bind(self.current_frame, fn.__name__, function)
+
+    def sample_call(self):
+        """A traced function is being called: should the call be recorded?"""
+        recording = self.sampler.sample(len(self.recorded) + 1)
+        self.recorded.append(recording)
+        return recording
+
+    def sample_return(self):
+        """A traced function is returning: was the call recorded?"""
+        return self.recorded.pop()
+
+    def record_late(self, py_fr):
+        """Record the call running in the given Python frame after all, as if
+        the sampler had picked it (it's defining a function).
+        """
+        fn = self.registry.lookup(py_fr)
+        if fn is not None:
+            self.recorded[-1] = True
+            self.enter_function(fn, py_fr)
+
+    def enter_function(self, fn, py_fr):
+        """The function fn is being called, and running in the given Python
+        frame.
+        """
+        self.catch_up(py_fr.f_back)
+        function = self.functions[fn]
+        frame = model.Frame(parent=function.parent, function=function,
+                            depth=len(self.call_stack),
+                            sampled=self.sampler is not None)
+        self.call_stack.append(frame)
+        self.py_frames.append(py_fr)
+        self.frames.append(frame)
+        if self.names_used is not None:
+            self.names_used |= _global_names(fn.__code__)
+        self._notify('frame_created', frame)
+
+    def exit_function(self, py_fr):
+        """The function running in the given Python frame is returning, or
+        an exception is leaving it.  Nothing happens if it isn't on the call
+        stack (it's already been exited, say).
+        """
+        self.catch_up(py_fr)
+        if self.py_frames[-1] is py_fr:
+            self._pop(exited=True)
+
+    def suspend_function(self, py_fr):
+        """The generator running in the given Python frame is yielding."""
+        self.catch_up(py_fr)
+        if self.py_frames[-1] is py_fr:
+            self._pop(exited=False)
+
+    def resume_function(self, py_fr):
+        """The generator running in the given Python frame is carrying on
+        after a yield.
+        """
+        self.catch_up(py_fr)
+
+    def catch_up(self, py_fr):
+        """Bring the call stack into step with Python's, as seen from the
+        given Python frame (None for once nothing's running).  Frames whose
+        call has finished without the Tracker being told (a lambda which
+        raised, on the ast backend) are exited, those of generators which
+        have yielded are suspended, and if py_fr is a suspended generator's
+        it's put back on the stack.  Frames Python is still running are left
+        alone, whether or not they're on the stack (sampling can leave calls
+        out).  Usually the stack's already in step, and this costs a
+        comparison.
+        """
+        top = self.py_frames[-1]
+        if top is py_fr:
+            return
+        if py_fr in self.suspended:
+            self.catch_up(py_fr.f_back)
+            frame = self.suspended.pop(py_fr)
+            self.call_stack.append(frame)
+            self.py_frames.append(py_fr)
+            return
+        if top is None:
+            return
+        running = set()
+        while py_fr is not None:
+            if py_fr is top:
+                return
+            running.add(py_fr)
+            py_fr = py_fr.f_back
+        while self.py_frames[-1] is not None and \
+                self.py_frames[-1] not in running:
+            gone = self.py_frames[-1]
+            self._pop(exited=not gone.f_code.co_flags & GENERATOR_FLAGS)
+
+    def _pop(self, exited):
+        """Take the current frame off the call stack, once its bindings have
+        been brought up to date.  It's exited, or else suspended (it's a
+        generator's, and has yielded).
+        """
+        frame, py_fr = self.current_frame, self.py_frames[-1]
+        paused, self.paused = self.paused, True
+        try:
+            self._sync_frame(frame, py_fr.f_code, py_fr.f_locals,
+                             py_fr.f_globals)
+        finally:
+            self.paused = paused
         self.call_stack.pop()
+        self.py_frames.pop()
+        if exited:
+            self._notify('frame_exited', frame)
+        else:
+            self.suspended[py_fr] = frame
+
+    def _sync_frame(self, frame, code, f_locals, f_globals):
+        """Bring the bindings a function running code could have changed up
+        to date: its locals in frame, and any nonlocals and globals.
+        """
+        # For current local variables
+        for var in code.co_varnames + code.co_cellvars:
+            if var in f_locals:
+                val = f_locals[var]
+                if not self._should_clean(var, val):
+                    self.bind(frame, var, self._model_value(val))
+        # For nonlocal and global variables.  Only the ones this function
+        # could have rebound, and only if they actually changed.  Globals
+        # changed some other way (mutated through an argument, say) are
+        # picked up after the top level statement running (see globalstep).
+        freevars, globalvars = _rebound_names(code)
+        for var in freevars:
+            if var in f_locals:
+                owner = frame.lookup(var) or frame.parent
+                self._sync(owner, var, f_locals[var])
+        for var in globalvars:
+            if var in f_globals:
+                self._sync(self.global_frame, var, f_globals[var])
+
+    def bind(self, frame, name, value):
+        """Bind name to value in the given frame, replacing any previous
+        binding of name in that frame.
+        """
+        updating = name in frame.bindings
+        frame.bindings[name] = value
+        if updating:
+            self._notify('binding_updated', frame, name, value)
+        else:
+            self._notify('binding_added', frame, name, value)
+
+    def _notify(self, event, *args):
+        """Tell every renderer about a change to the model."""
+        for renderer in self.renderers:
+            getattr(renderer, event)(*args)
+
+    def _function(self, val):
+        """The Function in the model for the given Python value, if it's a
+        function we saw defined or something like functools.lru_cache's
+        wrapper around one.  Otherwise None.
+        """
+        if type(val) != FUNCTION_TYPE:
+            if not callable(val) or not hasattr(val, '__wrapped__'):
+                return None
+            val = _unwrap(val)
+        try:
+            return self.functions.get(val)
+        except TypeError: # Unhashable
+            return None
+
+    def _model_value(self, val):
+        """The model object to bind for the given Python value."""
+        function = self._function(val)
+        if function is not None:
+            return function
+        if type(val) in IMMUTABLE_TYPES:
+            return model.Value(val)
+        return model.Value(val, snapshot=fingerprint(val))
+
+    def _sync(self, frame, name, val):
+        """Bind name to val in frame, unless it's already bound to that very
+        object and the object hasn't changed since.
+        """
+        if self._should_clean(name, val):
+            return
+        old = frame.bindings.get(name)
+        if isinstance(old, model.Function):
+            if self._function(val) is old:
+                return
+        elif old is not None and old.obj is val:
+            if old.snapshot is None or old.snapshot == fingerprint(val):
+                return
+        self.bind(frame, name, self._model_value(val))
 
     def _should_clean(self, key, value):
         """Should this key and value in some environment be cleaned out of the
@@ -161,76 +519,247 @@ class Tracker(object):
         """
         return key.startswith("__") or \
                 key in IGNORE_VARS or \
-                inspect.ismodule(value) or \
+                isinstance(value, MODULE_TYPE) or \
                 getattr(value, "__module__", None) in IGNORE_MODULES
 
-    def insert_global_bindings(self, global_vals):
+    def insert_global_bindings(self, global_vals, names=None):
         """THIS IS A HACK... WE NEED A BETTER WAY TO TRACK UPDATES AND FILL IN
         GLOBAL/NONLOCAL FRAMES (tmagrino).
+
+        If names is given, only those names are looked at (the ones something
+        could have changed), rather than everything in global_vals.
         """
-        for var, val in global_vals.items():
-            if not self._should_clean(var, val):
-                if type(val) != FUNCTION_TYPE:
-                    diag_val = Value(self.canvas, self.global_frame, val)
-                else:
-                    diag_val = self.functions[val]
-                self.global_frame.add_binding(var, diag_val)
-
-    def place(self):
-        """Find an available space to place a new item on the GUI canvas."""
-        if len(self.canvas.find_all()) == 0:
-            return 50, 50
-        x, y = random.randint(50, 600), random.randint(50, 500)
-        x, y = x//10*10, y//10*10
-        attempts = 0
-        while len(self.canvas.find_overlapping(x-10, y-10, x+160, y+80)) > 0:
-            if attempts > 30:
-                break
-            x, y = random.randint(50, 650), random.randint(50, 500)
-            x, y = x//10*10, y//10*10
-            attempts += 1
-        return x, y
+        paused, self.paused = self.paused, True
+        try:
+            if names is None:
+                names = list(global_vals)
+            for var in names:
+                if var in global_vals:
+                    self._sync(self.global_frame, var, global_vals[var])
+        finally:
+            self.paused = paused
 
 
 # TODO: UGLY UGLY UGLY, should be handled differently.  Could probably make the
 # three functions associated with an instance of the Tracker class and could be
 # given to the ast NodeTransformers to be used?  Problem there is that we still
 # need an identifier for the way we currently pull that off.
-def run(input_file, additional_ignore_vars=None, wait=True):
+def run(input_file, additional_ignore_vars=None, wait=True, backend="ast",
+        headless=False, trace_file=None, recursion_budget=8, image_file=None,
+        cache_dir=None, include=None, exclude=None, step=False, prune=False,
+        counters=False, counters_file=None, sampler=None):
+    """Run the program in input_file, drawing its environment diagram, and
+    return the Tracker holding its environment model.
+
+    Arguments:
+        headless -- Only record the environment model, without drawing it (or
+        importing tkinter at all).
+        trace_file -- If given, a path to record every change to the model
+        to, for replaying later (see tracefile.py and replay.py).
+        image_file -- If given, a path to save the final diagram to, as SVG
+        (or PostScript if it ends in .ps or .eps).  This is drawn without Tk,
+        so it works headless too.
+        cache_dir -- If given, a directory to keep instrumented code in
+        between runs, as well as in memory.
+        include, exclude -- Patterns picking which functions to trace, the
+        rest run uninstrumented (see envdraw.Instrumenter).
+        recursion_budget -- How many Frames of a recursive function to draw
+        in a row before collapsing the rest (None to draw them all).
+        prune -- Take returned frames off the diagram once nothing left on it
+        can reach them (see renderer.TkRenderer).
+        counters -- Count and time the calls to the hooks, the Tracker, the
+        renderers and so on (see counters.py), and print a summary to stderr
+        once the program has run.
+        counters_file -- If given, a path to save the counts and times to as
+        JSON (this turns on counters too).
+        sampler -- If given, a sampling.Sampler picking which calls to record,
+        for programs making too many for all of them to be.
+        step -- Keep every step of the run in memory (see history.py) and,
+        unless headless, show it with a slider to step back and forth through
+        rather than drawing it as it runs.  The History is the Tracker's
+        history attribute.
+        backend -- How calls and returns are detected: "ast" rewrites every
+        function body to call the funccall/funcreturn hooks, "monitoring" and
+        "settrace" use the interpreter's tracing support (see tracer.py).
+    """
     # TODO: Oh god there's so much wrong and sins here.
     global TRACKER, IGNORE_VARS
-    old_ignore_vars = IGNORE_VARS
-    if additional_ignore_vars:
-        IGNORE_VARS = IGNORE_VARS.union(set(additional_ignore_vars))
-    TRACKER = Tracker()
+    renderers = []
+    if not headless and not step:
+        from renderer import TkRenderer
+        renderers.append(TkRenderer(recursion_budget=recursion_budget,
+                                    prune=prune))
+    if step:
+        from history import History
+        history = History()
+        renderers.append(history)
+    if trace_file is not None:
+        from tracefile import TraceWriter
+        writer = TraceWriter(trace_file)
+        renderers.append(writer)
+    if image_file is not None:
+        from renderer import TkRenderer
+        from vectorcanvas import VectorCanvas
+        image = TkRenderer(VectorCanvas(), recursion_budget=recursion_budget,
+                           prune=prune)
+        renderers.append(image)
+    if counters or counters_file is not None:
+        from counters import Counters
+        counted = Counters()
+        counted.install({'examine': sys.modules[__name__]})
+    TRACKER = Tracker(*renderers, sampler=sampler)
+    TRACKER.history = history if step else None
     funcdef.tracker = TRACKER
     funcreturn.tracker = TRACKER
     funccall.tracker = TRACKER
-
-    tree = ast.parse(open(input_file).read(), filename=input_file)
-    new_tree = envdraw_decorate(tree)
-    exec_globals = locals()
-    for k, v in globals().items():
-        exec_globals[k] = v
-    IGNORE_VARS = IGNORE_VARS.union(set(locals()))
-    exec(compile(new_tree, input_file, 'exec'), exec_globals, locals())
+    funcyield.tracker = TRACKER
+    globalstep.tracker = TRACKER
+
+    with open(input_file) as f:
+        source = f.read()
+    tracer = get_tracer(backend, TRACKER)
+    # Set every time, so a run without a cache_dir doesn't write to the one
+    # an earlier run was given.
+    CODE_CACHE.directory = cache_dir
+    code = CODE_CACHE.compile(source, input_file, trace_calls=tracer is None,
+                              include=include, exclude=exclude,
+                              sync_globals=True)
+    # The program gets a namespace of its own, as if it were run as a
+    # script, holding nothing else but the hooks it's been instrumented to
+    # call.
+    exec_globals = {var: globals()[var] for var in IGNORE_VARS}
+    exec_globals.update(__name__='__main__', __file__=input_file)
+    old_ignore_vars = IGNORE_VARS
+    if additional_ignore_vars:
+        IGNORE_VARS = IGNORE_VARS.union(additional_ignore_vars)
+    try:
+        if tracer is None:
+            exec(code, exec_globals)
+        else:
+            with tracer:
+                exec(code, exec_globals)
+        # Module level bindings aren't picked up by any function returning.
+        TRACKER.insert_global_bindings(exec_globals)
+        TRACKER.paused = True
+        if image_file is not None:
+            image.canvas.save(image_file)
+    finally:
+        IGNORE_VARS = old_ignore_vars
+        if trace_file is not None:
+            writer.close()
+        if counters or counters_file is not None:
+            counted.uninstall()
+            counted.report()
+            if counters_file is not None:
+                counted.dump(counters_file)
+    if step and not headless:
+        import tkinter
+        from replay import ReplayViewer
+        ReplayViewer(history, recursion_budget=recursion_budget,
+                     prune=prune)
+        if wait:
+            tkinter.mainloop()
     # TODO: Is there a better way to wait for the user to quit, using Tk?
-    if wait:
+    elif wait and not headless:
         try:
             input()
         except EOFError:
             pass
-
-    IGNORE_VARS = old_ignore_vars
+    return TRACKER
+
+
+def main():
+    import argparse
+
+    def at_least(minimum, kind=int):
+        """An argparse type for numbers no smaller than minimum."""
+        def parse(text):
+            try:
+                value = kind(text)
+            except ValueError:
+                raise argparse.ArgumentTypeError(
+                        "invalid number: {0!r}".format(text))
+            if value < minimum:
+                raise argparse.ArgumentTypeError(
+                        "must be at least {0}, not {1}".format(minimum,
+                                                              value))
+            return value
+        return parse
+
+    parser = argparse.ArgumentParser(
+            description="Draw the environment diagram of a Python program.")
+    parser.add_argument("file", help="the program to run")
+    parser.add_argument("--backend", default="ast",
+                        choices=("ast", "monitoring", "settrace"),
+                        help="how function calls and returns are detected")
+    parser.add_argument("--headless", action="store_true",
+                        help="don't draw anything")
+    parser.add_argument("--trace", metavar="TRACE_FILE",
+                        help="record the run for replay.py")
+    parser.add_argument("--image", metavar="IMAGE_FILE",
+                        help="save the diagram as SVG (or PostScript, if "
+                        "IMAGE_FILE ends in .ps or .eps)")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                        help="only trace functions matching PATTERN (a name "
+                        "or @decorator, may be given more than once)")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                        help="don't trace functions matching PATTERN")
+    parser.add_argument("--step", action="store_true",
+                        help="step back and forth through the run with a "
+                        "slider once it's finished")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="keep instrumented code in DIR between runs")
+    parser.add_argument("--recursion-budget", type=at_least(0), default=8,
+                        metavar="N", help="collapse recursive calls deeper "
+                        "than N frames (0 to never collapse)")
+    parser.add_argument("--prune", action="store_true",
+                        help="take returned frames off the diagram once "
+                        "nothing on it can reach them")
+    parser.add_argument("--sample-every", type=at_least(1), default=1,
+                        metavar="N",
+                        help="only record every Nth call")
+    parser.add_argument("--min-depth", type=at_least(1), metavar="N",
+                        help="only record calls at least N deep")
+    parser.add_argument("--max-depth", type=at_least(1), metavar="N",
+                        help="only record calls at most N deep")
+    parser.add_argument("--max-rate", type=at_least(1, float), metavar="K",
+                        help="record at most K calls a second")
+    parser.add_argument("--counters", action="store_true",
+                        help="print how often envdraw's own functions were "
+                        "called and how long they took")
+    parser.add_argument("--counters-file", metavar="FILE",
+                        help="save those counts and times to FILE as JSON")
+    args = parser.parse_args()
+    sampler = None
+    if args.sample_every > 1 or args.min_depth is not None or \
+            args.max_depth is not None or args.max_rate is not None:
+        from sampling import Sampler
+        try:
+            sampler = Sampler(args.sample_every, args.min_depth,
+                              args.max_depth, args.max_rate)
+        except ValueError as e:
+            parser.error(str(e))
+    run(args.file, backend=args.backend, headless=args.headless,
+        trace_file=args.trace, image_file=args.image,
+        cache_dir=args.cache_dir, include=args.include,
+        exclude=args.exclude, step=args.step, prune=args.prune,
+        counters=args.counters, counters_file=args.counters_file,
+        sampler=sampler,
+        recursion_budget=args.recursion_budget or None)
 
 # TODO: So bad, this is so bad, whyyyyyyyyy.
 TRACKER = None
-# TODO: This and IGNORE_VARS are both redundant and could be better done as a
-# dynamically generated set of values.
+# TODO: This is redundant and could be better done as a dynamically generated
+# set of values.
 IGNORE_MODULES = {"envdraw", "drawable", "inspect", "code", "locale",
                   "encodings.utf_8", "codecs", "ast", "_ast", "rewrite",
-                  "envdraw", "tkinter", "_functools", "_heapq", "util"}
-IGNORE_VARS = set(locals().keys()).union(set(["IGNORE_VARS"]))
+                  "envdraw", "tkinter", "_functools", "_heapq",
+                  "tracer", "model", "renderer", "components",
+                  "tracefile", "vectorcanvas", "codecache", "brief"}
+# The hooks instrumented code calls, which are put in the namespace of the
+# program being run (or the console), and never drawn.
+IGNORE_VARS = frozenset(("funcdef", "funccall", "funcreturn", "funcyield",
+                         "globalstep"))
 
 if __name__ == '__main__':
-    run(sys.argv[1])
+    main()
@@ -0,0 +1,328 @@
+"""history.py
+
+Every step of a run kept in memory, so the diagram can be stepped back and
+forth through (see replay.py) without writing a trace file.
+
+A History is a renderer (see examine.Tracker) which commits a snapshot of the
+model after every change the Tracker makes to it.  The bindings live in
+persistent maps (PMap, a hash array mapped trie): a map is never changed, and
+setting a key makes a new map sharing everything with the old one except the
+path down to that key.  So a snapshot costs memory in proportion to what
+changed in that step, O(log n) of it, and any step's bindings can be looked
+up straight away, without replaying the steps before it.  Frames, functions
+and exits are only ever added to, so for those a snapshot just remembers how
+many there were.
+
+Like a trace, bound values are kept as the text that was displayed for them
+(their brief, see brief.py), since the objects themselves may well have
+changed since.
+"""
+
+import brief
+import model
+from tracefile import TraceState
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+
+
+def _hash(key):
+    return hash(key) & ((1 << _HASH_BITS) - 1)
+
+
+def _bit_count(n):
+    return bin(n).count("1")
+
+
+class _Node(object):
+    """A trie node: bitmap says which of the 32 slots for the next _BITS
+    bits of the hash are used, and slots holds them in order.  A slot is
+    either a (hash, key, value) leaf or another node.
+    """
+
+    __slots__ = ("bitmap", "slots")
+
+    def __init__(self, bitmap, slots):
+        self.bitmap = bitmap
+        self.slots = slots
+
+
+class _Collision(object):
+    """Keys whose hashes are entirely equal, as a tuple of (key, value)."""
+
+    __slots__ = ("hash", "pairs")
+
+    def __init__(self, hash, pairs):
+        self.hash = hash
+        self.pairs = pairs
+
+
+def _get(node, shift, h, key, default):
+    while True:
+        if isinstance(node, _Collision):
+            for k, v in node.pairs:
+                if k == key:
+                    return v
+            return default
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return default
+        slot = node.slots[_bit_count(node.bitmap & (bit - 1))]
+        if isinstance(slot, tuple):
+            return slot[2] if slot[1] == key else default
+        node, shift = slot, shift + _BITS
+
+
+def _set(node, shift, h, key, value):
+    """A copy of node with key set to value, and whether key is new."""
+    if isinstance(node, _Collision):
+        if h != node.hash:
+            # Push the collision down into a new node, next to the new key.
+            node = _Node(1 << ((node.hash >> shift) & _MASK), (node,))
+            return _set(node, shift, h, key, value)
+        pairs = [(k, v) for k, v in node.pairs if k != key]
+        added = len(pairs) == len(node.pairs)
+        return _Collision(h, tuple(pairs) + ((key, value),)), added
+    bit = 1 << ((h >> shift) & _MASK)
+    i = _bit_count(node.bitmap & (bit - 1))
+    slots = node.slots
+    if not node.bitmap & bit:
+        return _Node(node.bitmap | bit,
+                     slots[:i] + ((h, key, value),) + slots[i:]), True
+    slot = slots[i]
+    if not isinstance(slot, tuple):
+        child, added = _set(slot, shift + _BITS, h, key, value)
+    elif slot[1] == key:
+        if slot[2] is value:
+            return node, False
+        child, added = (h, key, value), False
+    else:
+        child, added = _pair(slot, (h, key, value), shift + _BITS), True
+    return _Node(node.bitmap, slots[:i] + (child,) + slots[i + 1:]), added
+
+
+def _pair(leaf1, leaf2, shift):
+    """The smallest subtree holding two leaves with different keys."""
+    h1, h2 = leaf1[0], leaf2[0]
+    if h1 == h2 or shift >= _HASH_BITS:
+        return _Collision(h1, (leaf1[1:], leaf2[1:]))
+    i1, i2 = (h1 >> shift) & _MASK, (h2 >> shift) & _MASK
+    if i1 == i2:
+        return _Node(1 << i1, (_pair(leaf1, leaf2, shift + _BITS),))
+    slots = (leaf1, leaf2) if i1 < i2 else (leaf2, leaf1)
+    return _Node((1 << i1) | (1 << i2), slots)
+
+
+def _items(node):
+    if isinstance(node, _Collision):
+        for pair in node.pairs:
+            yield pair
+        return
+    for slot in node.slots:
+        if isinstance(slot, tuple):
+            yield slot[1], slot[2]
+        else:
+            for pair in _items(slot):
+                yield pair
+
+
+class PMap(object):
+    """A persistent hash map.  set() returns a new PMap, leaving this one as
+    it was, and the two share all but O(log n) of their nodes.
+    """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, root=None, size=0):
+        self._root = root if root is not None else _Node(0, ())
+        self._size = size
+
+    def get(self, key, default=None):
+        return _get(self._root, 0, _hash(key), key, default)
+
+    def set(self, key, value):
+        root, added = _set(self._root, 0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PMap(root, self._size + added)
+
+    def items(self):
+        return _items(self._root)
+
+    def __contains__(self, key):
+        missing = object()
+        return self.get(key, missing) is not missing
+
+    def __len__(self):
+        return self._size
+
+
+EMPTY = PMap()
+
+
+class History(object):
+    """Renderer which keeps the model as it was after every step.
+
+    objects holds every Frame and Function the run made, in order, and exits
+    the index in objects of every frame exited, in order.  Step n (counting
+    from 1, with step 0 the empty model) is events[n - 1], and steps[n] is
+    (number of objects, number of exits, bindings) after it, where bindings
+    is a PMap from a frame's index to a PMap from name to (the order it was
+    first bound in, value).
+    """
+
+    def __init__(self):
+        self.objects = []
+        self.exits = []
+        self.events = []
+        self.steps = [(0, 0, EMPTY)]
+        self._index = {} # Model object -> its index in objects
+        self._bindings = EMPTY
+
+    def __len__(self):
+        return len(self.steps) - 1
+
+    def frame_created(self, frame):
+        self._add(frame)
+        self._commit('frame_created', frame)
+
+    def function_created(self, function):
+        self._add(function)
+        self._commit('function_created', function)
+
+    def binding_added(self, frame, name, value):
+        value = self._bind(frame, name, value)
+        self._commit('binding_added', frame, name, value)
+
+    def binding_updated(self, frame, name, value):
+        value = self._bind(frame, name, value)
+        self._commit('binding_updated', frame, name, value)
+
+    def frame_exited(self, frame):
+        self.exits.append(self._index[frame])
+        self._commit('frame_exited', frame)
+
+    def bindings_at(self, step, frame):
+        """The bindings of a model frame after the given step, as a list of
+        (name, value) in the order they were first bound.
+        """
+        names = self.steps[step][2].get(self._index[frame], EMPTY)
+        ordered = sorted(names.items(), key=lambda item: item[1][0])
+        return [(name, value) for name, (_, value) in ordered]
+
+    def state_at(self, step):
+        """The model as it was after the given step, as a TraceState (just
+        like TraceReader.state_at) made of copies of the model objects.
+        """
+        if not 0 <= step <= len(self):
+            raise IndexError("step {0} is out of range".format(step))
+        count, exits, bindings = self.steps[step]
+        state = TraceState()
+        for i in range(count):
+            self._copy(state, i)
+        for i, names in bindings.items():
+            frame = state.objects[i]
+            for name, (_, value) in sorted(names.items(),
+                                           key=lambda item: item[1][0]):
+                frame.bindings[name] = self._value(state, value)
+        state.exited.update(self.exits[:exits])
+        return state
+
+    def advance(self, state, start, stop, renderer=None):
+        """Bring a state from state_at(start) up to state_at(stop) by applying
+        the steps in between, telling renderer (if given) about each change
+        to it.  Going a few steps this way (or back with retreat) is much
+        cheaper than drawing state_at(stop) from scratch.
+        """
+        for event, args in self.events[start:stop]:
+            if event in ('frame_created', 'function_created'):
+                copy = self._copy(state, self._index[args[0]])
+                args = (copy,)
+            elif event == 'frame_exited':
+                state.exited.add(self._index[args[0]])
+                args = (state.objects[self._index[args[0]]],)
+            else:
+                frame, name, value = args
+                frame = state.objects[self._index[frame]]
+                value = self._value(state, value)
+                frame.bindings[name] = value
+                args = (frame, name, value)
+            if renderer is not None:
+                getattr(renderer, event)(*args)
+        return state
+
+    def retreat(self, state, start, stop, renderer=None):
+        """Take a state from state_at(start) back to state_at(stop), undoing
+        the steps in between (latest first), and telling renderer (if given)
+        about each with frame_removed, function_removed, binding_removed or
+        binding_updated (back to the old value).
+        """
+        for n in range(start, stop, -1):
+            event, args = self.events[n - 1]
+            i = self._index[args[0]]
+            if event == 'frame_created':
+                args = ('frame_removed', state.objects.pop(i))
+            elif event == 'function_created':
+                args = ('function_removed', state.objects.pop(i))
+            elif event == 'frame_exited':
+                state.exited.discard(i)
+                args = ()
+            else:
+                frame, name = state.objects[i], args[1]
+                old = self.steps[n - 1][2].get(i, EMPTY).get(name)
+                if old is None:
+                    del frame.bindings[name]
+                    args = ('binding_removed', frame, name)
+                else:
+                    value = self._value(state, old[1])
+                    frame.bindings[name] = value
+                    args = ('binding_updated', frame, name, value)
+            if renderer is not None and args:
+                getattr(renderer, args[0])(*args[1:])
+        return state
+
+    def _add(self, obj):
+        self._index[obj] = len(self.objects)
+        self.objects.append(obj)
+
+    def _bind(self, frame, name, value):
+        """Record a binding, returning the value as it's kept."""
+        if not isinstance(value, model.Function):
+            value = model.Value(brief.CACHE.get(value.obj, value.snapshot,
+                                                brief.EXPANDED_CHARS))
+        i = self._index[frame]
+        names = self._bindings.get(i, EMPTY)
+        old = names.get(name)
+        order = old[0] if old is not None else len(names)
+        self._bindings = self._bindings.set(i, names.set(name,
+                                                         (order, value)))
+        return value
+
+    def _commit(self, event, *args):
+        self.events.append((event, args))
+        self.steps.append((len(self.objects), len(self.exits),
+                           self._bindings))
+
+    def _copy(self, state, i):
+        """Add a copy of objects[i] to state (its parent and function are
+        always copied already, having been made before it).
+        """
+        obj = self.objects[i]
+        if isinstance(obj, model.Frame):
+            copy = model.Frame(self._copied(state, obj.parent),
+                               self._copied(state, obj.function), obj.depth,
+                               obj.sampled)
+        else:
+            copy = model.Function(obj.name, obj.arguments,
+                                  self._copied(state, obj.parent))
+        state.objects[i] = copy
+        return copy
+
+    def _copied(self, state, obj):
+        return None if obj is None else state.objects[self._index[obj]]
+
+    def _value(self, state, value):
+        if isinstance(value, model.Function):
+            return self._copied(state, value)
+        return value
@@ -5,13 +5,78 @@
 This was added by Tom Magrino (tmagrino@berkeley.edu)
 """
 
-import ast, inspect
 from code import InteractiveConsole, compile_command
 from examine import *
-from pprint import pprint
+
+# A statement mentioning one of these can get at every global by name, so
+# after it all of them are looked at again.
+ALL_GLOBALS_NAMES = frozenset(("globals", "vars", "exec", "eval"))
+
+
+def statement_names(source, filename="<input>", symbol="single"):
+    """Every name the statement in source mentions (so could bind, unbind or
+    change the value of) in the order they appear, or None if it could get
+    at any global at all (from m import *, or using globals() and friends).
+    It's a superset: names bound in a comprehension or a function's body are
+    in there too.
+    """
+    import ast
+    names = {}
+    for node in ast.walk(ast.parse(source, filename, symbol)):
+        if isinstance(node, ast.Name):
+            names[node.id] = None
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            names[node.name] = None
+        elif isinstance(node, ast.alias):
+            if node.name == "*":
+                return None
+            names[node.asname or node.name.split(".")[0]] = None
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(dict.fromkeys(node.names))
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs,
+                               ast.MatchStar)) and node.name:
+            names[node.name] = None
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            names[node.rest] = None
+    if not ALL_GLOBALS_NAMES.isdisjoint(names):
+        return None
+    return list(names)
+
 
 class EnvDrawConsole(InteractiveConsole):
-    """InteractiveConsole for the EnvDraw program."""
+    """InteractiveConsole for the EnvDraw program.
+
+    include and exclude are lists of patterns picking which functions are
+    traced, just like for examine.run.  Unless a tracker is given, one drawing
+    in a new Tk window is made (so nothing touches tkinter until a console is
+    actually started).
+
+    After each statement only the globals it could have changed are synced
+    with the diagram: the names it mentions, and those looked up by the
+    traced functions it called (see Tracker.names_used).  Each of those is
+    checked against its binding in the global frame, which holds on to the
+    value's fingerprint, so an unchanged one costs a lookup.  A function run
+    untraced (see exclude) which changes a global it isn't passed isn't
+    noticed until the global is next mentioned.
+    """
+
+    def __init__(self, locals=None, filename="<console>", include=None,
+                 exclude=None, tracker=None):
+        InteractiveConsole.__init__(self, locals, filename)
+        self.include = include
+        self.exclude = exclude
+        if tracker is None:
+            from renderer import TkRenderer
+            tracker = Tracker(TkRenderer())
+        self.tracker = tracker
+        # Whether every global has been synced once, which picks up anything
+        # in the namespace the console was started with.
+        self.synced = False
+        funcdef.tracker = tracker
+        funcreturn.tracker = tracker
+        funccall.tracker = tracker
+        funcyield.tracker = tracker
 
     def runsource(self, source, filename="<input>", symbol="single"):
         """Do the same thing as any InteractiveConsole, except if we run into a
@@ -20,13 +85,15 @@ class EnvDrawConsole(InteractiveConsole):
         """
         try:
             if compile_command(source, filename, symbol):
-                tree = ast.parse(source, filename, symbol)
-                new_tree = ast.fix_missing_locations(AddFuncCall().visit(
-                                                        AddFuncReturn().visit(
-                                                            AddFuncDef().visit(tree))))
-                compiled_code = compile(new_tree, filename, symbol)
-                self.runcode(compiled_code)
-                TRACKER.insert_global_bindings(self.locals)
+                compiled_code = CODE_CACHE.compile(
+                        source, filename, symbol,
+                        include=self.include, exclude=self.exclude)
+                used = self.tracker.names_used = set()
+                try:
+                    self.runcode(compiled_code)
+                finally:
+                    self.tracker.names_used = None
+                self.sync_globals(source, filename, symbol, used)
                 return False
             else:
                 return InteractiveConsole.runsource(self, source, filename, symbol)
@@ -34,10 +101,18 @@ class EnvDrawConsole(InteractiveConsole):
             self.showsyntaxerror(filename)
             return False
 
-TRACKER = Tracker()
-funcdef.tracker = TRACKER
-funcreturn.tracker = TRACKER
-funccall.tracker = TRACKER
+    def sync_globals(self, source, filename, symbol, used):
+        """Bring the global frame up to date after running the statement in
+        source, which called functions using the globals in used.
+        """
+        names = statement_names(source, filename, symbol)
+        if names is None or not self.synced or \
+                not ALL_GLOBALS_NAMES.isdisjoint(used):
+            self.tracker.insert_global_bindings(self.locals)
+            self.synced = True
+            return
+        names.extend(sorted(used.difference(names)))
+        self.tracker.insert_global_bindings(self.locals, names)
 
 if __name__ == "__main__":
     # Add in bindings that we want to have "under the hood" in the interpreter
@@ -0,0 +1,154 @@
+"""layout.py
+
+Deterministic placement of diagram elements on the canvas.
+
+Frames go in columns by their depth on the call stack (the global frame on
+its own in the first column) and Functions go in a column right next to the
+column of the frame they were defined in, as close to level with it as
+possible.  Only so many columns are used: deeper frames wrap around to the
+first column after the global one, below what's already there, so a deep
+stack grows down rather than ever further to the right.  Heap objects go to
+the right of the first frame or object that referred to them.
+
+Occupied rectangles are kept in a SpatialIndex, so checking a spot is free
+only looks at the few rectangles near it rather than asking Tk about every
+item on the canvas, and the same program always gets the same layout.  A
+space freed by an item being removed (a pruned frame, say) is used again by
+the next item placed in its column.
+"""
+
+
+class SpatialIndex(object):
+    """A uniform grid over the plane where each cell holds the keys of the
+    rectangles overlapping it.  Rectangles are (x1, y1, x2, y2) tuples.
+    """
+
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+
+    def _cells(self, rect):
+        x1, y1, x2, y2 = rect
+        size = self.cell_size
+        for cx in range(int(x1 // size), int(x2 // size) + 1):
+            for cy in range(int(y1 // size), int(y2 // size) + 1):
+                yield cx, cy
+
+    def insert(self, key, rect):
+        self.rects[key] = rect
+        for cell in self._cells(rect):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        rect = self.rects.pop(key)
+        for cell in self._cells(rect):
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def update(self, key, rect):
+        if key in self.rects:
+            self.remove(key)
+        self.insert(key, rect)
+
+    def overlapping(self, rect):
+        """Keys of every rectangle overlapping the given one."""
+        x1, y1, x2, y2 = rect
+        found = set()
+        for cell in self._cells(rect):
+            for key in self.cells.get(cell, ()):
+                if key in found:
+                    continue
+                ox1, oy1, ox2, oy2 = self.rects[key]
+                if ox1 < x2 and x1 < ox2 and oy1 < y2 and y1 < oy2:
+                    found.add(key)
+        return found
+
+
+class Layout(object):
+    """Picks positions for Frames, Functions and heap objects.
+
+    Items are identified by whatever key the caller likes (the renderer uses
+    the model objects), which is also how they're resized later.  If on_grow
+    is given it's called with the new bounds whenever they get bigger, say
+    to set a canvas's scrollregion.
+    """
+
+    def __init__(self, margin=50, frame_width=150, function_width=160,
+                 gap=40, max_columns=4, on_grow=None):
+        self.margin = margin
+        self.gap = gap
+        self.function_offset = frame_width + gap
+        self.column_width = frame_width + function_width + 2 * gap
+        self.max_columns = max_columns
+        self.on_grow = on_grow
+        self.index = SpatialIndex()
+        self.right = self.bottom = 0
+        # Where to start looking for space in each column, so placing an
+        # item doesn't mean stepping over everything above it.
+        self._cursors = {}
+
+    def place_frame(self, key, depth, width, height):
+        """Place a frame at the given call stack depth."""
+        column = depth
+        if depth > self.max_columns:
+            column = (depth - 1) % self.max_columns + 1
+        x = self.margin + column * self.column_width
+        return self._place(key, x, self.margin, width, height)
+
+    def place_function(self, key, frame_key, width, height):
+        """Place a function next to the frame it was defined in."""
+        fx, fy, _, _ = self.index.rects[frame_key]
+        return self._place(key, fx + self.function_offset, fy, width, height)
+
+    def place_object(self, key, near_key, width, height):
+        """Place a heap object (see components.HeapObject) to the right of
+        whatever first referred to it.
+        """
+        _, y, x, _ = self.index.rects[near_key]
+        return self._place(key, x + self.gap, y, width, height)
+
+    def remove(self, key):
+        """Free the space taken by an item.  If it was the last one placed in
+        its column, the next one goes where it was.
+        """
+        x, y, _, _ = self.index.rects[key]
+        self.index.remove(key)
+        if x in self._cursors:
+            self._cursors[x] = min(self._cursors[x], y)
+
+    def resize(self, key, width, height):
+        """An item has grown (or shrunk), keep its top left corner."""
+        x, y, _, _ = self.index.rects[key]
+        self.index.update(key, (x, y, x + width, y + height))
+        self._grow(x + width, y + height)
+
+    def bounds(self):
+        """(x1, y1, x2, y2) taking in everything placed so far, with a margin
+        below and to the right.  They never shrink.
+        """
+        return 0, 0, self.right + self.margin, self.bottom + self.margin
+
+    def _grow(self, right, bottom):
+        if right > self.right or bottom > self.bottom:
+            self.right = max(self.right, right)
+            self.bottom = max(self.bottom, bottom)
+            if self.on_grow is not None:
+                self.on_grow(self.bounds())
+
+    def _place(self, key, x, y, width, height):
+        """Find the first free spot at or below y in the column at x."""
+        y = max(y, self._cursors.get(x, y))
+        while True:
+            rect = (x, y, x + width, y + height)
+            padded = (x, y - self.gap, x + width, y + height + self.gap)
+            hits = self.index.overlapping(padded)
+            if not hits:
+                break
+            y = max(self.index.rects[hit][3] for hit in hits) + self.gap
+        self.index.insert(key, rect)
+        self._cursors[x] = y + height + self.gap
+        self._grow(x + width, y + height)
+        return x, y
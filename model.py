@@ -0,0 +1,76 @@
+"""model.py
+
+A plain in-memory model of an environment diagram: the frames, the bindings
+in them, function values and the static links between them.
+
+The Tracker fills this in as the traced program runs.  Nothing here knows how
+to draw itself, that's left to a renderer (see renderer.py), so a program can
+be traced without Tk.
+"""
+
+
+class Frame(object):
+    """Represents a Frame in the environment model.
+
+    At a high level, a Frame consists of:
+        - A mapping from variable names to Values (or Functions), kept in the
+          order the variables were first bound
+        - A static link to the enclosing Frame (None if it's global)
+        - The Function whose call created it (None if it's global)
+        - Its depth on the call stack when it was created (0 if it's global),
+          counting only the frames in the model
+        - Whether it was recorded while only some calls were being (see
+          sampling.py), in which case calls around it may be missing
+    """
+
+    def __init__(self, parent=None, function=None, depth=0, sampled=False):
+        self.bindings = {}
+        self.parent = parent
+        self.function = function
+        self.depth = depth
+        self.sampled = sampled
+
+    @property
+    def is_global(self):
+        return self.parent is None
+
+    def lookup(self, name):
+        """Find the Frame holding the binding for the given name, following
+        static links outwards.  Returns None if the name isn't bound anywhere.
+        """
+        frame = self
+        while frame is not None:
+            if name in frame.bindings:
+                return frame
+            frame = frame.parent
+        return None
+
+
+class Function(object):
+    """Represents a Function value in the environment model.
+
+    At a high level, a Function consists of:
+        - A name
+        - Argument names
+        - A static link to the Frame it was defined in
+        - The Python function itself, while the program is running (not for
+          one read back from a trace, say)
+    """
+
+    def __init__(self, name, arguments, parent, obj=None):
+        self.name = name
+        self.arguments = tuple(arguments)
+        self.parent = parent
+        self.obj = obj
+
+
+class Value(object):
+    """Represents any other value bound in the environment model.  We just
+    hold on to the object so it can be displayed later, along with its
+    fingerprint (see brief.py) at the time it was bound if it's mutable, so
+    we can tell when it's changed.
+    """
+
+    def __init__(self, obj, snapshot=None):
+        self.obj = obj
+        self.snapshot = snapshot
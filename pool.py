@@ -0,0 +1,60 @@
+"""pool.py
+
+Canvas items kept around for reuse.  Values come and go all the time (every
+rebinding of a variable makes a new one and gets rid of the old), so rather
+than deleting an item and creating another just like it straight after, a
+released item is hidden and handed out again the next time an item of the
+same kind and style is wanted.
+
+Only a limited number are kept for each style, the rest really are deleted,
+so the canvas has about as many items as the diagram has things showing.
+"""
+
+from collections import defaultdict
+
+
+class ItemPool(object):
+    """Hands out canvas items, reusing released ones where it can.  An item
+    is reused for one with the same kind and options (other than its text and
+    tags, which are set again), and is raised to the top as if it had just
+    been created.
+    """
+
+    def __init__(self, canvas, maxsize=100):
+        self.canvas = canvas
+        self.maxsize = maxsize
+        self._styles = {} # Item handed out -> its (kind, style)
+        self._free = defaultdict(list) # (kind, style) -> hidden items
+
+    def create(self, kind, *coords, **options):
+        tags = options.pop("tag", options.pop("tags", ()))
+        changing = {"tags": tags}
+        if "text" in options:
+            changing["text"] = options.pop("text")
+        style = (kind, tuple(sorted(options.items())))
+        free = self._free[style]
+        if free:
+            item = free.pop()
+            self.canvas.coords(item, *coords)
+            self.canvas.itemconfig(item, state="normal", **changing)
+            self.canvas.tag_raise(item)
+        else:
+            options.update(changing)
+            item = getattr(self.canvas, "create_" + kind)(*coords, **options)
+        self._styles[item] = style
+        return item
+
+    def release(self, item):
+        """Take an item off the canvas, keeping it for reuse if there's
+        room.
+        """
+        style = self._styles.pop(item, None)
+        if style is None or len(self._free[style]) >= self.maxsize:
+            self.canvas.delete(item)
+            return
+        self.canvas.itemconfig(item, state="hidden", tags=())
+        self._free[style].append(item)
+
+    def __len__(self):
+        """How many released items are being kept."""
+        return sum(len(free) for free in self._free.values())
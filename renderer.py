@@ -0,0 +1,375 @@
+"""renderer.py
+
+Draws the environment model (see model.py) on a Tk canvas, using the GUI
+elements in components.py.  A TkRenderer is handed to a Tracker, which tells
+it about every change to the model as the program runs.
+
+The canvas doesn't have to be a real tk.Canvas: given a VectorCanvas (see
+vectorcanvas.py) the diagram is drawn without Tk, to be saved as an image.
+"""
+
+from itertools import islice
+
+import brief
+import components
+import model
+from layout import Layout
+from pool import ItemPool
+from routing import Router
+from scheduler import RedrawScheduler
+
+# Values of these (exact) types are drawn as box and pointer diagrams.
+HEAP_TYPES = (list, tuple, dict)
+# Elements shown in a HeapObject before the rest are left out.
+MAX_CELLS = 8
+CELL_CHARS = 6
+# Objects nested deeper than this inside a bound one are only shown as
+# briefs, unless they've already been drawn.
+MAX_HEAP_DEPTH = 8
+
+
+def scrolled_canvas(master):
+    """A canvas with scrollbars, packed into master, for a TkRenderer to
+    draw on.
+    """
+    import tkinter as tk
+    frame = tk.Frame(master)
+    canvas = tk.Canvas(frame, width=800, height=600)
+    xscroll = tk.Scrollbar(frame, orient=tk.HORIZONTAL, command=canvas.xview)
+    yscroll = tk.Scrollbar(frame, command=canvas.yview)
+    canvas.configure(xscrollcommand=xscroll.set, yscrollcommand=yscroll.set)
+    xscroll.pack(side=tk.BOTTOM, fill=tk.X)
+    yscroll.pack(side=tk.RIGHT, fill=tk.Y)
+    canvas.pack(fill=tk.BOTH, expand=1)
+    frame.pack(fill=tk.BOTH, expand=1)
+    return canvas
+
+
+class TkRenderer(object):
+    """Renderer drawing the model on a Tk canvas.
+
+    If recursion_budget is given, a recursive function only gets that many
+    Frames drawn in a row on the call stack.  Deeper calls are collapsed into
+    a single CollapsedFrames element per run (which can be expanded by double
+    clicking it), so the canvas stays the same size however deep the
+    recursion goes.
+
+    Lists, tuples and dicts are drawn as HeapObjects, once per object however
+    many variables (or other objects) refer to it, keyed by the object's id.
+    They're redrawn in place when they're bound again having changed.
+
+    If prune is True, returned frames are taken off the canvas as soon as
+    nothing still drawn can reach them: a frame stays while it's running, is
+    the parent of a frame that stays, or is where a function bound in one of
+    those was defined.  Functions and HeapObjects only reachable from pruned
+    frames go with them.  Should one turn up again (a function nobody had
+    bound being called, say) it's drawn again from the model.
+    """
+
+    def __init__(self, canvas=None, recursion_budget=None, prune=False):
+        # Set up canvas, unless we've been given one to draw on
+        if canvas is None:
+            import tkinter as tk
+            canvas = scrolled_canvas(tk.Tk())
+        self.canvas = canvas
+        self.canvas.router = Router()
+        self.canvas.scheduler = RedrawScheduler(canvas)
+        self.canvas.pool = ItemPool(canvas)
+        self.recursion_budget = recursion_budget
+        self.prune = prune
+        # The GUI element drawn for each Frame and Function in the model.
+        # Collapsed frames map to the CollapsedFrames standing in for them.
+        self.drawn = {}
+        self.collapsed = set()
+        self.summary_keys = {}
+        # (frame, length of the recursive run it ends) for each live call,
+        # indexed by call stack depth.
+        self.stack = []
+        self.layout = Layout(on_grow=self.fit_canvas)
+        # id -> HeapObject drawn for the object with that id (which holds on
+        # to the object, so the id can't be reused).
+        self.heap = {}
+        # Python function -> its Function in the model, for when one turns up
+        # inside a HeapObject.
+        self.function_objects = {}
+        # Frames which have returned, and model objects whose drawings have
+        # been pruned.
+        self.exited = set()
+        self.pruned = set()
+
+    def fit_canvas(self, bounds):
+        """Let the canvas scroll over everything laid out on it."""
+        self.canvas.configure(scrollregion=bounds)
+
+    def frame_created(self, frame):
+        del self.stack[frame.depth:]
+        run = 1
+        if self.stack and frame.function is not None and \
+                self.stack[-1][0].function is frame.function:
+            run = self.stack[-1][1] + 1
+        self.stack.append((frame, run))
+        if self.recursion_budget is not None and run > self.recursion_budget:
+            self.collapse(frame)
+            return
+        self.drawn[frame] = self.draw_frame(frame)
+
+    def draw_frame(self, frame):
+        if frame.parent is None:
+            x, y = self.layout.place_frame(frame, frame.depth, 150, 40)
+            return components.Frame(self.canvas, x, y, globe=True)
+        parent = self.drawing(frame.parent)
+        # Leave room for the arguments, which get bound when it returns.
+        x, y = self.layout.place_frame(frame, frame.depth, 150,
+                                       40 + 20 * len(frame.function.arguments))
+        return components.Frame(self.canvas, x, y, extended_frame=parent,
+                                sampled=frame.sampled)
+
+    def collapse(self, frame):
+        """Add frame to the CollapsedFrames for the run it's part of (making
+        one if it's the first frame over the budget).
+        """
+        previous = self.stack[-2][0]
+        if previous in self.collapsed:
+            summary = self.drawn[previous]
+        else:
+            key = (frame, "collapsed")
+            parent = self.drawing(frame.parent)
+            x, y = self.layout.place_frame(key, frame.depth, 150, 40)
+            summary = components.CollapsedFrames(
+                    self.canvas, x, y, frame.function.name, parent,
+                    on_expand=self.expand)
+            self.summary_keys[summary] = key
+        summary.add(frame)
+        self.drawn[frame] = summary
+        self.collapsed.add(frame)
+
+    def expand(self, summary):
+        """Draw all the frames a CollapsedFrames is standing in for."""
+        for frame in summary.frames:
+            self.collapsed.discard(frame)
+            self.drawn[frame] = self.draw_frame(frame)
+            for name, value in frame.bindings.items():
+                self.binding_added(frame, name, value)
+
+    def function_created(self, function):
+        parent = self.drawing(function.parent)
+        # Functions defined in a collapsed frame go next to its summary.
+        x, y = self.layout.place_function(function,
+                                          self.layout_key(function.parent),
+                                          160, 60)
+        self.drawn[function] = components.Function(self.canvas, x, y,
+                                                   function.name,
+                                                   function.arguments, parent)
+        self.drawn[function].model = function
+        if function.obj is not None:
+            self.function_objects[function.obj] = function
+
+    def binding_added(self, frame, name, value):
+        if frame not in self.collapsed:
+            drawing = self.drawing(frame)
+            drawing.add_binding(name, self.draw_value(frame, value))
+            self.layout.resize(frame, drawing.width, drawing.height)
+
+    def binding_updated(self, frame, name, value):
+        if frame not in self.collapsed:
+            self.drawing(frame).update_binding(name,
+                                               self.draw_value(frame, value))
+
+    def frame_exited(self, frame):
+        if self.prune:
+            self.exited.add(frame)
+            self.collect()
+
+    def drawing(self, obj):
+        """The GUI element for a Frame or Function in the model, drawing it
+        again if it was pruned.
+        """
+        if obj in self.pruned and obj.parent is not None:
+            # Which might well draw obj again too, if it's bound there.
+            self.drawing(obj.parent)
+        if obj in self.pruned:
+            self.pruned.discard(obj)
+            if isinstance(obj, model.Function):
+                self.function_created(obj)
+            else:
+                self.drawn[obj] = self.draw_frame(obj)
+                for name, value in obj.bindings.items():
+                    self.binding_added(obj, name, value)
+        return self.drawn[obj]
+
+    def collect(self):
+        """Prune every returned frame (and function and HeapObject) nothing
+        still drawn can reach, whether through a binding or through the
+        HeapObjects bound.  Collapsed frames are kept, their summary stands
+        for all of them.
+        """
+        live, functions, objects = set(), set(), set()
+        todo = [obj for obj in self.drawn if isinstance(obj, model.Frame)
+                and (obj not in self.exited or obj in self.collapsed)]
+        while todo:
+            frame = todo.pop()
+            if frame is None or frame in live:
+                continue
+            live.add(frame)
+            todo.append(frame.parent)
+            reached = [value for value in frame.bindings.values()
+                       if isinstance(value, model.Function)]
+            if self.heap and frame in self.drawn and \
+                    frame not in self.collapsed:
+                reached.extend(self.heap_functions(self.drawn[frame],
+                                                   objects))
+            for function in reached:
+                if function not in functions:
+                    functions.add(function)
+                    todo.append(function.parent)
+        dead = [obj for obj in self.drawn if obj not in live and
+                (isinstance(obj, model.Frame) or
+                 (obj not in functions and obj.parent not in live))]
+        for obj in dead:
+            self.drawn.pop(obj).delete()
+            self.layout.remove(obj)
+            self.pruned.add(obj)
+        if dead and self.heap:
+            self.collect_heap(objects)
+
+    def heap_functions(self, frame_drawing, seen):
+        """The model Functions bound in a frame's drawing or pointed at from
+        the HeapObjects bound in it, the HeapObjects in those and so on.
+        Every HeapObject found is added to seen, and those already there
+        aren't looked in again.
+        """
+        found = []
+        todo = [binding.value for binding in frame_drawing.bindings]
+        while todo:
+            drawing = todo.pop()
+            if isinstance(drawing, components.HeapObject):
+                if drawing not in seen:
+                    seen.add(drawing)
+                    todo.extend(drawing.contents.values())
+            elif isinstance(drawing, components.Function):
+                found.append(drawing.model)
+        return found
+
+    def collect_heap(self, reachable):
+        """Prune the HeapObjects which aren't in reachable."""
+        for key, drawing in list(self.heap.items()):
+            if drawing not in reachable:
+                del self.heap[key]
+                drawing.delete()
+                self.layout.remove(key)
+
+    # The opposites of the above, for stepping backwards (see history.py).
+    # Things are only ever removed in the reverse of the order they were
+    # added, so anything pointing at a frame is gone before it is.
+
+    def frame_removed(self, frame):
+        del self.stack[frame.depth:]
+        drawing = self.drawn.pop(frame)
+        if frame in self.collapsed:
+            self.collapsed.discard(frame)
+            drawing.remove(frame)
+            if drawing.frames:
+                return
+            key = self.summary_keys.pop(drawing)
+            self.layout.remove(key)
+        else:
+            self.layout.remove(frame)
+        drawing.delete()
+
+    def function_removed(self, function):
+        self.drawn.pop(function).delete()
+        self.layout.remove(function)
+        self.function_objects.pop(function.obj, None)
+
+    def binding_removed(self, frame, name):
+        if frame not in self.collapsed:
+            drawing = self.drawn[frame]
+            drawing.remove_binding(name)
+            self.layout.resize(frame, drawing.width, drawing.height)
+
+    def layout_key(self, frame):
+        """The key a frame's drawing was placed under in the layout."""
+        if frame in self.collapsed:
+            return self.summary_keys[self.drawn[frame]]
+        return frame
+
+    def draw_value(self, frame, value):
+        """Get the GUI element for a value being bound in the given frame.
+        Functions are drawn once when they're created, anything else gets a
+        new Value.
+        """
+        if isinstance(value, model.Function):
+            return self.drawing(value)
+        if type(value.obj) in HEAP_TYPES:
+            return self.draw_object(value.obj, value.snapshot,
+                                    self.layout_key(frame))
+        return components.Value(self.canvas, self.drawing(frame), value.obj,
+                                value.snapshot)
+
+    def draw_object(self, obj, version, near, depth=0):
+        """Get the HeapObject for obj as of the given version (its
+        fingerprint, see brief.py).  The first time it's seen it's drawn next
+        to the layout item near, after that its cells are only redrawn if it's
+        changed.  Objects it contains are drawn (or updated) the same way, and
+        since obj is in self.heap before they are, a cycle back to it just
+        points at it.
+        """
+        if version is None:
+            version = brief.fingerprint(obj)
+        drawing = self.heap.get(id(obj))
+        if drawing is None:
+            shown = min(len(obj), MAX_CELLS) + (len(obj) > MAX_CELLS)
+            rows, columns = (shown, 2) if isinstance(obj, dict) else \
+                    (1, shown)
+            x, y = self.layout.place_object(
+                    id(obj), near, components.HeapObject.cell_width *
+                    max(columns, 1), components.HeapObject.label_height +
+                    components.HeapObject.cell_height * max(rows, 1))
+            drawing = components.HeapObject(self.canvas, x, y,
+                                            type(obj).__name__)
+            drawing.obj = obj
+            self.heap[id(obj)] = drawing
+        elif drawing.version == version:
+            return drawing
+        drawing.version = version
+        rows = []
+        if isinstance(obj, dict):
+            for key, item in islice(obj.items(), MAX_CELLS):
+                rows.append([brief.brief(key, CELL_CHARS, quote=True),
+                             self.draw_element(item, obj, depth)])
+            if len(obj) > MAX_CELLS:
+                rows.append([brief.FILL, ""])
+        elif obj:
+            rows.append([self.draw_element(item, obj, depth)
+                         for item in islice(obj, MAX_CELLS)])
+            if len(obj) > MAX_CELLS:
+                rows[0].append(brief.FILL)
+        drawing.set_contents(rows)
+        self.layout.resize(id(obj), drawing.width, drawing.height)
+        return drawing
+
+    def draw_element(self, item, container, depth):
+        """What goes in the cell for an element of container: its HeapObject
+        if it's drawn as one, or its Function if it's a function we know
+        about, otherwise a brief of it.
+        """
+        if type(item) in HEAP_TYPES and (id(item) in self.heap or
+                                         depth < MAX_HEAP_DEPTH):
+            return self.draw_object(item, None, id(container), depth + 1)
+        function = self.function_for(item)
+        if function is not None:
+            return self.drawing(function)
+        return brief.brief(item, CELL_CHARS, quote=True)
+
+    def function_for(self, obj):
+        """The model Function for a Python function, or for a wrapper around
+        one like functools.lru_cache's, if it's one we've drawn.
+        """
+        if not callable(obj):
+            return None
+        while not hasattr(obj, '__code__') and hasattr(obj, '__wrapped__'):
+            obj = obj.__wrapped__
+        try:
+            return self.function_objects.get(obj)
+        except TypeError: # Unhashable
+            return None
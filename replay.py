@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Replays a trace recorded by examine.py (with --trace), with a slider to
+scrub back and forth through the steps of the program.  A ReplayViewer can
+also be given a history.History kept in memory instead (which is what
+examine.py --step does).  It's drawn with the same --recursion-budget and
+--prune options as examine.py.
+
+Usage: python3 replay.py [--recursion-budget N] [--prune] TRACE_FILE
+"""
+
+import tkinter as tk
+from renderer import TkRenderer, scrolled_canvas
+from tracefile import TraceReader
+
+# Going at most this many steps forward or back only draws (or undoes) what
+# changed in them, if the steps can be applied one at a time as a History's
+# can, rather than redrawing everything.
+MAX_ADVANCE = 256
+
+
+class ReplayViewer(object):
+    """Shows the steps of a trace or History, drawn by a TkRenderer with the
+    given recursion_budget and prune (see renderer.TkRenderer).
+    """
+
+    def __init__(self, reader, master=None, recursion_budget=8, prune=False):
+        self.reader = reader
+        self.recursion_budget = recursion_budget
+        self.prune = prune
+        self.master = master if master is not None else tk.Tk()
+        self.canvas = scrolled_canvas(self.master)
+        self.slider = tk.Scale(self.master, from_=0, to=len(reader),
+                               orient=tk.HORIZONTAL, command=self.scrub)
+        self.slider.pack(fill=tk.X)
+        self.master.bind('<Left>', lambda event: self.step(-1))
+        self.master.bind('<Right>', lambda event: self.step(1))
+        self.shown, self.state, self.renderer = None, None, None
+        self.show(len(reader))
+
+    def scrub(self, value):
+        self.show(int(value))
+
+    def step(self, delta):
+        self.slider.set(min(max(self.slider.get() + delta, 0),
+                            len(self.reader)))
+
+    def show(self, step):
+        """Redraw the diagram as it was after the given step."""
+        if step == self.shown:
+            return
+        incremental = self.shown is not None and \
+                hasattr(self.reader, 'advance') and \
+                abs(step - self.shown) <= MAX_ADVANCE
+        if incremental and step > self.shown:
+            self.reader.advance(self.state, self.shown, step, self.renderer)
+        elif incremental:
+            self.reader.retreat(self.state, self.shown, step, self.renderer)
+        else:
+            scheduler = getattr(self.canvas, 'scheduler', None)
+            if scheduler is not None:
+                scheduler.cancel()
+            self.canvas.delete(tk.ALL)
+            self.renderer = TkRenderer(self.canvas,
+                                       recursion_budget=self.recursion_budget,
+                                       prune=self.prune)
+            self.state = self.reader.state_at(step)
+            self.state.replay(self.renderer)
+        self.shown = step
+        self.slider.set(step)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+            description="Replay a trace recorded by examine.py --trace.")
+    parser.add_argument("file", help="the trace file")
+    parser.add_argument("--recursion-budget", type=int, default=8,
+                        metavar="N", help="collapse recursive calls deeper "
+                        "than N frames (0 to never collapse)")
+    parser.add_argument("--prune", action="store_true",
+                        help="take returned frames off the diagram once "
+                        "nothing on it can reach them")
+    args = parser.parse_args()
+    if args.recursion_budget < 0:
+        parser.error("argument --recursion-budget: must be at least 0, not "
+                     "{0}".format(args.recursion_budget))
+    ReplayViewer(TraceReader(args.file),
+                 recursion_budget=args.recursion_budget or None,
+                 prune=args.prune)
+    tk.mainloop()
+
+
+if __name__ == '__main__':
+    main()
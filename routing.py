@@ -0,0 +1,278 @@
+"""routing.py
+
+Obstacle-aware routing for Connectors.
+
+A Router is attached to a canvas (as canvas.router) and knows where all the
+Draggable elements (Frames, Functions, ...) on it are.  Connectors between
+Draggables ask it for a path, which is found with A* over a grid of
+cell_size squares, each square costing more the more elements it covers or
+is close to (see crowding_cost), so arrows go around Frames rather
+than through them.
+
+Most connectors don't need a search at all: if nothing is in the way of
+the plain elbow it's used as it is.  The occupancy of each grid square is
+cached.  When a Draggable moves, only the squares around its old and new
+position are forgotten, and only the Connectors whose paths cross that
+region are routed again.
+
+Routing happens when a canvas's RedrawScheduler (see scheduler.py) redraws
+the dirty Connectors, and each of those redraws only gets so much searching
+between all its Connectors (see Router.start_redraw).  Any left over when
+it's used up keep their elbow until the next redraw.
+"""
+
+import heapq
+import itertools
+from layout import SpatialIndex
+
+CELL_SIZE = 20
+# How close to an obstacle a point has to be to count as near it.
+PROXIMITY = 15
+COVERING_COST = 200
+PROXIMITY_COST = 50
+TURN_COST = 20
+
+
+def crowding_cost(covering, near):
+    """What it costs to go through a point with the given numbers of
+    obstacles covering it and near it.  Both the Router and
+    Drawable.overlap_cost (on a canvas without one) score points like this.
+    """
+    return covering * COVERING_COST + near * PROXIMITY_COST
+
+
+class Router(object):
+
+    def __init__(self, cell_size=CELL_SIZE, proximity=PROXIMITY, margin=100,
+                 max_expansions=2000, max_work=10000):
+        self.cell_size = cell_size
+        self.proximity = proximity
+        self.margin = margin
+        self.max_expansions = max_expansions
+        self.max_work = max_work
+        self.obstacles = SpatialIndex()
+        # Paths are long and thin, so their bounding boxes are big: a
+        # coarser grid keeps them in fewer cells.
+        self.routes = SpatialIndex(cell_size=500)
+        self.paths = {}
+        # Cell -> (obstacles covering it, obstacles near it)
+        self._occupancy = {}
+        # Expansions the searches in this redraw can still make (None
+        # outside of one), and the Connectors which missed out, in order.
+        self._work_left = None
+        self._deferred = {}
+
+    def start_redraw(self):
+        """Searches from now on share max_work expansions between them."""
+        self._work_left = self.max_work
+        self._deferred = {}
+
+    def end_redraw(self):
+        """Stop limiting the searches, returning the Connectors which were
+        given an elbow because the work ran out, to be routed next time.
+        """
+        self._work_left = None
+        deferred, self._deferred = list(self._deferred), {}
+        return deferred
+
+    def update_obstacle(self, draggable):
+        """Note where a Draggable is now (after it was created, moved or
+        resized), and route again any Connectors passing through the area it
+        left or moved into, other than its own (which it updates itself).
+        """
+        bbox = draggable.canvas.bbox(draggable.tag)
+        if bbox is None:
+            return
+        old = self.obstacles.rects.get(draggable)
+        new = tuple(bbox)
+        if old == new:
+            return
+        self.obstacles.update(draggable, new)
+        changed = [new] if old is None else [old, new]
+        stale = set()
+        for rect in changed:
+            self._forget_occupancy(rect)
+            stale.update(self.crossing(rect))
+        for connector in stale:
+            if connector not in draggable.connectors:
+                connector.update()
+
+    def remove_obstacle(self, draggable):
+        """Forget a Draggable that's been deleted, and route again any
+        Connectors passing where it was.
+        """
+        rect = self.obstacles.rects.get(draggable)
+        if rect is None:
+            return
+        self.obstacles.remove(draggable)
+        self._forget_occupancy(rect)
+        for connector in self.crossing(rect):
+            connector.update()
+
+    def remove(self, connector):
+        """Forget a Connector that's been deleted."""
+        self._deferred.pop(connector, None)
+        self._forget_path(connector)
+
+    def _forget_path(self, connector):
+        if connector in self.paths:
+            del self.paths[connector]
+            self.routes.remove(connector)
+
+    def crossing(self, rect):
+        """The Connectors with a path crossing the given rectangle."""
+        x1, y1, x2, y2 = rect
+        found = []
+        for connector in self.routes.overlapping(rect):
+            path = self.paths[connector]
+            for (ax, ay), (bx, by) in zip(path, path[1:]):
+                if min(ax, bx) <= x2 and x1 <= max(ax, bx) and \
+                        min(ay, by) <= y2 and y1 <= max(ay, by):
+                    found.append(connector)
+                    break
+        return found
+
+    def overlap_cost(self, point, ignore=()):
+        """How crowded the canvas is around point (see crowding_cost), not
+        counting the obstacles in ignore.
+        """
+        covering, near = self.occupancy(point)
+        return crowding_cost(
+            sum(1 for obstacle in covering if obstacle not in ignore),
+            sum(1 for obstacle in near if obstacle not in ignore))
+
+    def occupancy(self, point):
+        """The obstacles covering and close to the given point, as a pair of
+        tuples.
+        """
+        c = self.cell_size
+        cell = (point[0] // c, point[1] // c)
+        if cell not in self._occupancy:
+            x, y = cell[0] * c + c / 2, cell[1] * c + c / 2
+            r, p = c / 2, self.proximity
+            covering = tuple(self.obstacles.overlapping((x - r, y - r,
+                                                         x + r, y + r)))
+            near = tuple(self.obstacles.overlapping((x - p, y - p,
+                                                     x + p, y + p)))
+            self._occupancy[cell] = covering, near
+        return self._occupancy[cell]
+
+    def _forget_occupancy(self, rect):
+        c, p = self.cell_size, self.proximity
+        x1, y1, x2, y2 = rect
+        for cx in range(int((x1 - p) // c), int((x2 + p) // c) + 1):
+            for cy in range(int((y1 - p) // c), int((y2 + p) // c) + 1):
+                self._occupancy.pop((cx, cy), None)
+
+    def route(self, connector, start, goal):
+        """Find and remember a path for the connector from start to goal,
+        returned as a list of corner points.  Obstacles the two ends are in
+        don't count, since every path has to leave them.  The plain elbow is
+        taken if nothing else is in its way, otherwise it's searched for.
+        """
+        ignore = self._containing(start) | self._containing(goal)
+        path = [start, (goal[0], start[1]), goal]
+        if self._blocked(path, ignore):
+            path = self._search(connector, start, goal, ignore)
+        self._forget_path(connector)
+        self.paths[connector] = path
+        xs, ys = [x for x, _ in path], [y for _, y in path]
+        self.routes.insert(connector, (min(xs), min(ys), max(xs), max(ys)))
+        return path
+
+    def _containing(self, point):
+        x, y = point
+        return self.obstacles.overlapping((x - 1, y - 1, x + 1, y + 1))
+
+    def _blocked(self, path, ignore):
+        """Does the path go through any obstacle not in ignore?"""
+        for (ax, ay), (bx, by) in zip(path, path[1:]):
+            segment = (min(ax, bx), min(ay, by), max(ax, bx), max(ay, by))
+            if self.obstacles.overlapping(segment) - ignore:
+                return True
+        return False
+
+    def _search(self, connector, start, goal, ignore):
+        c = self.cell_size
+        sx, sy = int(start[0] // c), int(start[1] // c)
+        gx, gy = int(goal[0] // c), int(goal[1] // c)
+        m = self.margin // c
+        lo_x, hi_x = min(sx, gx) - m, max(sx, gx) + m
+        lo_y, hi_y = min(sy, gy) - m, max(sy, gy) + m
+        occupancy, cell_cost = self._occupancy, {}
+        best = {(sx, sy): 0}
+        came_from = {}
+        # The counter breaks ties, keeping the search deterministic.
+        counter = itertools.count()
+        frontier = [(0, 0, next(counter), (sx, sy), None)]
+        # Give up (and draw an elbow) sooner for short connectors, which
+        # should never need to look far.
+        budget = min(self.max_expansions,
+                     200 + 4 * (abs(sx - gx) + abs(sy - gy)))
+        # Nor can it have more than the redraw has left.
+        limited = self._work_left is not None and self._work_left < budget
+        if limited:
+            budget = self._work_left
+        expansions = 0
+        while frontier and expansions < budget:
+            _, g, _, (x, y), direction = heapq.heappop(frontier)
+            if (x, y) == (gx, gy):
+                self._spend(expansions)
+                return self._corners(start, goal, (gx, gy), came_from)
+            if g > best[(x, y)]:
+                continue
+            expansions += 1
+            for step in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                nx, ny = x + step[0], y + step[1]
+                if not (lo_x <= nx <= hi_x and lo_y <= ny <= hi_y):
+                    continue
+                if (nx, ny) not in cell_cost:
+                    if (nx, ny) in occupancy and not any(occupancy[nx, ny]):
+                        cell_cost[nx, ny] = 0
+                    else:
+                        cell_cost[nx, ny] = self.overlap_cost((nx * c, ny * c),
+                                                              ignore)
+                cost = g + c + cell_cost[nx, ny]
+                if direction is not None and step != direction:
+                    cost += TURN_COST
+                if cost < best.get((nx, ny), cost + 1):
+                    best[(nx, ny)] = cost
+                    came_from[(nx, ny)] = (x, y)
+                    # Overestimating the distance left (weighted A*) finds a
+                    # good path while looking at far fewer cells.
+                    estimate = 2 * c * (abs(nx - gx) + abs(ny - gy))
+                    heapq.heappush(frontier, (cost + estimate, cost,
+                                              next(counter), (nx, ny), step))
+        # No luck, fall back on a plain elbow (for now, if it was the
+        # redraw's limit we ran into).
+        self._spend(expansions)
+        if limited:
+            self._deferred[connector] = None
+        return [start, (goal[0], start[1]), goal]
+
+    def _spend(self, expansions):
+        if self._work_left is not None:
+            self._work_left -= expansions
+
+    def _corners(self, start, goal, cell, came_from):
+        """Turn the chain of cells ending at cell into a path from start to
+        goal through the cells where it changes direction.  The first and
+        last corners are nudged to line up exactly with start and goal.
+        """
+        cells = [cell]
+        while cells[-1] in came_from:
+            cells.append(came_from[cells[-1]])
+        cells.reverse()
+        steps = [(bx - ax, by - ay) for (ax, ay), (bx, by) in
+                 zip(cells, cells[1:])]
+        c = self.cell_size
+        corners = [[cells[i + 1][0] * c, cells[i + 1][1] * c]
+                   for i in range(len(steps) - 1) if steps[i] != steps[i + 1]]
+        if not corners:
+            return [start, (goal[0], start[1]), goal]
+        # Horizontal segments keep their y, vertical ones their x.
+        axis = 1 if steps[0][1] == 0 else 0
+        corners[0][axis] = start[axis]
+        axis = 1 if steps[-1][1] == 0 else 0
+        corners[-1][axis] = goal[axis]
+        return [start] + [tuple(corner) for corner in corners] + [goal]
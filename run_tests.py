@@ -1,39 +1,393 @@
 #!/usr/bin/env python3
 """Runs all specified tests for the envdraw program.
 
+Each test is a Python program, which is run headless.  The environment model
+it ends up with (frames, bindings and static links) is written out as a
+canonical snapshot and compared with the golden snapshot stored next to it
+(tests/foo.py has its snapshot in tests/foo.snapshot).  Run with --update to
+write the snapshots of the current behaviour instead, once you've checked
+it's right.
+
+A test can ask to be run differently with "# run_tests:" comments at the
+top, each holding options like these:
+    include=NAME,... / exclude=NAME,... -- Trace only some functions, like
+    examine.py's --include and --exclude.
+    sample_every=N / min_depth=N / max_depth=N -- Sample the calls (frames
+    recorded while sampling are marked in the snapshot).
+    max_rate=K -- Record at most K calls a second, timed by a clock which
+    moves on a quarter of a second every time the sampler reads it, so the
+    test doesn't depend on how fast it runs.
+    recursion_budget=N / prune -- Draw the diagram like this (these imply
+    draw).
+    draw -- Also snapshot what got drawn: how each frame and function is
+    shown, and the box and pointer objects.
+    trace=N,... -- Record a trace file and snapshot the model as it was
+    after each of those steps, seeking to them in the file.
+    checkpoint_interval=N -- Checkpoint the trace as often as every N steps
+    (rather than every tracefile.MIN_CHECKPOINT_INTERVAL), so seeks in a
+    small test go through checkpoints.
+    step=N,... -- Keep a History and snapshot the model after each of those
+    steps, got by stepping back from the end.
+    console -- Run the program a statement at a time through the
+    interactive console, rather than as a file.
+    counters -- Count envdraw's own calls into a --counters-file, and
+    snapshot how often the functions in COUNTED were called, as read back
+    from the file.
+
+Tests are spread across a pool of processes, since every run has its own
+Tracker and globals in examine.py.
+
+Usage: python3 run_tests.py [--update] [--backend BACKEND] [FILE_OR_DIR ...]
+
 Written by Tom Magrino
 """
 
-import sys, os, examine
+import argparse
+import difflib
+import io
+import os
+import re
+import sys
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, redirect_stderr, redirect_stdout
 
-def run_tests(files_or_directories):
-    results = {}
-    number_ran, number_passed = 0, 0
-    while files_or_directories:
-        filename = files_or_directories.pop(0)
+import examine
+import model
+
+SNAPSHOT_EXT = ".snapshot"
+OPTIONS = re.compile(r"#\s*run_tests:(.*)")
+# Memory addresses change from run to run.
+ADDRESS = re.compile(r"\b0x[0-9a-fA-F]+\b")
+# How far the max_rate option's clock moves on each time it's read.
+CLOCK_TICK = 0.25
+# What the counters option snapshots, out of everything counters.py counts:
+# the rest take times or call counts which differ between backends.
+COUNTED = ("examine.funcdef", "examine.FunctionRegistry.register",
+           "examine.Tracker.defined_function",
+           "examine.Tracker.enter_function", "examine.Tracker.exit_function")
+
+
+def model_names(frames, functions):
+    """Names for model frames and functions, numbered in the order they
+    were created.
+    """
+    frame_names = {}
+    for i, frame in enumerate(frames):
+        frame_names[frame] = "global" if frame.is_global else "f{0}".format(i)
+    function_names = {}
+    for function in functions:
+        function_names[function] = "{0}#{1}".format(function.name,
+                                                    len(function_names))
+    return frame_names, function_names
+
+
+def snapshot(tracker):
+    """A canonical text version of the tracker's environment model.  Frames
+    and functions are numbered in the order they were created.  It ends with
+    the frames still on the call stack, and those of generators which are
+    suspended.
+    """
+    text = model_snapshot(tracker.frames, tracker.functions.values())
+    frame_names, _ = model_names(tracker.frames, ())
+    suspended = set(tracker.suspended.values())
+    return text + "stack: {0}\nsuspended: {1}\n".format(
+        " ".join(frame_names[frame] for frame in tracker.call_stack),
+        " ".join(frame_names[frame] for frame in tracker.frames
+                 if frame in suspended) or "-")
+
+
+def model_snapshot(frames, functions, briefs=False):
+    """The text of snapshot for the given frames and functions.  If briefs
+    is True, bound values hold the text that was shown for them (like a
+    TraceState's) rather than the objects.
+    """
+    frame_names, function_names = model_names(frames, functions)
+    lines = []
+    for function in function_names:
+        lines.append("function {0}({1}) [parent={2}]".format(
+            function_names[function], ", ".join(function.arguments),
+            frame_names.get(function.parent, "?")))
+    for frame in frames:
+        if frame.is_global:
+            lines.append("frame global")
+        else:
+            lines.append("frame {0}: {1} [parent={2}]{3}".format(
+                frame_names[frame], function_names.get(frame.function, "?"),
+                frame_names.get(frame.parent, "?"),
+                " sampled" if frame.sampled else ""))
+        for name, value in frame.bindings.items():
+            if isinstance(value, model.Function):
+                shown = "function " + function_names.get(value, "?")
+            elif briefs:
+                shown = value.obj
+            else:
+                shown = ADDRESS.sub("0x?", repr(value.obj))
+            lines.append("    {0} = {1}".format(name, shown))
+    return "\n".join(lines) + "\n"
+
+
+def state_snapshot(state):
+    """model_snapshot of a TraceState (from a trace file or a History), with
+    the frames which had returned by then marked.
+    """
+    functions = [obj for obj in state.objects.values()
+                 if isinstance(obj, model.Function)]
+    text = model_snapshot(state.frames, functions, briefs=True)
+    exited = [obj for obj_id, obj in state.objects.items()
+              if obj_id in state.exited]
+    frame_names, _ = model_names(state.frames, ())
+    return text + "exited: {0}\n".format(
+        " ".join(frame_names[frame] for frame in exited) or "-")
+
+
+def drawing_snapshot(tracker, renderer):
+    """How a TkRenderer drew the tracker's model: for each frame and
+    function whether it's drawn, collapsed or pruned, what each drawn frame's
+    variables point at, and the contents of every box and pointer object.
+    """
+    import components
+    frame_names, function_names = model_names(tracker.frames,
+                                              tracker.functions.values())
+    names = dict(frame_names)
+    names.update(function_names)
+    heap_names = {drawing: "h{0}".format(i)
+                  for i, drawing in enumerate(renderer.heap.values())}
+    drawn_as = {drawing: obj for obj, drawing in renderer.drawn.items()
+                if isinstance(obj, model.Function)}
+
+    def shown(drawing):
+        if drawing in heap_names:
+            return heap_names[drawing]
+        if drawing in drawn_as:
+            return "function " + names[drawn_as[drawing]]
+        if isinstance(drawing, components.Value):
+            return ADDRESS.sub("0x?", repr(drawing.obj))
+        return "?"
+
+    lines = []
+    for obj in list(function_names) + list(frame_names):
+        drawing = renderer.drawn.get(obj)
+        if obj in renderer.collapsed:
+            lines.append("{0}: collapsed ({1})".format(names[obj],
+                                                       drawing.label))
+        elif drawing is None:
+            lines.append("{0}: {1}".format(
+                names[obj], "pruned" if obj in renderer.pruned else
+                "not drawn"))
+        else:
+            lines.append("{0}: drawn".format(names[obj]))
+        if isinstance(obj, model.Frame) and obj not in renderer.collapsed \
+                and drawing is not None:
+            for binding in drawing.bindings:
+                lines.append("    {0} -> {1}".format(binding.variable.name,
+                                                     shown(binding.value)))
+    for drawing, name in heap_names.items():
+        cells = sorted(drawing.contents.items())
+        lines.append("{0}: {1} [{2}]".format(
+            name, type(drawing.obj).__name__, ", ".join(
+                content if isinstance(content, str) else shown(content)
+                for _, content in cells)))
+    return "\n".join(lines) + "\n"
+
+
+def read_options(filename):
+    """The options given in a test's "# run_tests:" comments, as a dict."""
+    options = {}
+    with open(filename) as f:
+        for line in f:
+            match = OPTIONS.match(line)
+            if not match:
+                break
+            for option in match.group(1).split():
+                name, _, value = option.partition("=")
+                options[name] = value or True
+    return options
+
+
+def run_console(filename, tracker):
+    """Run a program through EnvDrawConsole, a top level statement at a
+    time.
+    """
+    import ast
+    from interactive import EnvDrawConsole
+    with open(filename) as f:
+        source = f.read()
+    lines = source.splitlines(True)
+    namespace = {var: examine.__dict__[var] for var in examine.IGNORE_VARS
+                 if var in examine.__dict__}
+    console = EnvDrawConsole(locals=namespace, filename=filename,
+                             tracker=tracker)
+    for statement in ast.parse(source).body:
+        first = min([statement.lineno] +
+                    [d.lineno for d in getattr(statement, "decorator_list",
+                                               ())])
+        console.runsource("".join(lines[first - 1:statement.end_lineno]) +
+                          "\n", filename, "exec")
+
+
+def run_program(filename, options, backend):
+    """Run a test program with its options, returning its snapshot."""
+    def steps(option):
+        return [int(n) for n in options[option].split(",")]
+    if "console" in options:
+        tracker = examine.Tracker()
+        run_console(filename, tracker)
+        return snapshot(tracker)
+    sampler = None
+    if any(option in options for option in ("sample_every", "min_depth",
+                                              "max_depth", "max_rate")):
+        from itertools import count
+        from sampling import Sampler
+        ticks = count()
+        sampler = Sampler(int(options.get("sample_every", 1)),
+                          int(options.get("min_depth", 0)) or None,
+                          int(options.get("max_depth", 0)) or None,
+                          float(options.get("max_rate", 0)) or None,
+                          clock=lambda: next(ticks) * CLOCK_TICK)
+    draw = any(option in options for option in ("draw", "prune",
+                                                "recursion_budget"))
+    with tempfile.TemporaryDirectory() as tmpdir, ExitStack() as stack:
+        trace_file = image_file = counters_file = None
+        if "trace" in options:
+            trace_file = os.path.join(tmpdir, "test.trace")
+            if "checkpoint_interval" in options:
+                import tracefile
+                from unittest import mock
+                # Put back afterwards, for the worker's next test.
+                stack.enter_context(mock.patch.object(
+                    tracefile, "MIN_CHECKPOINT_INTERVAL",
+                    int(options["checkpoint_interval"])))
+        if draw:
+            image_file = os.path.join(tmpdir, "test.svg")
+        if "counters" in options:
+            counters_file = os.path.join(tmpdir, "counters.json")
+        tracker = examine.run(
+                filename, wait=False, backend=backend, headless=True,
+                include=options.get("include", "").split(",") if
+                "include" in options else None,
+                exclude=options.get("exclude", "").split(",") if
+                "exclude" in options else None,
+                recursion_budget=int(options.get("recursion_budget", 0))
+                or None, prune="prune" in options, sampler=sampler,
+                step="step" in options, trace_file=trace_file,
+                image_file=image_file, counters_file=counters_file)
+        sections = [snapshot(tracker)]
+        if draw:
+            from renderer import TkRenderer
+            renderer, = [r for r in tracker.renderers
+                         if isinstance(r, TkRenderer)]
+            sections.append("drawn:\n" + drawing_snapshot(tracker, renderer))
+        if trace_file is not None:
+            from tracefile import TraceReader
+            reader = TraceReader(trace_file)
+            for step in steps("trace"):
+                sections.append("trace step {0} of {1}:\n{2}".format(
+                    step, len(reader), state_snapshot(reader.state_at(step))))
+            reader.close()
+        if counters_file is not None:
+            import json
+            with open(counters_file) as f:
+                counted = json.load(f)
+            sections.append("counted:\n" + "".join(
+                "    {0}: {1} calls\n".format(name, counted[name]["calls"])
+                for name in COUNTED))
+        if "step" in options:
+            history = tracker.history
+            state = history.state_at(len(history))
+            at = len(history)
+            for step in sorted(steps("step"), reverse=True):
+                state = history.retreat(state, at, step)
+                at = step
+                sections.append("history step {0} of {1}:\n{2}".format(
+                    step, len(history), state_snapshot(state)))
+    return "\n".join(sections)
+
+
+def snapshot_path(filename):
+    return os.path.splitext(filename)[0] + SNAPSHOT_EXT
+
+
+def run_test(filename, backend="ast", update=False):
+    """Run one test, returning (filename, passed, message)."""
+    try:
+        options = read_options(filename)
+        # The program's output would just get in the way of the results.
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            actual = run_program(filename, options, backend)
+    except Exception:
+        return filename, False, traceback.format_exc()
+    path = snapshot_path(filename)
+    if update:
+        with open(path, "w") as f:
+            f.write(actual)
+        return filename, True, "updated " + path
+    if not os.path.exists(path):
+        return filename, False, "no snapshot, run with --update to make " + \
+                path
+    with open(path) as f:
+        expected = f.read()
+    if actual == expected:
+        return filename, True, ""
+    diff = difflib.unified_diff(expected.splitlines(True),
+                                actual.splitlines(True), path, "actual")
+    return filename, False, "".join(diff)
+
+
+def find_tests(files_or_directories):
+    found = []
+    for filename in files_or_directories:
         if os.path.isdir(filename):
-            internal_files = [os.path.join(filename, dfile) for dfile in
-                              os.listdir(filename)]
-            files_or_directories.extend(internal_files)
-        elif ".py" == os.path.basename(filename)[-3:]:
-            print("Running test:", filename)
-            print("-" * 80)
-            with open(filename) as f:
-                print(f.read())
-            print("-" * 80)
-            examine.run(filename, locals(), wait=False)
-            number_ran += 1
+            for root, dirs, files in os.walk(filename):
+                dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+                found.extend(os.path.join(root, f) for f in sorted(files)
+                             if f.endswith(".py"))
+        elif filename.endswith(".py"):
+            found.append(filename)
+    return found
 
-            correct = '?'
-            while correct not in ('y','n'):
-                correct = input("Is this correct? [y/n] ").lower()
-            results[filename] = (correct == 'y')
-            if results[filename]:
+
+def run_tests(files_or_directories, backend="ast", update=False,
+              workers=None):
+    """Run every test in the given files and directories, printing the
+    results, and return whether they all passed.
+    """
+    tests = find_tests(files_or_directories)
+    number_ran, number_passed = 0, 0
+    workers = workers or os.cpu_count() or 1
+    # Big chunks for big corpora, so workers aren't waiting on the pool.
+    chunksize = max(1, len(tests) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(run_test, tests, [backend] * len(tests),
+                           [update] * len(tests), chunksize=chunksize)
+        for filename, passed, message in results:
+            number_ran += 1
+            if passed:
                 number_passed += 1
-    print("Results:")
-    for filename, passed in results.items():
-        print("        {0}: {1}".format(filename, passed))
+            print("{0}: {1}".format(filename, "ok" if passed else "FAILED"))
+            if message and (update or not passed):
+                print(message.rstrip("\n"))
     print("{0}/{1} tests passed.".format(number_passed, number_ran))
+    return number_passed == number_ran
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Check the environment models of test programs "
+            "against their snapshots.")
+    parser.add_argument("tests", nargs="*", default=["tests"],
+                        help="test programs, or directories of them")
+    parser.add_argument("--update", action="store_true",
+                        help="write new snapshots instead of checking them")
+    parser.add_argument("--backend", default="ast",
+                        choices=("ast", "monitoring", "settrace"))
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of processes to use")
+    args = parser.parse_args()
+    ok = run_tests(args.tests, args.backend, args.update, args.workers)
+    sys.exit(0 if ok else 1)
+
 
 if __name__ == "__main__":
-    run_tests(sys.argv[1:])
+    main()
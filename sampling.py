@@ -0,0 +1,93 @@
+"""sampling.py
+
+Recording only some of the calls a program makes, for programs making far
+too many for every one to be recorded (let alone drawn).
+
+A Tracker given a Sampler (see examine.run's sampler argument, or the
+--sample-* options of examine.py) asks it about every call of a traced
+function before doing anything else.  A call it turns down costs next to
+nothing: it isn't looked up in the registry or given a frame in the model,
+and nothing is bound when it returns.  Calls made from inside it are asked
+about in turn, and are drawn (if they're recorded) hanging off the frame their
+function was defined in as usual.  The one exception is a call defining a
+function, which is recorded after all when it does, since the function needs
+its frame as its parent.
+
+Frames recorded while sampling are marked as sampled (model.Frame.sampled),
+and drawn that way, since the calls around them may well be missing.
+"""
+
+from time import perf_counter
+
+
+class Sampler(object):
+    """Decides which calls get recorded.
+
+    Arguments:
+        every -- Only record every Nth call (of those the depths allow),
+        starting with the first.
+        min_depth, max_depth -- Only record calls made at least (or at most)
+        this deep on the call stack, counting calls from the top level of the
+        program as depth 1 and counting calls which weren't recorded.
+        rate -- Record at most this many calls a second (allowing bursts of
+        up to a second's worth), dropping the rest.  It has to be at least 1,
+        or not even the first call would fit in a second's worth.
+        clock -- Where the time's read from, in seconds.
+
+    Values that could never record anything (or divide by zero) raise a
+    ValueError.
+    """
+
+    def __init__(self, every=1, min_depth=None, max_depth=None, rate=None,
+                 clock=perf_counter):
+        if every < 1:
+            raise ValueError("every must be at least 1, not {0}".format(
+                every))
+        for name, depth in (("min_depth", min_depth),
+                            ("max_depth", max_depth)):
+            if depth is not None and depth < 1:
+                raise ValueError("{0} must be at least 1, not {1}".format(
+                    name, depth))
+        if min_depth is not None and max_depth is not None and \
+                min_depth > max_depth:
+            raise ValueError("min_depth ({0}) is more than max_depth "
+                             "({1})".format(min_depth, max_depth))
+        if rate is not None and rate < 1:
+            raise ValueError("rate must be at least 1, not {0}".format(rate))
+        self.every = every
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.rate = rate
+        self.clock = clock
+        self.calls = 0 # Calls the depths allowed
+        self.recorded = 0
+        self._allowance = rate
+        self._last = None
+
+    def sample(self, depth):
+        """Should a call made at the given depth be recorded?"""
+        if self.min_depth is not None and depth < self.min_depth:
+            return False
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        self.calls += 1
+        if (self.calls - 1) % self.every:
+            return False
+        if self.rate is not None and not self._allowed():
+            return False
+        self.recorded += 1
+        return True
+
+    def _allowed(self):
+        """Take one call out of the allowance, topping it up by rate for
+        every second since last time (a token bucket).
+        """
+        now = self.clock()
+        if self._last is not None:
+            self._allowance = min(self.rate, self._allowance +
+                                  (now - self._last) * self.rate)
+        self._last = now
+        if self._allowance < 1:
+            return False
+        self._allowance -= 1
+        return True
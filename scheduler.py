@@ -0,0 +1,69 @@
+"""scheduler.py
+
+Coalesced redrawing of Connectors.
+
+Moving one element moves everything bound to it, and each of those wants its
+Connectors redrawn, so dragging a Frame used to redraw the same arrows many
+times over for every mouse event.  A RedrawScheduler is attached to a canvas
+(as canvas.scheduler) and Connectors just mark themselves dirty with it.  The
+dirty ones are redrawn once, the next time Tk is idle, which is also when
+they're routed around the other elements if the canvas has a Router (see
+routing.py).
+"""
+
+
+class RedrawScheduler(object):
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        # Used as an ordered set, so connectors are redrawn in the order they
+        # were marked.
+        self.dirty = {}
+        self._pending = None
+
+    def mark(self, connector):
+        """Redraw connector the next time Tk is idle."""
+        self.dirty[connector] = None
+        if self._pending is None:
+            self._pending = self.canvas.after_idle(self._idle)
+
+    def discard(self, connector):
+        """Don't redraw connector after all (it's been deleted)."""
+        self.dirty.pop(connector, None)
+
+    def flush(self):
+        """Redraw every dirty connector now."""
+        if self._pending is not None:
+            self.canvas.after_cancel(self._pending)
+            self._pending = None
+        # Redrawing can't mark anything else dirty at the moment, but loop
+        # just in case.
+        while self.dirty:
+            dirty, self.dirty = self.dirty, {}
+            for connector in dirty:
+                connector.redraw()
+
+    def cancel(self):
+        """Forget about every dirty connector, say because the canvas has
+        been cleared.
+        """
+        if self._pending is not None:
+            self.canvas.after_cancel(self._pending)
+            self._pending = None
+        self.dirty = {}
+
+    def _idle(self):
+        self._pending = None
+        router = getattr(self.canvas, 'router', None)
+        if router is None:
+            self.flush()
+            return
+        # Don't hold Tk up routing everything at once: what doesn't fit in
+        # this redraw's work gets routed in the next.
+        router.start_redraw()
+        try:
+            self.flush()
+        finally:
+            deferred = router.end_redraw()
+        for connector in deferred:
+            self.mark(connector)
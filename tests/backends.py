@@ -0,0 +1,35 @@
+# Every backend should draw the same diagram, including for calls which
+# raise and generators, which leave their frame and come back to it.
+
+def check(n):
+    if n < 0:
+        raise ValueError(n)
+    return n
+
+def safe(n):
+    try:
+        return check(n)
+    except ValueError:
+        return 0
+
+def squares(n):
+    for i in range(n):
+        yield i * i
+
+def add(a, b):
+    return a + b
+
+def fact(n):
+    if n == 0:
+        return 1
+    return n * fact(n - 1)
+
+a = safe(-1)
+b = safe(2)
+total = 0
+for sq in squares(3):
+    total = add(total, sq)
+for first in squares(5):
+    break
+double = lambda x: x * 2
+d = double(fact(3))
@@ -0,0 +1,39 @@
+# batch.py reports the programs which fail, time out or exit with an error
+# in its summary, and exits with status 1 if there are any.
+import os
+import subprocess
+import sys
+import tempfile
+
+PROGRAMS = {
+    "works.py": "x = 1\n",
+    "raises.py": "def f():\n    return 1 / 0\n\nf()\n",
+    "exits.py": "import sys\nsys.exit(3)\n",
+    "loops.py": "while True:\n    pass\n",
+}
+
+
+def run_batch(): # envdraw: skip
+    """Run batch.py on PROGRAMS, returning its exit status, how many
+    diagrams it says it drew and the lines listing the failures.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        programs = os.path.join(directory, "programs")
+        os.mkdir(programs)
+        for name, source in PROGRAMS.items():
+            with open(os.path.join(programs, name), "w") as f:
+                f.write(source)
+        done = subprocess.run(
+                [sys.executable, os.path.join(root, "batch.py"), "--timeout",
+                 "2", "--output", "diagrams", "programs"],
+                cwd=directory, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, universal_newlines=True)
+    lines = done.stdout.splitlines()
+    summary, = [line for line in lines if "diagrams drawn" in line]
+    failed = sorted(line.strip()
+                    for line in lines[lines.index("Failed:") + 1:])
+    return done.returncode, summary.split(" in ")[0], failed
+
+
+status, drawn, failed = run_batch()
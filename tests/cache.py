@@ -0,0 +1,47 @@
+# Instrumented code written to a cache directory is loaded back by another
+# cache (one that doesn't have it in memory), and isn't once the source or
+# the instrumenter's version changes.
+import os
+import tempfile
+
+import envdraw
+from codecache import CodeCache
+
+SOURCE = "def square(x):\n    return x * x\n"
+
+
+def check(): # envdraw: skip
+    """Each cache's hits and misses (along with the files written, or
+    whether the code read back works), and the files written in the end.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        writer = CodeCache(directory=directory)
+        written = writer.compile(SOURCE, "square.py")
+        results.append((writer.hits, writer.misses,
+                        len(os.listdir(directory))))
+        reader = CodeCache(directory=directory)
+        read = reader.compile(SOURCE, "square.py")
+        namespace = {"funcdef": lambda *args, **kwargs: lambda fn: fn,
+                     "funccall": lambda: None,
+                     "funcreturn": lambda val=None: val}
+        exec(read, namespace)
+        results.append((reader.hits, reader.misses,
+                        read == written and namespace["square"](3) == 9))
+        edited = CodeCache(directory=directory)
+        edited.compile(SOURCE + "y = 1\n", "square.py")
+        results.append((edited.hits, edited.misses))
+        version = envdraw.INSTRUMENTER_VERSION
+        envdraw.INSTRUMENTER_VERSION += 1
+        try:
+            upgraded = CodeCache(directory=directory)
+            upgraded.compile(SOURCE, "square.py")
+            results.append((upgraded.hits, upgraded.misses))
+        finally:
+            envdraw.INSTRUMENTER_VERSION = version
+        files = len(os.listdir(directory))
+    return results, files
+
+
+results, files = check()
+written, read, edited, upgraded = results
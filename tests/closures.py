@@ -0,0 +1,25 @@
+def foo(x):
+    def bar(y):
+        return y
+    return bar
+
+a = foo(1)
+b = foo(2)
+r = a(5)
+
+def same(x):
+    def get():
+        return x
+    return get
+
+c = same(7)
+d = same(7)
+s = c()
+t = d()
+
+def keywords(x, *, y=1):
+    return sorted(locals())
+
+names = keywords(0)
+defaults = keywords.__kwdefaults__
+get_defaults = c.__kwdefaults__
@@ -0,0 +1,15 @@
+# run_tests: recursion_budget=2
+# Recursive calls deeper than the budget are drawn as one collapsed frame
+# standing in for them, though the model still has every frame.
+
+def fact(n):
+    if n == 0:
+        return 1
+    return n * fact(n - 1)
+
+def countdown(n):
+    if n > 0:
+        countdown(n - 1)
+
+x = fact(5)
+countdown(2)
@@ -0,0 +1,17 @@
+# run_tests: console
+# Typed into the console a statement at a time, the global frame is brought
+# up to date after each one, including changes made without calling
+# anything.
+
+def fact(n):
+    if n == 0:
+        return 1
+    return n * fact(n - 1)
+
+xs = [1, 2]
+ys = [xs, xs]
+xs.append(3)
+r = fact(3)
+r = r + 1
+double = lambda x: x * 2
+d = double(r)
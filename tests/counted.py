@@ -0,0 +1,11 @@
+# run_tests: counters
+# With --counters-file, how often envdraw's own functions were called is
+# saved as JSON once the program's finished.
+
+def square(x):
+    return x * x
+
+def twice(f, x):
+    return f(f(x))
+
+result = twice(square, 3)
@@ -0,0 +1,24 @@
+import functools
+
+def trace(f):
+    def wrapper(*args):
+        return f(*args)
+    return wrapper
+
+def logged(f):
+    @functools.wraps(f)
+    def inner(x):
+        return f(x)
+    return inner
+
+@trace
+def add(a, b):
+    s = a + b
+    return s
+
+@logged
+def square(x):
+    return x * x
+
+total = add(1, 2)
+sq = square(3)
@@ -0,0 +1,24 @@
+# run_tests: exclude=helper_*,@functools.lru_cache
+# Functions matched by --exclude (by name, or by decorator if the pattern
+# starts with @), or marked "# envdraw: skip", run untraced: their calls get
+# no frames, though the functions are still drawn when bound.
+import functools
+
+def helper_double(x):
+    return x * 2
+
+@functools.lru_cache(maxsize=None)
+def cached_square(x):
+    return x * x
+
+def skipped(x): # envdraw: skip
+    return x + 1
+
+# envdraw: skip
+def also_skipped(x):
+    return x - 1
+
+def traced(x):
+    return helper_double(skipped(also_skipped(cached_square(x))))
+
+result = traced(5)
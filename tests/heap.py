@@ -0,0 +1,21 @@
+# run_tests: draw
+# Lists, tuples and dicts are drawn once however many names (or other
+# objects) refer to them, cycles point back at the object already drawn, and
+# functions inside them point at the function's drawing.
+
+def square(x):
+    return x * x
+
+nums = [1, 2, 3]
+alias = nums
+pair = (nums, "a")
+loop = [0]
+loop.append(loop)
+table = {"nums": nums, "f": square}
+fs = [square, 1]
+
+def grow(xs):
+    xs.append(len(xs) + 1)
+    return xs
+
+same = grow(nums)
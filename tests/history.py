@@ -0,0 +1,10 @@
+# run_tests: step=0,5,10,11
+# Stepping back through a History undoes each step, frames, bindings and
+# rebindings alike, back to the model as it was then.
+
+def inc(n):
+    return n + 1
+
+x = inc(1)
+x = inc(x)
+y = [x]
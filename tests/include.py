@@ -0,0 +1,13 @@
+# run_tests: include=outer,inner
+# With --include only the functions matched are traced.
+
+def outer(n):
+    return inner(n) + untraced(n)
+
+def inner(n):
+    return n * n
+
+def untraced(n):
+    return n + 1
+
+result = outer(3)
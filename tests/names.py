@@ -0,0 +1,13 @@
+# Names examine.run uses itself are the program's own to use, and it's run
+# as a script.
+
+f = lambda x: x * 2
+
+def h(code):
+    step = code + 1
+    return step
+
+z = h(1)
+source = f(z)
+if __name__ == "__main__":
+    tracer = "main"
@@ -0,0 +1,17 @@
+# run_tests: prune
+# Returned frames nothing can reach any more are pruned, but a frame is kept
+# while a function defined in it is reachable, even from inside a list.
+
+def make(n):
+    def get():
+        return n
+    return get
+
+def square(x):
+    return x * x
+
+kept = make(1)
+h = [make(5)]
+gone = make(2)
+gone = None
+y = square(3)
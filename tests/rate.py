@@ -0,0 +1,12 @@
+# run_tests: max_rate=2
+# With --max-rate calls are recorded as long as there's allowance left, which
+# starts at a second's worth (two calls) and grows by the rate as time goes
+# by.  The test's clock moves on a quarter of a second every call, so once
+# the first burst is used up every other call is recorded.
+
+def square(x):
+    return x * x
+
+total = 0
+for i in range(8):
+    total = total + square(i)
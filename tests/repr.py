@@ -0,0 +1,32 @@
+# Binding a Point runs its __repr__ (to tell when it changes), which mustn't
+# be drawn, or bind anything itself, as a call of the program's.  Calls the
+# program makes to __repr__ are drawn as usual.  A function whose finally
+# raises after it's returned is exited just the once.
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __repr__(self):
+        return "Point({0}, {1})".format(self.x, self.y)
+
+def shift(p, dx):
+    return Point(p.x + dx, p.y)
+
+def checked(n):
+    try:
+        return n
+    finally:
+        if n < 0:
+            raise ValueError(n)
+
+def safe(n):
+    try:
+        return checked(n)
+    except ValueError:
+        return 0
+
+p = shift(Point(1, 2), 3)
+text = repr(p)
+z = safe(-1)
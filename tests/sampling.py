@@ -0,0 +1,19 @@
+# run_tests: sample_every=2
+# Only every other call is recorded, except that a call defining a function
+# is always recorded (late, when it does), since the function needs its
+# frame as its parent.
+
+def square(x):
+    return x * x
+
+def make(n):
+    def get():
+        return n
+    return get
+
+total = 0
+for i in range(5):
+    total = total + square(i)
+skip = square(9)
+first = make(7)
+second = make(8)
@@ -0,0 +1,35 @@
+# A generator which has yielded isn't running, and nor is a lambda which
+# raised, so neither is the current frame afterwards: functions defined later
+# at the top level belong to the global frame.  A generator carrying on is
+# back in its own frame, though, even inside a yield from.
+
+def squares(n):
+    for i in range(n):
+        yield i * i
+
+def adders(n):
+    for i in range(n):
+        def add(x):
+            return x + i
+        yield add
+
+def both(n):
+    yield from squares(n)
+    yield from adders(n)
+
+g = squares(3)
+first = next(g)
+bad = lambda x: 1 // x
+try:
+    bad(0)
+except ZeroDivisionError:
+    pass
+
+def later():
+    return 1
+
+l = later()
+add_one = next(adders(2))
+b = both(2)
+firsts = [next(b), next(b), next(b)]
+two = add_one(1)
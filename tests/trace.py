@@ -0,0 +1,15 @@
+# run_tests: trace=0,4,12,26,32 checkpoint_interval=4
+# Seeking in a trace file, both from the start and from checkpoints part
+# way through it, should get back the model as it was at that step.
+
+def square(x):
+    return x * x
+
+def sum_squares(n):
+    total = 0
+    for i in range(1, n + 1):
+        total = total + square(i)
+    return total
+
+result = sum_squares(3)
+result = sum_squares(2)
@@ -0,0 +1,302 @@
+"""tracefile.py
+
+A compact, seekable on-disk format for recording how the environment model
+changes while a program runs, so a diagram can be replayed (see replay.py)
+after the program, and its window, are long gone.
+
+A TraceWriter is a renderer (see examine.Tracker): every change the Tracker
+makes to the model is appended to the file as one step.  The file looks like:
+
+    header      MAGIC, format version
+    records     one record per step, with a checkpoint of the whole model
+                written between steps every so often
+    strings     every variable/function/argument name, referenced by index
+    step index  the file offset of every step's record
+    checkpoints (step, offset) of every checkpoint
+    trailer     offsets and lengths of the three tables above
+
+A TraceReader memory-maps the file and rebuilds the model as of any step by
+loading the closest checkpoint before it and applying the steps after that,
+so jumping to step N never replays the trace from the start.  Checkpoints are
+written once the steps since the last one outnumber the objects in the model,
+which keeps the file at most about twice the size of the steps alone while
+bounding the work to reach any step by the size of the model.
+"""
+
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+import brief
+import model
+
+MAGIC = b"ENVDRAW\x00"
+VERSION = 3
+
+# Record opcodes
+FRAME, FUNCTION, BIND, REBIND, EXIT, END = range(1, 7)
+# Kinds of bound values
+VALUE, FUNCTION_VALUE = range(2)
+
+NONE = 0xFFFFFFFF
+MIN_CHECKPOINT_INTERVAL = 1024
+
+_HEADER = struct.Struct("<8sH")
+_FRAME = struct.Struct("<BIIIIB")
+_FUNCTION = struct.Struct("<BIIIH")
+_BIND_HEAD = struct.Struct("<BII")
+_BOUND = struct.Struct("<BI")
+_BIND = struct.Struct("<BIIBI")
+_EXIT = struct.Struct("<BI")
+_U32 = struct.Struct("<I")
+_TRAILER = struct.Struct("<QQQQQ8s")
+
+
+class TraceWriter(object):
+    """Renderer which streams changes to the environment model into a trace
+    file.  Call close() once the program is done to write out the index.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(_HEADER.pack(MAGIC, VERSION))
+        self._ids = {} # Model object -> id, in creation order
+        self._creations = [] # The record which created each object
+        self._bindings = {} # Frame id -> {name id: encoded value}
+        self._exited = []
+        self._strings = {}
+        self._steps = array("Q")
+        self._checkpoints = array("Q")
+        self._since_checkpoint = 0
+        self._size = 0
+
+    def frame_created(self, frame):
+        frame_id = self._new_id(frame)
+        record = _FRAME.pack(FRAME, frame_id, self._id(frame.parent),
+                             self._id(frame.function), frame.depth,
+                             frame.sampled)
+        self._creations.append(record)
+        self._bindings[frame_id] = {}
+        self._step(record)
+
+    def function_created(self, function):
+        record = _FUNCTION.pack(FUNCTION, self._new_id(function),
+                                self._id(function.parent),
+                                self._string(function.name),
+                                len(function.arguments))
+        record += b"".join(_U32.pack(self._string(arg))
+                           for arg in function.arguments)
+        self._creations.append(record)
+        self._step(record)
+
+    def binding_added(self, frame, name, value):
+        self._step(self._bind(BIND, frame, name, value))
+
+    def binding_updated(self, frame, name, value):
+        self._step(self._bind(REBIND, frame, name, value))
+
+    def frame_exited(self, frame):
+        record = _EXIT.pack(EXIT, self._ids[frame])
+        self._exited.append(record)
+        self._step(record)
+
+    def close(self):
+        """Write out the string table and indexes, and close the file."""
+        strings_offset = self.file.tell()
+        self.file.write(_U32.pack(len(self._strings)))
+        for string in self._strings:
+            encoded = string.encode("utf-8")
+            self.file.write(_U32.pack(len(encoded)) + encoded)
+        steps_offset = self.file.tell()
+        self._steps.tofile(self.file)
+        checkpoints_offset = self.file.tell()
+        self._checkpoints.tofile(self.file)
+        self.file.write(_TRAILER.pack(strings_offset, steps_offset,
+                                      len(self._steps), checkpoints_offset,
+                                      len(self._checkpoints) // 2, MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_id(self, obj):
+        self._ids[obj] = len(self._ids)
+        self._size += 1
+        return self._ids[obj]
+
+    def _id(self, obj):
+        return NONE if obj is None else self._ids[obj]
+
+    def _string(self, string):
+        if string not in self._strings:
+            self._strings[string] = len(self._strings)
+        return self._strings[string]
+
+    def _bind(self, opcode, frame, name, value):
+        frame_id, name_id = self._ids[frame], self._string(name)
+        if isinstance(value, model.Function):
+            encoded = _BOUND.pack(FUNCTION_VALUE, self._ids[value])
+        else:
+            text = brief.CACHE.get(value.obj, value.snapshot,
+                                   brief.EXPANDED_CHARS).encode("utf-8")
+            encoded = _BOUND.pack(VALUE, len(text)) + text
+        bindings = self._bindings[frame_id]
+        if name_id not in bindings:
+            self._size += 1
+        bindings[name_id] = encoded
+        return _BIND_HEAD.pack(opcode, frame_id, name_id) + encoded
+
+    def _step(self, record):
+        self._steps.append(self.file.tell())
+        self.file.write(record)
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= max(MIN_CHECKPOINT_INTERVAL, self._size):
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """Write out records recreating the whole model as of now."""
+        self._checkpoints.append(len(self._steps))
+        self._checkpoints.append(self.file.tell())
+        self.file.write(b"".join(self._creations))
+        for frame_id, bindings in self._bindings.items():
+            for name_id, encoded in bindings.items():
+                self.file.write(_BIND_HEAD.pack(BIND, frame_id, name_id))
+                self.file.write(encoded)
+        self.file.write(b"".join(self._exited))
+        self.file.write(bytes((END,)))
+        self._since_checkpoint = 0
+
+
+class TraceState(object):
+    """The environment model rebuilt from a trace.  Bound Values hold the
+    text that was displayed for the value rather than the object itself (its
+    brief, see brief.py, as long as it gets when expanded).
+    """
+
+    def __init__(self):
+        self.objects = {} # id -> model Frame or Function, in creation order
+        self.exited = set()
+
+    @property
+    def frames(self):
+        return [obj for obj in self.objects.values()
+                if isinstance(obj, model.Frame)]
+
+    def replay(self, renderer):
+        """Tell a renderer about everything in this state, as if it had been
+        there while the program ran.
+        """
+        for obj in self.objects.values():
+            if isinstance(obj, model.Frame):
+                renderer.frame_created(obj)
+            else:
+                renderer.function_created(obj)
+        for frame in self.frames:
+            for name, value in frame.bindings.items():
+                renderer.binding_added(frame, name, value)
+        for obj_id in self.exited:
+            renderer.frame_exited(self.objects[obj_id])
+
+
+class TraceReader(object):
+    """Random access to the steps in a trace file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} isn't a version {1} EnvDraw trace".format(
+                path, VERSION))
+        (strings_offset, self._steps_offset, self._num_steps,
+         checkpoints_offset, num_checkpoints, magic) = \
+                _TRAILER.unpack_from(self.buffer,
+                                     len(self.buffer) - _TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError("{0} is truncated".format(path))
+        self.strings = self._read_strings(strings_offset)
+        checkpoints = array("Q")
+        checkpoints.frombytes(self.buffer[checkpoints_offset:
+                                          checkpoints_offset +
+                                          16 * num_checkpoints])
+        self._checkpoint_steps = checkpoints[0::2]
+        self._checkpoint_offsets = checkpoints[1::2]
+
+    def __len__(self):
+        return self._num_steps
+
+    def close(self):
+        self.buffer.close()
+
+    def state_at(self, step):
+        """Rebuild the model as it was after the first `step` steps."""
+        if not 0 <= step <= len(self):
+            raise IndexError("step {0} is out of range".format(step))
+        state = TraceState()
+        start = 0
+        i = bisect_right(self._checkpoint_steps, step) - 1
+        if i >= 0:
+            start = self._checkpoint_steps[i]
+            offset = self._checkpoint_offsets[i]
+            while self.buffer[offset] != END:
+                offset = self._apply(state, offset)
+        for n in range(start, step):
+            self._apply(state, self._step_offset(n))
+        return state
+
+    def _step_offset(self, n):
+        return struct.unpack_from("<Q", self.buffer,
+                                  self._steps_offset + 8 * n)[0]
+
+    def _read_strings(self, offset):
+        count, = _U32.unpack_from(self.buffer, offset)
+        offset += _U32.size
+        strings = []
+        for _ in range(count):
+            length, = _U32.unpack_from(self.buffer, offset)
+            offset += _U32.size
+            strings.append(self.buffer[offset:offset + length].decode("utf-8"))
+            offset += length
+        return strings
+
+    def _apply(self, state, offset):
+        """Apply the record at offset to the state, returning the offset of
+        the next record.
+        """
+        buf, objects = self.buffer, state.objects
+        opcode = buf[offset]
+        if opcode == FRAME:
+            _, frame_id, parent, function, depth, sampled = \
+                    _FRAME.unpack_from(buf, offset)
+            objects[frame_id] = model.Frame(objects.get(parent),
+                                            objects.get(function), depth,
+                                            bool(sampled))
+            return offset + _FRAME.size
+        if opcode == FUNCTION:
+            _, function_id, parent, name, nargs = \
+                    _FUNCTION.unpack_from(buf, offset)
+            offset += _FUNCTION.size
+            args = struct.unpack_from("<{0}I".format(nargs), buf, offset)
+            objects[function_id] = model.Function(
+                self.strings[name], [self.strings[arg] for arg in args],
+                objects[parent])
+            return offset + _U32.size * nargs
+        if opcode in (BIND, REBIND):
+            _, frame_id, name, kind, n = _BIND.unpack_from(buf, offset)
+            offset += _BIND.size
+            if kind == FUNCTION_VALUE:
+                value = objects[n]
+            else:
+                value = model.Value(buf[offset:offset + n].decode("utf-8"))
+                offset += n
+            objects[frame_id].bindings[self.strings[name]] = value
+            return offset
+        if opcode == EXIT:
+            _, frame_id = _EXIT.unpack_from(buf, offset)
+            state.exited.add(frame_id)
+            return offset + _EXIT.size
+        raise ValueError("Bad record at offset {0}".format(offset))
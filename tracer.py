@@ -0,0 +1,211 @@
+"""tracer.py
+
+Interpreter-level tracing backends for EnvDraw.
+
+Instead of rewriting every function body to call funccall and funcreturn, a
+tracer asks the interpreter for call and return events and feeds them to the
+same Tracker.enter_function/exit_function API.  Function definitions still go
+through the funcdef hook, since that's where the Tracker learns about the
+functions (and their FunctionRegistry entries) it should care about.
+
+Two backends are provided:
+    - MonitoringTracer uses sys.monitoring (PEP 669, Python 3.12+), which
+      lets us switch events off entirely for code we aren't interested in.
+    - SetTraceTracer uses sys.settrace, which is available everywhere but
+      costs a Python-level call for every function call in the program.
+"""
+
+import sys
+from opcode import opmap
+
+# CO_GENERATOR | CO_COROUTINE | CO_ASYNC_GENERATOR (importing inspect for
+# them would cost more than the rest of the tracer).
+GENERATOR_FLAGS = 0x20 | 0x80 | 0x200
+_YIELD_VALUE = opmap['YIELD_VALUE']
+
+
+class Tracer(object):
+    """Base class for tracing backends.  Use as a context manager around the
+    execution of the instrumented program.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def start(self):
+        raise NotImplementedError()
+
+    def stop(self):
+        raise NotImplementedError()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class SetTraceTracer(Tracer):
+    """Tracing backend built on sys.settrace."""
+
+    def start(self):
+        self._old_trace = sys.gettrace()
+        sys.settrace(self._trace_call)
+
+    def stop(self):
+        sys.settrace(self._old_trace)
+
+    def _trace_call(self, py_fr, event, arg):
+        """Global trace function, only ever called with 'call' events."""
+        if py_fr.f_trace is not None:
+            # A generator carrying on after a yield, still in the same frame.
+            if not self.tracker.paused:
+                self.tracker.resume_function(py_fr)
+            return py_fr.f_trace
+        if self.tracker.paused:
+            # Called by the Tracker itself (a __repr__, say).
+            return None
+        fn = self.tracker.registry.lookup(py_fr)
+        if fn is None:
+            return None
+        # We only need the return event, don't pay for every line.
+        py_fr.f_trace_lines = False
+        tracker = self.tracker
+        if tracker.sampler is None or tracker.sample_call():
+            tracker.enter_function(fn, py_fr)
+        # Else the sampler left the call out, unless it ends up recorded
+        # after all (see Tracker.record_late).
+        raised_at = None
+        exited = False
+
+        def trace_return(py_fr, event, arg):
+            nonlocal raised_at, exited
+            if event == 'exception':
+                raised_at = py_fr.f_lasti
+            elif event != 'return' or exited:
+                pass
+            elif _yielding(py_fr, raised_at):
+                tracker.suspend_function(py_fr)
+            elif tracker.sampler is None or tracker.sample_return():
+                exited = True
+                tracker.exit_function(py_fr)
+            return trace_return
+        return trace_return
+
+
+def _yielding(py_fr, raised_at):
+    """Is a 'return' event from the given frame really a generator yielding?
+    Only yields return from a YIELD_VALUE, except for an exception leaving
+    the generator there.
+    """
+    return (py_fr.f_code.co_flags & GENERATOR_FLAGS and
+            py_fr.f_code.co_code[py_fr.f_lasti] == _YIELD_VALUE and
+            py_fr.f_lasti != raised_at)
+
+
+class MonitoringTracer(Tracer):
+    """Tracing backend built on sys.monitoring.
+
+    Code objects which aren't in the Tracker's registry the first time they
+    start or return have those events disabled, so untraced code (including
+    everything outside the instrumented program) runs at close to full speed
+    afterwards.  Generators get PY_YIELD and PY_RESUME (or PY_THROW) every
+    time they leave their frame and come back to it.
+    """
+
+    name = "envdraw"
+
+    def start(self):
+        mon = sys.monitoring
+        events = mon.events
+        self.tool_id = mon.PROFILER_ID
+        mon.use_tool_id(self.tool_id, self.name)
+        callbacks = self._callbacks()
+        for event, callback in callbacks.items():
+            mon.register_callback(self.tool_id, event, callback)
+        mon.set_events(self.tool_id,
+                       events.PY_START | events.PY_RETURN | events.PY_UNWIND |
+                       events.PY_YIELD | events.PY_RESUME | events.PY_THROW)
+
+    def stop(self):
+        mon = sys.monitoring
+        mon.set_events(self.tool_id, mon.events.NO_EVENTS)
+        for event in self._callbacks():
+            mon.register_callback(self.tool_id, event, None)
+        mon.free_tool_id(self.tool_id)
+
+    def _callbacks(self):
+        events = sys.monitoring.events
+        return {events.PY_START: self._on_start,
+                events.PY_RETURN: self._on_return,
+                events.PY_UNWIND: self._on_unwind,
+                events.PY_YIELD: self._on_yield,
+                events.PY_RESUME: self._on_resume,
+                events.PY_THROW: self._on_resume}
+
+    def _on_start(self, code, instruction_offset):
+        if self.tracker.paused:
+            # Called by the Tracker itself (a __repr__, say).  The code may
+            # well be called by the program too, so it isn't disabled.
+            return
+        fn = self.tracker.registry.lookup(sys._getframe(1))
+        if fn is None:
+            return sys.monitoring.DISABLE
+        if self.tracker.sampler is None or self.tracker.sample_call():
+            self.tracker.enter_function(fn, sys._getframe(1))
+
+    def _on_return(self, code, instruction_offset, retval):
+        if self.tracker.paused:
+            return
+        py_fr = sys._getframe(1)
+        fn = self.tracker.registry.lookup(py_fr)
+        if fn is None:
+            return sys.monitoring.DISABLE
+        if self.tracker.sampler is None or self.tracker.sample_return():
+            self.tracker.exit_function(py_fr)
+
+    def _on_yield(self, code, instruction_offset, retval):
+        if self.tracker.paused:
+            return
+        py_fr = sys._getframe(1)
+        if self.tracker.registry.lookup(py_fr) is None:
+            return sys.monitoring.DISABLE
+        self.tracker.suspend_function(py_fr)
+
+    def _on_resume(self, code, instruction_offset, *exception):
+        # PY_THROW (which comes with the exception) can't be disabled per
+        # code object.
+        if self.tracker.paused:
+            return
+        py_fr = sys._getframe(1)
+        if self.tracker.registry.lookup(py_fr) is None:
+            return None if exception else sys.monitoring.DISABLE
+        self.tracker.resume_function(py_fr)
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        # PY_UNWIND can't be disabled per code object, so just ignore frames
+        # we aren't tracking.
+        if self.tracker.paused:
+            return
+        py_fr = sys._getframe(1)
+        fn = self.tracker.registry.lookup(py_fr)
+        if fn is not None and (self.tracker.sampler is None or
+                               self.tracker.sample_return()):
+            self.tracker.exit_function(py_fr)
+
+
+def get_tracer(backend, tracker):
+    """Make the tracer for the named backend, or None for the "ast" backend
+    (which uses the funccall/funcreturn hooks instead).  Asking for
+    "monitoring" on a Python without sys.monitoring falls back to settrace.
+    """
+    if backend == "ast":
+        return None
+    if backend == "monitoring":
+        if hasattr(sys, "monitoring"):
+            return MonitoringTracer(tracker)
+        return SetTraceTracer(tracker)
+    if backend == "settrace":
+        return SetTraceTracer(tracker)
+    raise ValueError("Unknown tracing backend: {0}".format(backend))
@@ -0,0 +1,367 @@
+"""vectorcanvas.py
+
+A stand-in for tk.Canvas which doesn't need Tk (or a display) at all, for
+writing diagrams straight to SVG or PostScript files.
+
+The GUI elements in components.py only use a small part of the Tk canvas API
+(creating items, moving them around by tag, and asking where they are), so
+anything implementing that part can be drawn on.  A VectorCanvas keeps its
+items in creation (stacking) order, along with an index of the items with
+each tag so finding them doesn't mean looking at every item, and save()
+streams them out in a single pass.
+
+Tk works out where text is from the font it's drawn in, which we don't have,
+so text is measured with a fixed width per character.  That's close enough to
+lay the diagram out the same way.
+"""
+
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+CHAR_WIDTH = 7
+LINE_HEIGHT = 14
+FONT_SIZE = 11
+MARGIN = 20
+
+COLORS = {"white": (1, 1, 1), "black": (0, 0, 0)}
+
+
+class Item(object):
+
+    def __init__(self, kind, coords, tags, options):
+        self.kind = kind
+        self.coords = coords
+        self.tags = tags
+        self.options = options
+
+    @property
+    def hidden(self):
+        return self.options.get("state") == "hidden"
+
+    @property
+    def bbox(self):
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        if self.kind != "text":
+            return min(xs), min(ys), max(xs), max(ys)
+        x, y = xs[0], ys[0]
+        lines = str(self.options.get("text", "")).split("\n")
+        width = CHAR_WIDTH * max(len(line) for line in lines)
+        height = LINE_HEIGHT * len(lines)
+        anchor = self.options.get("anchor", "center")
+        if "w" in anchor:
+            x1 = x
+        elif "e" in anchor:
+            x1 = x - width
+        else:
+            x1 = x - width / 2
+        if "n" in anchor:
+            y1 = y
+        elif "s" in anchor:
+            y1 = y - height
+        else:
+            y1 = y - height / 2
+        return x1, y1, x1 + width, y1 + height
+
+
+class VectorCanvas(object):
+    """Just enough of tk.Canvas to draw an environment diagram on."""
+
+    def __init__(self):
+        self.items = {} # Item id -> Item, in creation order
+        self.tagged = {} # Tag -> ids of the items with it, in creation order
+        self._next_id = 1
+        self._idle = {}
+        self._next_idle = 0
+
+    # Creating items
+
+    def _create(self, kind, coords, options):
+        if len(coords) == 1:
+            coords = coords[0]
+        tags = options.pop("tag", options.pop("tags", ()))
+        if isinstance(tags, str):
+            tags = tags.split()
+        item_id = self._next_id
+        self._next_id += 1
+        self.items[item_id] = Item(kind, [float(c) for c in coords],
+                                   set(tags), options)
+        for tag in tags:
+            self.tagged.setdefault(tag, {})[item_id] = None
+        return item_id
+
+    def create_rectangle(self, *coords, **options):
+        return self._create("rectangle", coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self._create("oval", coords, options)
+
+    def create_line(self, *coords, **options):
+        return self._create("line", coords, options)
+
+    def create_polygon(self, *coords, **options):
+        return self._create("polygon", coords, options)
+
+    def create_text(self, *coords, **options):
+        return self._create("text", coords, options)
+
+    # Finding and changing items
+
+    def find_withtag(self, tag):
+        if tag == "all":
+            return tuple(self.items)
+        if isinstance(tag, int):
+            return (tag,) if tag in self.items else ()
+        return tuple(self.tagged.get(tag, ()))
+
+    def coords(self, tag, *coords):
+        found = self.find_withtag(tag)
+        if not found:
+            return []
+        item = self.items[found[0]]
+        if not coords:
+            return list(item.coords)
+        if len(coords) == 1:
+            coords = coords[0]
+        item.coords = [float(c) for c in coords]
+
+    def move(self, tag, dx, dy):
+        for item_id in self.find_withtag(tag):
+            item = self.items[item_id]
+            item.coords = [c + (dx if i % 2 == 0 else dy)
+                           for i, c in enumerate(item.coords)]
+
+    def bbox(self, tag):
+        boxes = [self.items[item_id].bbox
+                 for item_id in self.find_withtag(tag)]
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def find_overlapping(self, x1, y1, x2, y2):
+        found = []
+        for item_id, item in self.items.items():
+            if item.hidden:
+                continue
+            bx1, by1, bx2, by2 = item.bbox
+            if bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2:
+                found.append(item_id)
+        return tuple(found)
+
+    def itemconfig(self, tag, **options):
+        tags = options.pop("tag", options.pop("tags", None))
+        for item_id in self.find_withtag(tag):
+            self.items[item_id].options.update(options)
+            if tags is not None:
+                self._retag(item_id, tags)
+
+    itemconfigure = itemconfig
+
+    def _retag(self, item_id, tags):
+        if isinstance(tags, str):
+            tags = tags.split()
+        self._untag(item_id)
+        self.items[item_id].tags = set(tags)
+        for tag in tags:
+            self.tagged.setdefault(tag, {})[item_id] = None
+
+    def _untag(self, item_id):
+        for item_tag in self.items[item_id].tags:
+            del self.tagged[item_tag][item_id]
+            if not self.tagged[item_tag]:
+                del self.tagged[item_tag]
+
+    def tag_raise(self, tag):
+        """Move items to the top of the stacking order (which is also the
+        order they're found in by tag).
+        """
+        for item_id in self.find_withtag(tag):
+            self.items[item_id] = self.items.pop(item_id)
+            for item_tag in self.items[item_id].tags:
+                tagged = self.tagged[item_tag]
+                tagged[item_id] = tagged.pop(item_id)
+
+    def delete(self, *tags):
+        for tag in tags:
+            for item_id in self.find_withtag(tag):
+                self._untag(item_id)
+                del self.items[item_id]
+
+    def tag_bind(self, tag, sequence, func):
+        """Nobody's going to click on a file."""
+        pass
+
+    def configure(self, **options):
+        """Nor scroll one, and the image is as big as the drawing anyway."""
+        pass
+
+    # Idle callbacks, which are run by update_idletasks (and before saving)
+
+    def after_idle(self, func, *args):
+        self._next_idle += 1
+        self._idle[self._next_idle] = (func, args)
+        return self._next_idle
+
+    def after_cancel(self, callback_id):
+        self._idle.pop(callback_id, None)
+
+    def update_idletasks(self):
+        while self._idle:
+            callback_id = next(iter(self._idle))
+            func, args = self._idle.pop(callback_id)
+            func(*args)
+
+    # Output
+
+    def save(self, path):
+        """Write the drawing to path, as PostScript if it ends in .ps or .eps
+        and as SVG otherwise.
+        """
+        self.update_idletasks()
+        ext = os.path.splitext(path)[1].lower()
+        with open(path, "w") as out:
+            if ext in (".ps", ".eps"):
+                self.write_postscript(out)
+            else:
+                self.write_svg(out)
+
+    def _extent(self):
+        boxes = [item.bbox for item in self.items.values()
+                 if not item.hidden]
+        if not boxes:
+            return 0, 0, 0, 0
+        return (min(b[0] for b in boxes) - MARGIN,
+                min(b[1] for b in boxes) - MARGIN,
+                max(b[2] for b in boxes) + MARGIN,
+                max(b[3] for b in boxes) + MARGIN)
+
+    def write_svg(self, out):
+        x1, y1, x2, y2 = self._extent()
+        out.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                  'width="{0:g}" height="{1:g}" viewBox="{2:g} {3:g} {0:g} '
+                  '{1:g}" font-family="sans-serif" font-size="{4}">\n'
+                  .format(x2 - x1, y2 - y1, x1, y1, FONT_SIZE))
+        for item in self.items.values():
+            if item.hidden:
+                continue
+            out.write(_svg_item(item))
+            out.write("\n")
+        out.write("</svg>\n")
+
+    def write_postscript(self, out):
+        x1, y1, x2, y2 = self._extent()
+        out.write("%!PS-Adobe-3.0 EPSF-3.0\n")
+        out.write("%%BoundingBox: 0 0 {0} {1}\n".format(
+            int(x2 - x1 + 1), int(y2 - y1 + 1)))
+        # PostScript's y axis points up, the canvas's down.
+        out.write("{0:g} {1:g} translate 1 -1 scale\n".format(-x1, y2))
+        out.write("/Helvetica findfont [{0} 0 0 -{0} 0 0] makefont setfont\n"
+                  .format(FONT_SIZE))
+        out.write("1 setlinewidth\n")
+        for item in self.items.values():
+            if item.hidden:
+                continue
+            out.write(_postscript_item(item))
+        out.write("showpage\n%%EOF\n")
+
+
+# Tk's defaults: polygons are filled black with no outline, everything else
+# is outlined (or drawn) black and left empty.
+def _fill(item):
+    default = "black" if item.kind in ("polygon", "text") else ""
+    return item.options.get("fill", default)
+
+
+def _outline(item):
+    if item.kind == "line":
+        return item.options.get("fill", "black")
+    default = "" if item.kind == "polygon" else "black"
+    return item.options.get("outline", default)
+
+
+def _svg_item(item):
+    c = item.coords
+    if item.kind == "text":
+        anchor = item.options.get("anchor", "center")
+        text_anchor = "start" if "w" in anchor else \
+                "end" if "e" in anchor else "middle"
+        baseline = "hanging" if "n" in anchor else \
+                "text-after-edge" if "s" in anchor else "central"
+        return '<text x="{0:g}" y="{1:g}" text-anchor="{2}" ' \
+                'dominant-baseline="{3}" fill={4}>{5}</text>'.format(
+                    c[0], c[1], text_anchor, baseline,
+                    quoteattr(_fill(item) or "black"),
+                    escape(str(item.options.get("text", ""))))
+    style = ' fill={0} stroke={1}'.format(quoteattr(_fill(item) or "none"),
+                                          quoteattr(_outline(item) or "none"))
+    if item.options.get("dash"):
+        style += ' stroke-dasharray="{0}"'.format(
+            " ".join(str(d) for d in item.options["dash"]))
+    if item.kind == "rectangle":
+        return '<rect x="{0:g}" y="{1:g}" width="{2:g}" height="{3:g}"{4}/>' \
+                .format(min(c[0], c[2]), min(c[1], c[3]), abs(c[2] - c[0]),
+                        abs(c[3] - c[1]), style)
+    if item.kind == "oval":
+        return '<ellipse cx="{0:g}" cy="{1:g}" rx="{2:g}" ry="{3:g}"{4}/>' \
+                .format((c[0] + c[2]) / 2, (c[1] + c[3]) / 2,
+                        abs(c[2] - c[0]) / 2, abs(c[3] - c[1]) / 2, style)
+    points = " ".join("{0:g},{1:g}".format(x, y)
+                      for x, y in zip(c[0::2], c[1::2]))
+    if item.kind == "line":
+        return '<polyline points="{0}" fill="none" stroke={1}/>'.format(
+            points, quoteattr(_outline(item) or "none"))
+    return '<polygon points="{0}"{1}/>'.format(points, style)
+
+
+def _ps_color(color):
+    if color.startswith("#") and len(color) == 7:
+        rgb = [int(color[i:i + 2], 16) / 255 for i in (1, 3, 5)]
+    else:
+        rgb = COLORS.get(color, (0, 0, 0))
+    return "{0:g} {1:g} {2:g} setrgbcolor".format(*rgb)
+
+
+def _ps_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(") \
+            .replace(")", "\\)") + ")"
+
+
+def _postscript_item(item):
+    c = item.coords
+    if item.kind == "text":
+        anchor = item.options.get("anchor", "center")
+        x1, y1, _, _ = item.bbox
+        lines = []
+        text = str(item.options.get("text", ""))
+        for i, line in enumerate(text.split("\n")):
+            # Text is measured by CHAR_WIDTH, so line it up by hand rather
+            # than by the real width of the string.
+            lines.append("{0:g} {1:g} moveto {2} show".format(
+                x1, y1 + (i + 0.8) * LINE_HEIGHT, _ps_string(line)))
+        return "{0}\n{1}\n".format(_ps_color(_fill(item) or "black"),
+                                   "\n".join(lines))
+    if item.kind == "rectangle":
+        path = "{0:g} {1:g} moveto {2:g} {1:g} lineto {2:g} {3:g} lineto " \
+                "{0:g} {3:g} lineto closepath".format(*c[0:4])
+    elif item.kind == "oval":
+        path = "matrix currentmatrix {0:g} {1:g} translate {2:g} {3:g} " \
+                "scale 0 0 1 0 360 arc closepath setmatrix".format(
+                    (c[0] + c[2]) / 2, (c[1] + c[3]) / 2,
+                    max(abs(c[2] - c[0]) / 2, 0.01),
+                    max(abs(c[3] - c[1]) / 2, 0.01))
+    else:
+        points = list(zip(c[0::2], c[1::2]))
+        path = "{0:g} {1:g} moveto ".format(*points[0]) + " ".join(
+            "{0:g} {1:g} lineto".format(x, y) for x, y in points[1:])
+        if item.kind == "polygon":
+            path += " closepath"
+    result = []
+    if item.kind != "line" and _fill(item):
+        result.append("newpath {0} {1} fill".format(path,
+                                                    _ps_color(_fill(item))))
+    if _outline(item):
+        dash = item.options.get("dash")
+        result.append("newpath {0} {1} [{2}] 0 setdash stroke".format(
+            path, _ps_color(_outline(item)),
+            " ".join(str(d) for d in dash) if dash else ""))
+    return "".join(line + "\n" for line in result)